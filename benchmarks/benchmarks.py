@@ -0,0 +1,493 @@
+# Standard imports
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Event
+from typing import Callable, Optional
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+# Third-party imports
+
+
+# Local imports
+from hardware.backends import select_backend
+from mqtt.local_broker import LocalBroker
+from rs485.framing import FrameParser, RS485Packet
+import config
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    iterations: int
+    # Best of the repeats, as background noise can only make a run slower
+    per_op_us: float
+    mean_per_op_us: float
+    # Latency percentiles, for benchmarks measuring single events
+    percentiles_us: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def score_us(self) -> float:
+        """
+        Value compared between runs, lower is better
+        """
+        return self.percentiles_us.get("p50", self.per_op_us)
+
+
+def measure(
+    name: str,
+    func: Callable[[], None],
+    iterations: int,
+    repeats: int = 5,
+    setup: Optional[Callable[[], None]] = None,
+) -> BenchmarkResult:
+    """
+    Times repeats runs of calling func iterations times. setup is called
+    before each run, untimed
+    """
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        times.append(time.perf_counter() - start)
+    return BenchmarkResult(
+        name=name,
+        iterations=iterations,
+        per_op_us=1e6 * min(times) / iterations,
+        mean_per_op_us=1e6 * sum(times) / len(times) / iterations,
+    )
+
+
+def latency(name: str, samples_s: list[float]) -> BenchmarkResult:
+    samples = sorted(samples_s)
+
+    def percentile(p: float) -> float:
+        return 1e6 * samples[round(p * (len(samples) - 1))]
+
+    return BenchmarkResult(
+        name=name,
+        iterations=len(samples),
+        per_op_us=1e6 * samples[0],
+        mean_per_op_us=1e6 * sum(samples) / len(samples),
+        percentiles_us={
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": percentile(1),
+        },
+    )
+
+
+class Environment:
+    """
+    Fake hardware, an in-process MQTT broker and a temporary log folder
+    for the benchmarks. config is changed to point at them, so this must
+    be created before anything imports warning_handler
+    """
+
+    def __init__(self):
+        self.backend = select_backend("simulation")
+        self.broker = LocalBroker()
+        self.broker.start_in_thread()
+        self.log_folder = tempfile.TemporaryDirectory(prefix="pnt-bench-")
+        config.MQTT_BROKER_IP_ADDRESS = self.broker.host
+        config.MQTT_BROKER_PORT = self.broker.port
+        config.LOG_FOLDER_NAME = self.log_folder.name
+
+    def close(self) -> None:
+        self.broker.stop_thread()
+        self.log_folder.cleanup()
+
+
+def _warning_handler():
+    from warning_handler.warning_handler import WarningHandler
+
+    handler = WarningHandler()
+    handler.initialise()
+    deadline = time.monotonic() + 5
+    while not handler.mqtt.mqtt_connected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return handler
+
+
+def _drain(handler) -> None:
+    # The handler hears its own broadcasts back. Nothing ticks it here so
+    # don't let them pile up between runs
+    while not handler.mqtt.message_queue.empty():
+        handler.mqtt.message_queue.get_nowait()
+
+
+def bench_warning_handler_emit(quick: bool) -> list[BenchmarkResult]:
+    """
+    WarningHandler.emit() for local messages of each level, connected to
+    the broker, and handling a warning relayed from another node. Storm
+    suppression is off for these so every copy is handled in full, then
+    on for a repeated warning
+    """
+    handler = _warning_handler()
+    iterations = 500 if quick else 5000
+    results = []
+    window_s = handler.storms.window_s
+    handler.storms.window_s = 0
+    try:
+        for name, level, message in [
+            ("info", logging.INFO, "Benchmark info"),
+            ("warning", logging.WARNING, "Benchmark warning"),
+            ("error", logging.ERROR, "Benchmark error"),
+        ]:
+            record = logging.LogRecord(
+                "benchmark", level, __file__, 0, message, None, None
+            )
+            results.append(
+                measure(
+                    f"warning_handler.emit.{name}",
+                    lambda: handler.emit(record),
+                    iterations,
+                    setup=lambda: _drain(handler),
+                )
+            )
+        relayed = {
+            "mac_address": "02:00:00:00:00:01",
+            "node_name": "Benchmark node",
+            "category": "benchmark",
+            "message": "Relayed warning",
+            "level": "warning",
+        }
+        results.append(
+            measure(
+                "warning_handler.relay.warning",
+                lambda: handler.rx_warnings(relayed),
+                iterations,
+            )
+        )
+        handler.storms.window_s = window_s or 10
+        record = logging.LogRecord(
+            "benchmark", logging.WARNING, __file__, 0, "Repeat", None, None
+        )
+        results.append(
+            measure(
+                "warning_handler.emit.repeat",
+                lambda: handler.emit(record),
+                iterations,
+            )
+        )
+    finally:
+        handler.mqtt.__exit__()
+        handler.close()
+    return results
+
+
+def bench_mqtt_dispatch(quick: bool) -> list[BenchmarkResult]:
+    """
+    MqttHandler.message_handler(): topic matching, JSON decoding and
+    calling the callback
+    """
+    from paho.mqtt.client import MQTTMessage
+
+    from mqtt.mqtt_handler import MqttHandler
+
+    mqtt = MqttHandler(
+        config.MQTT_BROKER_IP_ADDRESS, config.MQTT_BROKER_PORT, "Benchmark"
+    )
+    for topic in [
+        "/status/warnings",
+        "/status/errors",
+        "/status/acknowledge",
+        "/status/discovery",
+        "/telemetry/+/sfp",
+        "/telemetry/#",
+    ]:
+        mqtt.register_callback(topic, lambda message_dict: None)
+    iterations = 1000 if quick else 20000
+    results = []
+    try:
+        for name, topic in [
+            ("exact", "/status/warnings"),
+            ("wildcard", "/telemetry/02:00:00:00:00:01/sfp"),
+        ]:
+            msg = MQTTMessage(topic=topic.encode("utf-8"))
+            msg.payload = json.dumps(
+                {
+                    "mac_address": "02:00:00:00:00:01",
+                    "node_name": "Benchmark node",
+                    "category": "benchmark",
+                    "message": "Benchmark warning",
+                    "time": datetime.now(tz=timezone.utc).isoformat(),
+                    "level": "warning",
+                }
+            ).encode("utf-8")
+            results.append(
+                measure(
+                    f"mqtt.message_handler.{name}",
+                    lambda: mqtt.message_handler(msg),
+                    iterations,
+                )
+            )
+    finally:
+        mqtt.__exit__()
+    return results
+
+
+def bench_sfp_tick(quick: bool) -> list[BenchmarkResult]:
+    """
+    SFPPrimary.tick() in each FSM state with a simulated module
+    """
+    from m0wut_drivers.gpio import GPIO
+
+    from sfp.primary import SFPPrimary
+    from simulation.gpio import FakeGPIO
+    from simulation.i2c import FakeSMBus
+    from simulation.sfp import FakeSFPModule
+
+    iterations = 500 if quick else 5000
+    results = []
+    for name, ddm_period_s in [("", 1), ("_ddm", 0)]:
+        bus = FakeSMBus()
+        module = FakeSFPModule(bus, config.I2C_SFP_ADDRESS)
+        present = FakeGPIO()
+        tx_fault = FakeGPIO()
+        sfp = SFPPrimary(
+            i2c_bus=bus,
+            i2c_addr=config.I2C_SFP_ADDRESS,
+            gpio_present=present,
+            gpio_tx_enable=FakeGPIO(direction=GPIO.OUTPUT),
+            gpio_tx_fault=tx_fault,
+            gpio_los=FakeGPIO(),
+            debounce_s=0,
+            ddm_period_s=ddm_period_s,
+        )
+        if not name:
+            results.append(
+                measure("sfp.tick.disconnected", sfp.tick, iterations)
+            )
+        module.insert()
+        present.set_level(True)
+        sfp.tick()
+        sfp.tick()
+        assert sfp.state == SFPPrimary.FSMState.ACTIVE
+        results.append(measure(f"sfp.tick.active{name}", sfp.tick, iterations))
+        if name:
+            continue
+
+        def query():
+            sfp.state = SFPPrimary.FSMState.QUERYING_SFP
+            sfp.tick()
+
+        results.append(measure("sfp.tick.querying_cached", query, iterations))
+        sfp.state = SFPPrimary.FSMState.INVALID_SFP
+        results.append(measure("sfp.tick.invalid", sfp.tick, iterations))
+        tx_fault.set_level(True)
+        sfp.state = SFPPrimary.FSMState.SFP_TX_FAULT
+        results.append(measure("sfp.tick.tx_fault", sfp.tick, iterations))
+    return results
+
+
+def bench_rs485_framing(quick: bool) -> list[BenchmarkResult]:
+    """
+    Encoding and parsing the frames MessageHandler sends and receives
+    """
+    iterations = 1000 if quick else 20000
+    results = []
+    for length in [0, 16, 255]:
+        packet = RS485Packet(1, 0x10, bytes(range(length)))
+        frame = packet.encode()
+        parser = FrameParser()
+        results.append(
+            measure(f"rs485.encode.{length}", packet.encode, iterations)
+        )
+        results.append(
+            measure(
+                f"rs485.parse.{length}",
+                lambda: parser.feed(frame),
+                iterations,
+            )
+        )
+        # As read from a UART a few bytes at a time
+        chunks = [frame[i:i + 8] for i in range(0, len(frame), 8)]
+
+        def parse_chunks():
+            for chunk in chunks:
+                parser.feed(chunk)
+
+        results.append(
+            measure(f"rs485.parse_chunked.{length}", parse_chunks, iterations)
+        )
+    return results
+
+
+def bench_notification_latency(quick: bool) -> list[BenchmarkResult]:
+    """
+    Time from a log call to another node receiving the notification
+    """
+    import paho.mqtt.client as mqtt
+    from paho.mqtt.enums import CallbackAPIVersion
+
+    handler = _warning_handler()
+    logger = logging.getLogger("benchmark.latency")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+
+    received = Event()
+    subscriber = mqtt.Client(CallbackAPIVersion.VERSION2)
+    subscriber.on_message = lambda *args: received.set()
+    subscriber.connect(config.MQTT_BROKER_IP_ADDRESS, config.MQTT_BROKER_PORT)
+    subscribed = Event()
+    subscriber.on_subscribe = lambda *args: subscribed.set()
+    subscriber.subscribe("/status/warnings")
+    subscriber.loop_start()
+    subscribed.wait(5)
+
+    samples = []
+    try:
+        for i in range(50 if quick else 500):
+            received.clear()
+            start = time.perf_counter()
+            logger.warning(f"Latency {i}")
+            if received.wait(1):
+                samples.append(time.perf_counter() - start)
+            _drain(handler)
+    finally:
+        subscriber.loop_stop()
+        logger.removeHandler(handler)
+        handler.mqtt.__exit__()
+        handler.close()
+    return [latency("notification.log_to_mqtt", samples)] if samples else []
+
+
+BENCHMARKS: dict[str, Callable[[bool], list[BenchmarkResult]]] = {
+    "warning_handler_emit": bench_warning_handler_emit,
+    "mqtt_dispatch": bench_mqtt_dispatch,
+    "sfp_tick": bench_sfp_tick,
+    "rs485_framing": bench_rs485_framing,
+    "notification_latency": bench_notification_latency,
+}
+
+
+# Default location for results, ignored by git
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names: list[str], quick: bool = False) -> dict:
+    environment = Environment()
+    results = []
+    try:
+        for name in names:
+            results += BENCHMARKS[name](quick)
+    finally:
+        environment.close()
+    return {
+        "commit": _git_commit(),
+        "time": datetime.now(tz=timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "quick": quick,
+        "results": [asdict(x) for x in results],
+    }
+
+
+def compare(old: dict, new: dict, threshold: float) -> list[str]:
+    """
+    Prints the change in each benchmark between two runs. Returns the
+    names of those more than threshold (fractional) slower
+    """
+    old_results = {
+        x["name"]: BenchmarkResult(**x) for x in old["results"]
+    }
+    regressions = []
+    print(f"{'Benchmark':<40} {'Old us':>10} {'New us':>10} {'Change':>8}")
+    for x in new["results"]:
+        result = BenchmarkResult(**x)
+        previous = old_results.get(result.name)
+        if previous is None:
+            continue
+        change = result.score_us / previous.score_us - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(result.name)
+            flag = " REGRESSION"
+        print(
+            f"{result.name:<40} {previous.score_us:>10.2f} "
+            f"{result.score_us:>10.2f} {change:>+8.1%}{flag}"
+        )
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the main loop's hot paths on simulated "
+        "hardware and saves the results as JSON"
+    )
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"Benchmarks to run, all by default: {', '.join(BENCHMARKS)}",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help=(
+            "Results file, benchmarks/results/benchmark-<commit>.json by "
+            "default"
+        ),
+    )
+    parser.add_argument(
+        "--compare", type=Path, help="Earlier results to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Fractional slow down counted as a regression",
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="Fewer iterations, for CI"
+    )
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - BENCHMARKS.keys()
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    # Keep the benchmarked code's own logging out of the way
+    logging.basicConfig(level=logging.WARNING)
+    report = run(args.benchmarks or list(BENCHMARKS), quick=args.quick)
+    output = args.output
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = RESULTS_DIR / f"benchmark-{report['commit']}.json"
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+    if args.compare is not None:
+        old = json.loads(args.compare.read_text())
+        if compare(old, report, args.threshold):
+            sys.exit(1)
+    else:
+        for x in report["results"]:
+            print(f"{x['name']:<40} {BenchmarkResult(**x).score_us:>10.2f} us")
+
+
+if __name__ == "__main__":
+    main()
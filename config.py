@@ -1,43 +1,149 @@
 # Standard library imports
 from pathlib import Path
+from typing import Any, Callable
 
 # Third-party imports
-import smbus2
+
 
 # Local imports
-from m0wut_drivers.gpio import GPIO, RPiGPIO, Polarity
+from hardware.backends import HardwareBackend, get_backend
 
 
 # Node Name
 NODE_NAME = "Timing Reference - Primary"
 
+# Main loop task periods. Tasks can also be woken early by events
+SFP_TICK_PERIOD_S = 0.1
+MQTT_TICK_PERIOD_S = 0.1
+TIMING_TICK_PERIOD_S = 1
+
 # Logging config
 LOG_FOLDER_NAME = "log"
 LOG_FULL_NAME = "full_log.jsonl"
 LOG_WARNING_NAME = "warning_log.jsonl"
+LOG_FLUSH_INTERVAL_S = 1
+LOG_FLUSH_MAX_RECORDS = 100
+LOG_ROTATE_MAX_BYTES = 50 * 1024 * 1024
+LOG_ROTATE_MAX_AGE_S = 24 * 60 * 60
+LOG_RETENTION_SEGMENTS = 30
+# Also print warnings / errors relayed from other nodes through logging
+# (i.e. to stdout). They're stored and logged to file either way
+LOG_ECHO_RELAYED = False
+
+# Warnings / errors kept in memory per node. Max age of 0 keeps them
+# until acknowledged
+NOTIFICATION_RETENTION_PER_NODE = 100
+NOTIFICATION_MAX_AGE_S = 0
+# Repeats of a warning / error within this window of the first are only
+# counted, then stored and sent as one summary once it ends. 0 turns
+# this off. Max keys limits how many distinct notifications are tracked
+NOTIFICATION_STORM_WINDOW_S = 10
+NOTIFICATION_STORM_MAX_KEYS = 1000
 
 # MQTT Config
 MQTT_BROKER_IP_ADDRESS = "127.0.0.1"
 MQTT_BROKER_PORT = 1883
+# Address other nodes are told to reach this one on (e.g. auxiliaries
+# syncing time to the primary). None finds it from the network setup
+MQTT_ADVERTISE_IP_ADDRESS = None
+# Max received messages handled per main loop tick and the time they can
+# take, so a burst of messages can't starve everything else
+MQTT_TICK_MAX_MESSAGES = 50
+MQTT_TICK_TIME_BUDGET_S = 0.02
+# Time between attempts to reach the broker if it's not there at startup
+MQTT_RETRY_INTERVAL_S = 5
+
+# Metrics. A snapshot is published over MQTT every METRICS_PERIOD_S and
+# they're served for Prometheus on localhost
+METRICS_PERIOD_S = 10
+METRICS_HTTP_HOST = "127.0.0.1"
+METRICS_HTTP_PORT = 9108
+
+# Store-and-forward for broadcasts made while the broker is unreachable.
+# Kept in the log folder and replayed at a limited rate on reconnect
+OUTBOX_NAME = "outbox.jsonl"
+OUTBOX_BATCH_SIZE = 20
+OUTBOX_MAX_RATE_PER_S = 50
+OUTBOX_MAX_RECORDS = 10000
 
 # RS485 UART
 UART_RS485 = Path("/") / "dev" / "ttyAMA5"
-GPIO_RS485_TRX = RPiGPIO(23, GPIO.OUTPUT)
-
-# LEDS
-GPIO_COMMS_RED = RPiGPIO(9, GPIO.OUTPUT)
-GPIO_STATUS_RED = RPiGPIO(10, GPIO.OUTPUT)
-GPIO_STATUS_GREEN = RPiGPIO(11, GPIO.OUTPUT)
-GPIO_COMMS_GREEN = RPiGPIO(13, GPIO.OUTPUT)
+UART_RS485_BAUD = 115200
 
 # SFP
-I2C_SFP_BUS = smbus2.SMBus(4)
 I2C_SFP_ADDRESS = 0x50
-GPIO_SFP_PRESENT = RPiGPIO(19, polarity=Polarity.ACTIVE_LOW)
-GPIO_SFP_TX_FAULT = RPiGPIO(20)
-GPIO_SFP_LOS = RPiGPIO(21)
-GPIO_SFP_TX_ENABLE = RPiGPIO(26, GPIO.OUTPUT)
+# Present / LOS must be stable for this long before the FSM acts on them
+SFP_DEBOUNCE_S = 0.05
+# How often to read SFP diagnostics (temperature, power etc.)
+SFP_DDM_PERIOD_S = 1
+
+
+# Timing quality (primary reference only)
+GPSD_HOST = "127.0.0.1"
+GPSD_PORT = 2947
+# chrony polls the PPS every 2^3 s (see ansible/tasks/chrony.yml)
+CHRONY_POLL_PERIOD_S = 8
+# Samples kept for rolling statistics and Allan deviation
+TIMING_WINDOW = 1024
+GPS_MIN_SATELLITES = 4
+GPS_MAX_HDOP = 5
+TIMING_MAX_RMS_OFFSET_S = 1e-6
+# Holdover is how long until the time error could exceed this
+HOLDOVER_MAX_ERROR_S = 1e-6
+
+# Time sync (auxiliary reference only). Ready once chrony's last
+# AUX_SYNC_WINDOW offsets from the primary have settled within this
+AUX_SYNC_MAX_OFFSET_S = 100e-6
+AUX_SYNC_WINDOW = 8
+AUX_SYNC_MIN_SAMPLES = 4
+AUX_SYNC_POLL_PERIOD_S = 1
+
+
+def _i2c_sfp_bus(hw: HardwareBackend):
+    from i2c.i2c_bus import I2CBus
+
+    # Shared with other devices, so accessed through I2CBus for locking
+    # and block transfers
+    return I2CBus(hw.i2c_bus(4))
+
+
+# Hardware. Each is created by the selected backend (see
+# hardware.backends) the first time it's used, rather than on import, so
+# this module can be imported anywhere and startup only opens what's
+# actually needed
+_HARDWARE: dict[str, Callable[[HardwareBackend], Any]] = {
+    # RS485
+    "SERIAL_RS485": lambda hw: hw.serial_port(UART_RS485, UART_RS485_BAUD),
+    "GPIO_RS485_TRX": lambda hw: hw.gpio(23, output=True),
+    # LEDS
+    "GPIO_COMMS_RED": lambda hw: hw.gpio(9, output=True),
+    "GPIO_STATUS_RED": lambda hw: hw.gpio(10, output=True),
+    "GPIO_STATUS_GREEN": lambda hw: hw.gpio(11, output=True),
+    "GPIO_COMMS_GREEN": lambda hw: hw.gpio(13, output=True),
+    # SFP
+    "I2C_SFP_BUS": _i2c_sfp_bus,
+    "GPIO_SFP_PRESENT": lambda hw: hw.gpio(19, active_low=True),
+    "GPIO_SFP_TX_FAULT": lambda hw: hw.gpio(20),
+    "GPIO_SFP_LOS": lambda hw: hw.gpio(21),
+    "GPIO_SFP_TX_ENABLE": lambda hw: hw.gpio(26, output=True),
+    # Reference Clok
+    "REF_CLK_SELECT": lambda hw: hw.gpio(12, output=True),
+    # Card address EEPROM
+    "EEPROM": lambda hw: hw.eeprom(),
+    # Timing
+    "GPS_MONITOR": lambda hw: hw.gps_monitor(),
+    "GPSD": lambda hw: hw.gpsd(GPSD_HOST, GPSD_PORT),
+    "CHRONYC": lambda hw: hw.chronyc(),
+}
 
 
-# Reference Clok
-REF_CLK_SELECT = RPiGPIO(12, GPIO.OUTPUT)
+def __getattr__(name: str) -> Any:
+    # Only called for names not already in the module, so each piece of
+    # hardware is created once and then found directly
+    try:
+        factory = _HARDWARE[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__} has no attribute {name}")
+    value = factory(get_backend())
+    globals()[name] = value
+    return value
@@ -0,0 +1,200 @@
+# Standard imports
+from pathlib import Path
+from time import monotonic
+from typing import Callable, Optional
+import os
+
+# Third-party imports
+
+
+# Local imports
+
+
+class HardwareBackend:
+    """
+    Creates the hardware objects used by config. Drivers are imported when
+    something is first created, so nothing touches (or needs) the Pi's
+    hardware until it's used.
+    """
+
+    name: str = ""
+
+    def gpio(self, pin: int, output: bool = False, active_low: bool = False):
+        raise NotImplementedError
+
+    def i2c_bus(self, bus: int):
+        raise NotImplementedError
+
+    def serial_port(self, path: Path, baud: int, timeout: float = 0.2):
+        raise NotImplementedError
+
+    def eeprom(self):
+        raise NotImplementedError
+
+    def gps_monitor(self):
+        raise NotImplementedError
+
+    def gpsd(self, host: str, port: int):
+        raise NotImplementedError
+
+    def chronyc(self) -> Callable[[str], Optional[str]]:
+        raise NotImplementedError
+
+
+class PiBackend(HardwareBackend):
+    """
+    Inputs get edge events from the GPIO character device on chip_path
+    """
+
+    name = "pi"
+
+    def __init__(self, chip_path: str = "/dev/gpiochip0"):
+        self.chip_path = chip_path
+
+    def gpio(self, pin: int, output: bool = False, active_low: bool = False):
+        from m0wut_drivers.gpio import GPIO, Polarity, RPiGPIO
+        from hardware.gpio_edges import EdgeGPIO
+
+        args = (pin, GPIO.OUTPUT) if output else (pin,)
+        if active_low:
+            gpio = RPiGPIO(*args, polarity=Polarity.ACTIVE_LOW)
+        else:
+            gpio = RPiGPIO(*args)
+        if output:
+            return gpio
+        return EdgeGPIO(gpio, pin, self.chip_path)
+
+    def i2c_bus(self, bus: int):
+        import smbus2
+
+        return smbus2.SMBus(bus)
+
+    def serial_port(self, path: Path, baud: int, timeout: float = 0.2):
+        import serial
+
+        return serial.Serial(str(path), baud, timeout=timeout)
+
+    def eeprom(self):
+        from m0wut_drivers.ds2431 import DS2431
+
+        return DS2431()
+
+    def gps_monitor(self):
+        from m0wut_drivers.gps_monitor import GPSMonitor
+
+        return GPSMonitor()
+
+    def gpsd(self, host: str, port: int):
+        from timing.sources import GPSDClient
+
+        return GPSDClient(host, port)
+
+    def chronyc(self) -> Callable[[str], Optional[str]]:
+        from timing.sources import run_chronyc
+
+        return run_chronyc
+
+
+class SimulationBackend(HardwareBackend):
+    """
+    Fakes from the simulation package. Each I2C bus number gets one
+    FakeSMBus, and all serial ports are joined by one FakeRS485Bus, which
+    simulated devices can attach to. Everything created is kept so a
+    simulation can drive it, and time comes from clock so it can run on
+    virtual time
+    """
+
+    name = "simulation"
+
+    def __init__(self, clock: Callable[[], float] = monotonic):
+        from simulation.chrony import FakeChrony
+        from simulation.eeprom import FakeDS2431
+        from simulation.gps import FakeGPSD, FakeGPSMonitor
+        from simulation.rs485 import FakeRS485Bus
+
+        self.clock = clock
+        self.i2c_buses: dict = {}
+        self.gpios: dict = {}
+        self.rs485_bus = FakeRS485Bus()
+        self.fake_eeprom = FakeDS2431()
+        self.fake_gpsd = FakeGPSD(clock=clock)
+        self.fake_gps_monitor = FakeGPSMonitor(self.fake_gpsd)
+        self.fake_chrony = FakeChrony(
+            initial_offset_s=0, select_delay_s=0, clock=clock
+        )
+        self.fake_chrony("add server PPS")
+
+    def gpio(self, pin: int, output: bool = False, active_low: bool = False):
+        from m0wut_drivers.gpio import GPIO
+        from simulation.gpio import FakeGPIO
+
+        gpio = FakeGPIO(pin, GPIO.OUTPUT if output else GPIO.INPUT)
+        self.gpios[pin] = gpio
+        return gpio
+
+    def i2c_bus(self, bus: int):
+        from simulation.i2c import FakeSMBus
+
+        return self.i2c_buses.setdefault(bus, FakeSMBus())
+
+    def serial_port(self, path: Path, baud: int, timeout: float = 0.2):
+        return self.rs485_bus.port(timeout=timeout)
+
+    def eeprom(self):
+        return self.fake_eeprom
+
+    def gps_monitor(self):
+        return self.fake_gps_monitor
+
+    def gpsd(self, host: str, port: int):
+        return self.fake_gpsd
+
+    def chronyc(self) -> Callable[[str], Optional[str]]:
+        return self.fake_chrony
+
+
+# Name -> factory. The backend is picked by select_backend() or the
+# PNT_HARDWARE_BACKEND environment variable, "pi" by default
+BACKENDS: dict[str, Callable[[], HardwareBackend]] = {
+    PiBackend.name: PiBackend,
+    SimulationBackend.name: SimulationBackend,
+}
+_backend: Optional[HardwareBackend] = None
+
+
+def register_backend(name: str, factory: Callable[[], HardwareBackend]):
+    BACKENDS[name] = factory
+
+
+def select_backend(name: str) -> HardwareBackend:
+    """
+    Must be called before any hardware is created
+    """
+    global _backend
+    if _backend is not None and _backend.name != name:
+        raise RuntimeError(
+            f"Hardware already created using the {_backend.name} backend"
+        )
+    if _backend is None:
+        _backend = BACKENDS[name]()
+    return _backend
+
+
+def use_backend(backend: HardwareBackend) -> None:
+    """
+    Installs an already constructed backend, e.g. a SimulationBackend
+    running on virtual time. Must be called before any hardware is
+    created
+    """
+    global _backend
+    if _backend is not None and _backend is not backend:
+        raise RuntimeError(
+            f"Hardware already created using the {_backend.name} backend"
+        )
+    _backend = backend
+
+
+def get_backend() -> HardwareBackend:
+    if _backend is None:
+        return select_backend(os.environ.get("PNT_HARDWARE_BACKEND", "pi"))
+    return _backend
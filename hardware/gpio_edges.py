@@ -0,0 +1,100 @@
+# Standard imports
+from threading import Event, Thread
+from typing import Callable, Optional
+import logging
+
+# Third-party imports
+
+
+# Local imports
+
+
+class EdgeGPIO:
+    """
+    Adds edge events to a driver GPIO input, from the kernel's GPIO
+    character device through libgpiod (the gpiod package). Everything
+    else is passed straight through to the wrapped GPIO, which still does
+    the reading so its polarity applies.
+
+    The line is only requested for edge events when the first callback is
+    added, from then a daemon thread waits for events and calls every
+    callback with the line's level. add_edge_callback() raises OSError if
+    the line can't be requested (e.g. gpiod isn't installed or something
+    else has claimed it), so the caller can fall back to polling.
+    """
+
+    # How often the edge thread checks whether it's been closed
+    POLL_INTERVAL_S = 1
+
+    def __init__(
+        self,
+        gpio,
+        pin: int,
+        chip_path: str = "/dev/gpiochip0",
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.gpio = gpio
+        self.pin = pin
+        self.chip_path = chip_path
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.edge_callbacks: list[Callable[[bool], None]] = []
+        self._request = None
+        self._thread: Optional[Thread] = None
+        self._stop = Event()
+
+    def __getattr__(self, name: str):
+        # Only called for attributes not found on EdgeGPIO itself
+        return getattr(self.gpio, name)
+
+    def add_edge_callback(self, callback: Callable[[bool], None]) -> None:
+        """
+        callback(level) is called from the edge thread on every change
+        """
+        if self._thread is None:
+            self._start()
+        self.edge_callbacks.append(callback)
+
+    def _start(self) -> None:
+        try:
+            import gpiod
+            from gpiod.line import Edge
+        except ImportError as e:
+            raise OSError(f"gpiod isn't available: {e}")
+
+        self._request = gpiod.request_lines(
+            self.chip_path,
+            consumer="pnt",
+            config={self.pin: gpiod.LineSettings(edge_detection=Edge.BOTH)},
+        )
+        self._thread = Thread(
+            target=self._run, name=f"GPIO{self.pin} edges", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if not self._request.wait_edge_events(self.POLL_INTERVAL_S):
+                    continue
+                # Several edges in a row only need reporting once, the
+                # callbacks read the line for its current level
+                self._request.read_edge_events()
+                level = bool(self.gpio.read())
+                for callback in list(self.edge_callbacks):
+                    callback(level)
+            except Exception:
+                if self._stop.is_set():
+                    return
+                self.logger.exception(f"Waiting for GPIO {self.pin} edges")
+                self._stop.wait(self.POLL_INTERVAL_S)
+
+    def cleanup(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._request is not None:
+            self._request.release()
+            self._request = None
+        self.edge_callbacks.clear()
+        self.gpio.cleanup()
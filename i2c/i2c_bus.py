@@ -0,0 +1,296 @@
+# Standard imports
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import RLock
+from time import monotonic
+from typing import Callable, Iterable, Iterator, Optional
+import logging
+
+# Third-party imports
+from smbus2 import SMBus, i2c_msg
+
+# Local imports
+from metrics.metrics import REGISTRY, Histogram, MetricsRegistry
+
+
+@dataclass
+class I2CStats:
+    transactions: int = 0
+    errors: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    total_time_s: float = 0
+    max_time_s: float = 0
+
+    @property
+    def mean_time_s(self) -> float:
+        if self.transactions == 0:
+            return 0
+        return self.total_time_s / self.transactions
+
+
+class I2CBus:
+    """
+    Wraps an smbus2.SMBus (or anything with the same methods) so it can be
+    shared between threads and drivers. Every transaction holds a lock, and
+    its latency and whether it failed are recorded per device address.
+
+    The usual SMBus methods are passed straight through, so this can be
+    handed to drivers expecting an SMBus. Those without a wrapper here
+    (read_byte, write_word_data etc.) are still called under the lock and
+    counted against the address they're given, though without byte
+    counts. On top of those, read_block() reads any length with a single
+    I2C_RDWR transfer (no 32 byte SMBus limit) and read_ranges() /
+    read_registers() coalesce nearby register reads into as few block
+    transfers as possible.
+    """
+
+    def __init__(
+        self,
+        bus: SMBus,
+        max_block_length: int = 256,
+        max_gap: int = 8,
+        clock: Callable[[], float] = monotonic,
+        logger: Optional[logging.Logger] = None,
+        metrics: MetricsRegistry = REGISTRY,
+    ):
+        """
+        Ranges less than max_gap bytes apart are read as one transfer, as
+        clocking out a few unwanted bytes is quicker than the start,
+        address and register write of another transaction
+        """
+        self.bus = bus
+        self.max_block_length = max_block_length
+        self.max_gap = max_gap
+        self.clock = clock
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.stats: dict[int, I2CStats] = {}
+        self.metrics = metrics
+        self.latency: dict[int, Histogram] = {}
+        self.lock = RLock()
+        # Fall back to SMBus block reads for buses without I2C_RDWR
+        self.rdwr_supported: bool = hasattr(bus, "i2c_rdwr")
+
+    def __getattr__(self, name: str):
+        # Only called for attributes not found on I2CBus itself
+        if name == "bus":
+            raise AttributeError(name)
+        attribute = getattr(self.bus, name)
+        if not callable(attribute):
+            return attribute
+
+        def locked(*args, **kwargs):
+            if args and isinstance(args[0], int):
+                return self._run(args[0], lambda: attribute(*args, **kwargs))
+            with self.lock:
+                return attribute(*args, **kwargs)
+
+        return locked
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator["I2CBus"]:
+        """
+        Holds the bus for a sequence of operations that mustn't be
+        interleaved with other threads' (e.g. write then poll a status)
+        """
+        with self.lock:
+            yield self
+
+    def _run(
+        self,
+        i2c_addr: int,
+        func: Callable,
+        *args,
+        bytes_read: int = 0,
+        bytes_written: int = 0,
+    ):
+        with self.lock:
+            # Counts are only touched holding the lock, so callers on other
+            # threads can't lose each other's updates
+            stats = self.stats.get(i2c_addr)
+            if stats is None:
+                stats = self.stats[i2c_addr] = I2CStats()
+                self.latency[i2c_addr] = self.metrics.histogram(
+                    "i2c_transaction_seconds",
+                    "I2C transaction latency",
+                    {"address": f"0x{i2c_addr:02X}"},
+                )
+            start = self.clock()
+            try:
+                return func(*args)
+            except OSError:
+                stats.errors += 1
+                raise
+            finally:
+                elapsed = self.clock() - start
+                stats.transactions += 1
+                stats.bytes_read += bytes_read
+                stats.bytes_written += bytes_written
+                stats.total_time_s += elapsed
+                stats.max_time_s = max(elapsed, stats.max_time_s)
+                self.latency[i2c_addr].observe(elapsed)
+
+    def read_byte_data(self, i2c_addr: int, register: int) -> int:
+        return self._run(
+            i2c_addr,
+            self.bus.read_byte_data,
+            i2c_addr,
+            register,
+            bytes_read=1,
+            bytes_written=1,
+        )
+
+    def write_byte_data(self, i2c_addr: int, register: int, value: int):
+        return self._run(
+            i2c_addr,
+            self.bus.write_byte_data,
+            i2c_addr,
+            register,
+            value,
+            bytes_written=2,
+        )
+
+    def read_word_data(self, i2c_addr: int, register: int) -> int:
+        return self._run(
+            i2c_addr,
+            self.bus.read_word_data,
+            i2c_addr,
+            register,
+            bytes_read=2,
+            bytes_written=1,
+        )
+
+    def read_i2c_block_data(
+        self, i2c_addr: int, register: int, length: int
+    ) -> list[int]:
+        return self._run(
+            i2c_addr,
+            self.bus.read_i2c_block_data,
+            i2c_addr,
+            register,
+            length,
+            bytes_read=length,
+            bytes_written=1,
+        )
+
+    def write_i2c_block_data(
+        self, i2c_addr: int, register: int, data: list[int]
+    ) -> None:
+        return self._run(
+            i2c_addr,
+            self.bus.write_i2c_block_data,
+            i2c_addr,
+            register,
+            data,
+            bytes_written=len(data) + 1,
+        )
+
+    def i2c_rdwr(self, *messages: i2c_msg) -> None:
+        if not messages:
+            return
+        read = sum(len(x) for x in messages if x.flags & 0x0001)
+        written = sum(len(x) for x in messages) - read
+        self._run(
+            messages[0].addr,
+            self.bus.i2c_rdwr,
+            *messages,
+            bytes_read=read,
+            bytes_written=written,
+        )
+
+    def close(self) -> None:
+        with self.lock:
+            self.bus.close()
+
+    def read_block(
+        self, i2c_addr: int, register: int, length: int
+    ) -> list[int]:
+        """
+        Reads length bytes starting at register, in transfers of up to
+        max_block_length bytes
+        """
+        data = []
+        while length > 0:
+            chunk = min(length, self.max_block_length)
+            if self.rdwr_supported:
+                write = i2c_msg.write(i2c_addr, [register])
+                read = i2c_msg.read(i2c_addr, chunk)
+                self.i2c_rdwr(write, read)
+                data.extend(read)
+            else:
+                # SMBus block reads are limited to 32 bytes
+                chunk = min(chunk, 32)
+                data.extend(
+                    self.read_i2c_block_data(i2c_addr, register, chunk)
+                )
+            register += chunk
+            length -= chunk
+        return data
+
+    def read_ranges(
+        self, i2c_addr: int, ranges: Iterable[tuple[int, int]]
+    ) -> list[list[int]]:
+        """
+        Reads each (register, length) range, merging ranges that overlap
+        or are within max_gap bytes of each other into one transfer.
+        Results are returned in the order the ranges were given
+        """
+        ranges = list(ranges)
+        order = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+        results: list[list[int]] = [[] for _ in ranges]
+
+        # Group sorted ranges into spans, then read each span once
+        spans: list[tuple[int, int, list[int]]] = []
+        for i in order:
+            register, length = ranges[i]
+            end = register + length
+            if spans:
+                span_start, span_end, members = spans[-1]
+                if register - span_end <= self.max_gap and (
+                    max(end, span_end) - span_start <= self.max_block_length
+                ):
+                    spans[-1] = (span_start, max(end, span_end), members)
+                    members.append(i)
+                    continue
+            spans.append((register, end, [i]))
+
+        with self.lock:
+            for span_start, span_end, members in spans:
+                data = self.read_block(
+                    i2c_addr, span_start, span_end - span_start
+                )
+                for i in members:
+                    register, length = ranges[i]
+                    offset = register - span_start
+                    results[i] = data[offset:offset + length]
+        return results
+
+    def read_registers(
+        self, i2c_addr: int, registers: Iterable[int]
+    ) -> dict[int, int]:
+        """
+        Reads single byte registers, coalesced as per read_ranges()
+        """
+        registers = sorted(set(registers))
+        values = self.read_ranges(i2c_addr, ((x, 1) for x in registers))
+        return {register: x[0] for register, x in zip(registers, values)}
+
+    def log_statistics(self) -> None:
+        with self.lock:
+            devices = sorted(self.stats.items())
+        for i2c_addr, stats in devices:
+            self.logger.info(
+                f"I2C device 0x{i2c_addr:02X}: "
+                f"{stats.transactions} transactions, "
+                f"{stats.errors} errors, "
+                f"mean {stats.mean_time_s * 1e3:.3f} ms, "
+                f"max {stats.max_time_s * 1e3:.3f} ms, "
+                f"{stats.bytes_read} bytes read, "
+                f"{stats.bytes_written} bytes written"
+            )
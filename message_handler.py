@@ -1,31 +1,82 @@
-from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Optional
+import logging
+
 from m0wut_drivers.gpio import GPIO
 import serial
 
-
-@dataclass
-class RS485Packet:
-    address: int
-    command: int
-    payload: str
+from metrics.metrics import REGISTRY, MetricsRegistry
+from rs485.capture import RX, TX, TrafficCapture
+from rs485.framing import FrameParser, RS485Packet
 
 
 class MessageHandler:
     TX = 1
     RX = 0
+    # Master should have RS485 address of 0
+    MASTER_ADDRESS = 0
 
-    def __init__(self, gpio: GPIO, serialFile: str, baud: int):
-        self.serial = None
-        try:
-            self.serial = serial.Serial(serialFile, baud, timeout=0.2)
-        except serial.serialutil.SerialException:
-            self.warnings.add_error(
-                "Controller",
-                "Transverter Control",
-                "Couldn't open serial port: {}".format(serialFile),
-            )
+    def __init__(
+        self,
+        gpio: GPIO,
+        serialFile: str,
+        baud: int,
+        timeout: float = 0.2,
+        port: Optional[serial.Serial] = None,
+        capture: Optional[TrafficCapture] = None,
+        metrics: MetricsRegistry = REGISTRY,
+        frame_gap_s: float = 0.005,
+    ):
+        """
+        port replaces the serial port opened from serialFile, e.g. with a
+        simulated one. If capture is given, all raw bytes sent and
+        received are recorded to it. Query latency, timeouts and framing
+        errors are recorded in metrics
+
+        The port's own timeout is fixed at frame_gap_s, so each read
+        waits at most that long and the overall timeout is kept to by
+        read(). A read that times out means the line has been quiet for a
+        frame gap, so any incomplete frame is dropped
+        """
+        self.logger = logging.getLogger(__name__)
+        self.timeout = timeout
+        self.serial = port
+        if self.serial is None:
+            try:
+                self.serial = serial.Serial(
+                    serialFile, baud, timeout=frame_gap_s
+                )
+            except serial.serialutil.SerialException:
+                self.logger.error(
+                    "Couldn't open serial port: {}".format(serialFile)
+                )
+                raise
+        else:
+            self.serial.timeout = frame_gap_s
 
+        self.capture = capture
         self.mutex = Lock()
+        self.parser = FrameParser()
+        # Frames received alongside the one read() returned
+        self.pending: list[RS485Packet] = []
+        self.sequence: int = 0
+        self.query_time = metrics.histogram(
+            "rs485_query_seconds", "Time for an RS485 query to be answered"
+        )
+        self.timeouts = metrics.counter(
+            "rs485_query_timeouts_total", "RS485 queries with no response"
+        )
+        metrics.counter(
+            "rs485_crc_errors_total",
+            "RS485 frames rejected for a bad CRC",
+            func=lambda: self.parser.crc_errors,
+        )
+        metrics.counter(
+            "rs485_discarded_bytes_total",
+            "Bytes received outside an RS485 frame",
+            func=lambda: self.parser.discarded_bytes,
+        )
 
         self.gpio = gpio
         self.gpio.set_direction(GPIO.OUTPUT)
@@ -41,53 +92,102 @@ class MessageHandler:
         if getLock:
             self.mutex.acquire()
         try:
-            LED_ERROR.write(GPIO.HIGH)
-            address = x.address.to_bytes(1, "big")
-            command = x.command.encode("utf-8")
+            frame = x.encode()
             self.set_direction(self.TX)
-            payload = x.payload.encode("utf-8")
-            logging.debug(
-                "RS485 TX to address {}, command {}, payload {}".format(
-                    x.address, x.command, x.payload
-                )
+            # Lazy formatting as this is on every packet
+            self.logger.debug(
+                "RS485 TX to address %s, command %s, payload %s",
+                x.address,
+                x.command,
+                x.payload,
             )
-            self.serial.write(address + command + payload + b"\n")
+            self.serial.write(frame)
             self.serial.flush()
             self.set_direction(self.RX)
+            if self.capture is not None:
+                self.capture.record(TX, frame)
 
             # Changing RS485 from TX to RX introduces glitches on the
-            # RX line so clear the buffer
+            # RX line so clear the buffer. Any that get through are
+            # discarded by the parser
             self.serial.reset_input_buffer()
-            LED_ERROR.write(GPIO.LOW)
+            self.parser.reset()
+            self.pending.clear()
         finally:
             if getLock:
                 self.mutex.release()
 
-    def read(self, getLock: bool = True) -> str:
+    def read(
+        self, getLock: bool = True, timeout: Optional[float] = None
+    ) -> Optional[RS485Packet]:
+        """
+        Returns the next frame received, or None if none arrives within
+        timeout (the handler's timeout if None), give or take a frame
+        gap. Frames with a bad CRC are dropped
+        """
+        if timeout is None:
+            timeout = self.timeout
         if getLock:
             self.mutex.acquire()
         try:
-            x = self.serial.readline()
-            if x == b"":
-                return x
-            else:
-                if x[0] != 0:  # Master should have RS485 address of 0
-                    logging.warning(
-                        "Response to RS485 query was not addressed to master"
-                    )
-                return x[1:]  # Remove address character
+            deadline = monotonic() + timeout
+            while not self.pending:
+                # Take whatever has arrived, or wait for at least a byte
+                data = self.serial.read(max(1, self.serial.in_waiting))
+                if data:
+                    if self.capture is not None:
+                        self.capture.record(RX, data)
+                    self.pending += self.parser.feed(data)
+                else:
+                    # Line went quiet, so drop any incomplete frame
+                    self.pending += self.parser.idle()
+                if monotonic() >= deadline:
+                    break
+            if not self.pending:
+                return None
+            x = self.pending.pop(0)
+            if x.address != self.MASTER_ADDRESS:
+                self.logger.warning(
+                    "Response to RS485 query was not addressed to master"
+                )
+            return x
         finally:
             if getLock:
                 self.mutex.release()
 
-    def query(self, packet: RS485Packet) -> str:
+    def query(
+        self, packet: RS485Packet, timeout: Optional[float] = None
+    ) -> Optional[RS485Packet]:
+        """
+        Sends packet with the next sequence number and returns the
+        response carrying the same one. A late response to an earlier
+        query is discarded
+        """
+        if timeout is None:
+            timeout = self.timeout
         self.mutex.acquire()
         try:
+            self.sequence = (self.sequence + 1) % 256
+            packet.sequence = self.sequence
+            start = monotonic()
+            deadline = start + timeout
             self.write(packet, getLock=False)
-            response = self.read(getLock=False)
-            logging.debug(
-                "RS485 RX from address {}: {}".format(packet.address, response)
+            while True:
+                response = self.read(
+                    getLock=False, timeout=max(0, deadline - monotonic())
+                )
+                if response is None or response.sequence == packet.sequence:
+                    break
+                self.logger.debug(
+                    "Discarded stale RS485 response %s", response.sequence
+                )
+            self.logger.debug(
+                "RS485 RX from address %s: %s", packet.address, response
             )
+            if response is None:
+                self.timeouts.inc()
+            else:
+                self.query_time.observe(monotonic() - start)
             return response
         finally:
             self.mutex.release()
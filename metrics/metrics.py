@@ -0,0 +1,370 @@
+# Standard imports
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import monotonic, perf_counter
+from typing import Callable, Iterator, Optional, Union
+import logging
+import math
+
+# Third-party imports
+
+
+# Local imports
+
+
+# Upper bounds for histograms of durations, 10 us to 10 s
+DURATION_BUCKETS_S = (
+    1e-5,
+    1e-4,
+    5e-4,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    1e-2,
+    2.5e-2,
+    5e-2,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    10,
+)
+# Upper bounds for histograms of queue depths
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _key(name: str, labels: Optional[dict[str, str]]) -> str:
+    if not labels:
+        return name
+    label_text = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{label_text}}}"
+
+
+class Counter:
+    """
+    Monotonically increasing count. Updates aren't locked: under the GIL
+    an increment racing one from another thread is very occasionally
+    lost, which doesn't matter for monitoring and keeps this cheap.
+
+    If func is given, it's called for the value whenever the counter is
+    read, for counts something already keeps
+    """
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        labels: Optional[dict[str, str]] = None,
+        func: Optional[Callable[[], float]] = None,
+    ):
+        self.name = name
+        self.labels = labels or {}
+        self.func = func
+        self.value: float = 0
+
+    def inc(self, x: float = 1) -> None:
+        self.value += x
+
+    def snapshot(self) -> float:
+        if self.func is not None:
+            return self.func()
+        return self.value
+
+
+class Gauge:
+    """
+    Value that can go up and down. If func is given, it's called for the
+    value whenever the gauge is read, e.g. for the length of a queue
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        labels: Optional[dict[str, str]] = None,
+        func: Optional[Callable[[], float]] = None,
+    ):
+        self.name = name
+        self.labels = labels or {}
+        self.func = func
+        self.value: float = 0
+
+    def set(self, x: float) -> None:
+        self.value = x
+
+    def inc(self, x: float = 1) -> None:
+        self.value += x
+
+    def dec(self, x: float = 1) -> None:
+        self.value -= x
+
+    def snapshot(self) -> float:
+        if self.func is not None:
+            return self.func()
+        return self.value
+
+
+class Histogram:
+    """
+    Counts of observations in fixed buckets, plus their sum. observe() is
+    a bisect and two additions so can be used on every main loop tick
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        labels: Optional[dict[str, str]] = None,
+        buckets: tuple[float, ...] = DURATION_BUCKETS_S,
+    ):
+        self.name = name
+        self.labels = labels or {}
+        self.buckets = tuple(sorted(buckets))
+        # Last entry counts anything above the largest bucket
+        self.counts: list[int] = [0] * (len(self.buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0
+
+    def observe(self, x: float) -> None:
+        self.counts[bisect_left(self.buckets, x)] += 1
+        self.count += 1
+        self.sum += x
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "buckets": self.counts}
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class MetricsRegistry:
+    """
+    Holds every metric by name and labels. counter(), gauge() and
+    histogram() return the existing metric if it's already been created,
+    so components can look their metrics up once at construction and then
+    update them directly
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self.help: dict[str, str] = {}
+        self._lock = Lock()
+
+    def _get(self, cls, name: str, help: str, labels, **kwargs) -> Metric:
+        key = _key(name, labels)
+        with self._lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = cls(name, labels, **kwargs)
+                self.metrics[key] = metric
+                if help:
+                    self.help.setdefault(name, help)
+            assert isinstance(
+                metric, cls
+            ), f"Metric {key} already exists as a {metric.kind}"
+            return metric
+
+    def counter(
+        self,
+        name: str,
+        help: str = "",
+        labels: Optional[dict[str, str]] = None,
+        func: Optional[Callable[[], float]] = None,
+    ) -> Counter:
+        counter = self._get(Counter, name, help, labels)
+        if func is not None:
+            counter.func = func
+        return counter
+
+    def gauge(
+        self,
+        name: str,
+        help: str = "",
+        labels: Optional[dict[str, str]] = None,
+        func: Optional[Callable[[], float]] = None,
+    ) -> Gauge:
+        gauge = self._get(Gauge, name, help, labels)
+        if func is not None:
+            gauge.func = func
+        return gauge
+
+    def histogram(
+        self,
+        name: str,
+        help: str = "",
+        labels: Optional[dict[str, str]] = None,
+        buckets: tuple[float, ...] = DURATION_BUCKETS_S,
+    ) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def snapshot(self) -> dict[str, Union[float, dict]]:
+        """
+        Current value of every metric keyed by name{labels}. Histograms
+        give per bucket (not cumulative) counts, bucket bounds are left
+        out to keep it compact
+        """
+        with self._lock:
+            metrics = list(self.metrics.items())
+        return {key: metric.snapshot() for key, metric in metrics}
+
+    def prometheus_text(self) -> str:
+        """
+        Every metric in the Prometheus text exposition format
+        """
+        with self._lock:
+            by_name: dict[str, list[Metric]] = {}
+            for metric in self.metrics.values():
+                by_name.setdefault(metric.name, []).append(metric)
+
+        lines = []
+        for name, metrics in by_name.items():
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {metrics[0].kind}")
+            for metric in metrics:
+                if isinstance(metric, Histogram):
+                    lines += _histogram_lines(metric)
+                else:
+                    key = _key(name, metric.labels)
+                    lines.append(f"{key} {_number(metric.snapshot())}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(x: float) -> str:
+    if math.isinf(x):
+        return "+Inf" if x > 0 else "-Inf"
+    return repr(float(x)) if isinstance(x, float) else str(x)
+
+
+def _histogram_lines(metric: Histogram) -> list[str]:
+    lines = []
+    cumulative = 0
+    bounds = [_number(x) for x in metric.buckets] + ["+Inf"]
+    for bound, count in zip(bounds, metric.counts):
+        cumulative += count
+        key = _key(f"{metric.name}_bucket", {**metric.labels, "le": bound})
+        lines.append(f"{key} {cumulative}")
+    lines.append(
+        f"{_key(f'{metric.name}_sum', metric.labels)} {_number(metric.sum)}"
+    )
+    lines.append(
+        f"{_key(f'{metric.name}_count', metric.labels)} {metric.count}"
+    )
+    return lines
+
+
+# Used by everything unless given another registry
+REGISTRY = MetricsRegistry()
+
+
+class MetricsPublisher:
+    """
+    Publishes a snapshot of a registry every period_s, e.g. with
+    WarningHandler.publish_telemetry. Meant to be called from the main
+    loop
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[str, dict], None],
+        registry: MetricsRegistry = REGISTRY,
+        period_s: float = 10,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.publish = publish
+        self.registry = registry
+        self.period_s = period_s
+        self.clock = clock
+        self.next_publish: float = clock()
+
+    def tick(self) -> None:
+        now = self.clock()
+        if now < self.next_publish:
+            return
+        self.next_publish = now + self.period_s
+        self.publish("metrics", self.registry.snapshot())
+
+
+class PrometheusServer:
+    """
+    Serves a registry at http://host:port/metrics from a background
+    thread. Only listens on localhost by default, e.g. for a local
+    Prometheus agent or node exporter to scrape
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry = REGISTRY,
+        host: str = "127.0.0.1",
+        port: int = 9108,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[Thread] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.stop()
+
+    def start(self) -> None:
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes would otherwise be printed to stderr
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            self.logger.warning(
+                f"Couldn't serve metrics on {self.host}:{self.port}: {e}"
+            )
+            return
+        self.port = self._server.server_address[1]
+        self._thread = Thread(
+            target=self._server.serve_forever, name="Metrics", daemon=True
+        )
+        self._thread.start()
+        self.logger.info(f"Serving metrics on {self.host}:{self.port}")
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
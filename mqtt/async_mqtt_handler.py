@@ -0,0 +1,392 @@
+# Standard imports
+from collections import deque
+from dataclasses import dataclass
+from json.decoder import JSONDecodeError
+from typing import AsyncIterator, Callable, Optional
+import asyncio
+import inspect
+import json
+import logging
+import socket
+
+# Third-party imports
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+
+
+# Local imports
+from m0wut_drivers.linux_cpu import get_mac_address
+from mqtt.mqtt_handler import BrokerConnectionError
+from mqtt.topic_trie import TopicTrie
+
+
+@dataclass
+class AsyncMqttStatistics:
+    messages_received: int = 0
+    messages_published: int = 0
+    # Publishers that had to wait for space in the outbound buffer
+    publish_waits: int = 0
+    # Times reading from the broker was paused as the inbound queue was full
+    inbound_pauses: int = 0
+    reconnects: int = 0
+
+
+@dataclass
+class _OutboundMessage:
+    topic: str
+    payload: str
+    qos: int
+    future: asyncio.Future
+
+
+class AsyncMqttHandler:
+    """
+    asyncio version of MqttHandler. paho's network loop is driven by the
+    event loop (socket readiness callbacks) rather than a separate thread
+    so callbacks and received messages never need to cross threads.
+
+    Publishes go into a buffer of at most max_outbound messages that is
+    held while disconnected and sent on reconnect. When it's full,
+    publish() waits for space rather than dropping messages. Received
+    messages are available from messages() (or dispatched to registered
+    callbacks by run()). If more than max_inbound are waiting, reading
+    from the broker is paused until they have been consumed.
+    """
+
+    def __init__(
+        self,
+        broker_ip_address: str,
+        broker_port: int,
+        node_name: str,
+        max_outbound: int = 1000,
+        max_inbound: int = 1000,
+        reconnect_delay_s: float = 1,
+        max_reconnect_delay_s: float = 30,
+    ):
+        self.client = mqtt.Client(CallbackAPIVersion.VERSION2)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+        self.client.on_publish = self.on_publish
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = (
+            self.on_socket_unregister_write
+        )
+        self.broker_ip_address = broker_ip_address
+        self.broker_port = broker_port
+        self.node_name = node_name
+        self.max_inbound = max_inbound
+        self.reconnect_delay_s = reconnect_delay_s
+        self.max_reconnect_delay_s = max_reconnect_delay_s
+        # Topic filter -> (callback, whether callback wants the topic)
+        self.callbacks = TopicTrie()
+        self.subscriptions: set[str] = set()
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.mqtt_connected: bool = False
+        self.statistics = AsyncMqttStatistics()
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._socket: Optional[socket.socket] = None
+        self._reading_paused: bool = False
+        self._inbound: asyncio.Queue = asyncio.Queue()
+        self._outbound: deque[_OutboundMessage] = deque()
+        self._in_flight: dict[int, _OutboundMessage] = {}
+        self._outbound_space = asyncio.Semaphore(max_outbound)
+        self._tasks: list[asyncio.Task] = []
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._closing: bool = False
+
+        self.client.will_set(
+            "/status/discovery",
+            json.dumps(
+                {
+                    "mac_address": get_mac_address(),
+                    "node_name": f"{self.node_name}",
+                    "status": "disconnected",
+                }
+            ),
+        )
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        await self.stop()
+
+    async def start(self, wait_for_connection: bool = False) -> None:
+        """
+        Starts connecting to the broker. Unlike MqttHandler, a broker that
+        isn't there yet isn't an error, it keeps retrying in the
+        background. If wait_for_connection is True, this raises
+        BrokerConnectionError if the first attempt fails
+        """
+        self._loop = asyncio.get_running_loop()
+        self._tasks.append(asyncio.create_task(self._misc_loop()))
+        try:
+            self._connect()
+        except (OSError, socket.timeout) as e:
+            if wait_for_connection:
+                raise BrokerConnectionError from e
+            self._schedule_reconnect()
+
+    async def stop(self) -> None:
+        self._closing = True
+        for task in self._tasks + [self._reconnect_task]:
+            if task is not None:
+                task.cancel()
+        # Don't clean disconnect so LWT gets broadcast
+        sock = self.client.socket()
+        if sock is not None:
+            self.on_socket_close(self.client, None, sock)
+            sock.close()
+        self.mqtt_connected = False
+        self.logger.info(
+            "Disconnected from MQTT Server "
+            f"{self.broker_ip_address}:{self.broker_port}",
+        )
+
+    # ----- Public API -----
+
+    async def publish(
+        self, topic: str, payload: str, qos: int = 0, wait: bool = True
+    ) -> asyncio.Future:
+        """
+        Queues a message for publishing, waiting for space in the outbound
+        buffer if it is full. If wait is True, also waits until the
+        message has been delivered (written to the socket for QoS 0,
+        acknowledged by the broker for QoS 1 / 2). Returns a future that
+        completes on delivery
+        """
+        if self._outbound_space.locked():
+            self.statistics.publish_waits += 1
+        await self._outbound_space.acquire()
+        future = self._loop.create_future()
+        self._outbound.append(_OutboundMessage(topic, payload, qos, future))
+        self._send_outbound()
+        if wait:
+            await future
+        return future
+
+    def subscribe(self, topic: str) -> None:
+        """
+        Subscribes to topic (which may contain wildcards). Messages
+        received are available from messages(). Subscriptions are made
+        again automatically after a reconnect
+        """
+        TopicTrie.validate(topic)
+        self.subscriptions.add(topic)
+        if self.mqtt_connected:
+            self._subscribe(topic)
+
+    def unsubscribe(self, topic: str) -> None:
+        self.subscriptions.discard(topic)
+        if self.mqtt_connected:
+            error, _ = self.client.unsubscribe(topic)
+            if error != mqtt.MQTT_ERR_SUCCESS:
+                self.logger.error(f"Failed to unsubscribe from topic {topic}")
+
+    def register_callback(
+        self, topic: str, func: Callable, include_topic: bool = False
+    ) -> None:
+        """
+        As MqttHandler.register_callback(). func may also be a coroutine
+        function. Callbacks are called by run()
+        """
+        assert (
+            topic not in self.callbacks
+        ), f"Topic: {topic} already has a callback function registered"
+        self.subscribe(topic)
+        self.callbacks.insert(topic, (func, include_topic))
+
+    def remove_callback(self, topic: str) -> None:
+        assert topic in self.callbacks, (
+            f"Attempted to remove topic ({topic}) that's not "
+            "currently subscribed to"
+        )
+        self.unsubscribe(topic)
+        self.callbacks.remove(topic)
+
+    async def messages(self) -> AsyncIterator[tuple[str, dict[str, str]]]:
+        """
+        Yields (topic, message) for every message received
+        """
+        while True:
+            message = await self._inbound.get()
+            if (
+                self._reading_paused
+                and self._inbound.qsize() <= self.max_inbound // 2
+            ):
+                self._resume_reading()
+            yield message
+
+    async def run(self) -> None:
+        """
+        Dispatches received messages to the registered callbacks
+        """
+        async for topic, message_dict in self.messages():
+            callbacks = self.callbacks.match(topic)
+            if not callbacks:
+                self.logger.warning(
+                    f"Received message on topic: {topic} "
+                    "with no registered callback"
+                )
+            for func, include_topic in callbacks:
+                try:
+                    if include_topic:
+                        result = func(topic, message_dict)
+                    else:
+                        result = func(message_dict)
+                    if inspect.isawaitable(result):
+                        await result
+                except KeyError as e:
+                    self.logger.warning(
+                        "Response from device "
+                        f"was not complete. Expected key: {e}",
+                    )
+
+    # ----- paho callbacks -----
+
+    def on_connect(
+        self, client, userdata, flags, reason_code, properties
+    ) -> None:
+        if reason_code != 0:
+            self.logger.error(f"MQTT broker refused connection: {reason_code}")
+            return
+        self.mqtt_connected = True
+        self.client.publish(
+            "/status/discovery",
+            json.dumps(
+                {
+                    "mac_address": get_mac_address(),
+                    "node_name": self.node_name,
+                    "status": "connected",
+                }
+            ),
+        )
+        for topic in self.subscriptions:
+            self._subscribe(topic)
+        self.logger.info(
+            "Connected to MQTT broker at "
+            f"{self.broker_ip_address}:{self.broker_port}"
+        )
+        self._send_outbound()
+
+    def on_disconnect(
+        self, client, userdata, disconnect_flags, reason_code, properties
+    ) -> None:
+        self.mqtt_connected = False
+        # QoS 0 messages that weren't written are lost by paho so send them
+        # again. paho itself resends unacknowledged QoS 1 / 2 on reconnect
+        for mid, message in list(self._in_flight.items()):
+            if message.qos == 0:
+                del self._in_flight[mid]
+                self._outbound.appendleft(message)
+        if not self._closing:
+            self.logger.warning("Disconnected from MQTT server")
+            self._schedule_reconnect()
+
+    def on_message(self, client, userdata, msg: mqtt.MQTTMessage) -> None:
+        self.statistics.messages_received += 1
+        try:
+            message_dict = json.loads(msg.payload.decode("utf-8"))
+        except UnicodeDecodeError:
+            self.logger.warning("Malformed message received")
+            return
+        except JSONDecodeError:
+            self.logger.warning("Received message contains invalid JSON")
+            return
+        self.logger.debug(f"Received MQTT: [{msg.topic}] {message_dict}")
+        self._inbound.put_nowait((msg.topic, message_dict))
+        if self._inbound.qsize() >= self.max_inbound:
+            self._pause_reading()
+
+    def on_publish(self, client, userdata, mid, reason_code, properties):
+        message = self._in_flight.pop(mid, None)
+        if message is None:
+            # e.g. discovery message published directly
+            return
+        self.statistics.messages_published += 1
+        self._outbound_space.release()
+        if not message.future.done():
+            message.future.set_result(None)
+
+    def on_socket_open(self, client, userdata, sock) -> None:
+        self._socket = sock
+        self._loop.add_reader(sock, self._read)
+
+    def on_socket_close(self, client, userdata, sock) -> None:
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+        self._socket = None
+        self._reading_paused = False
+
+    def on_socket_register_write(self, client, userdata, sock) -> None:
+        self._loop.add_writer(sock, self.client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock) -> None:
+        self._loop.remove_writer(sock)
+
+    # ----- Internals -----
+
+    def _connect(self) -> None:
+        # Blocks for the TCP handshake only, the MQTT handshake is handled
+        # by the event loop
+        self.client.connect(
+            self.broker_ip_address, self.broker_port, keepalive=5
+        )
+
+    def _subscribe(self, topic: str) -> None:
+        error, _ = self.client.subscribe(topic)
+        if error != mqtt.MQTT_ERR_SUCCESS:
+            self.logger.error(f"Failed to subscribe to topic {topic}")
+        else:
+            self.logger.info(f"Subscribed to MQTT topic: {topic}")
+
+    def _send_outbound(self) -> None:
+        while self._outbound and self.mqtt_connected:
+            message = self._outbound.popleft()
+            info = self.client.publish(
+                message.topic, message.payload, qos=message.qos
+            )
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                self._outbound.appendleft(message)
+                break
+            self._in_flight[info.mid] = message
+
+    def _read(self) -> None:
+        self.client.loop_read()
+
+    def _pause_reading(self) -> None:
+        if self._socket is not None and not self._reading_paused:
+            self._loop.remove_reader(self._socket)
+            self._reading_paused = True
+            self.statistics.inbound_pauses += 1
+
+    def _resume_reading(self) -> None:
+        if self._socket is not None and self._reading_paused:
+            self._loop.add_reader(self._socket, self._read)
+        self._reading_paused = False
+
+    def _schedule_reconnect(self) -> None:
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = self.reconnect_delay_s
+        while not self.mqtt_connected and not self._closing:
+            await asyncio.sleep(delay)
+            try:
+                self._connect()
+                self.statistics.reconnects += 1
+                return
+            except (OSError, socket.timeout):
+                delay = min(delay * 2, self.max_reconnect_delay_s)
+
+    async def _misc_loop(self) -> None:
+        # Keepalive pings and timeouts
+        while True:
+            await asyncio.sleep(1)
+            self.client.loop_misc()
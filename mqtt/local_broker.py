@@ -0,0 +1,253 @@
+# Standard imports
+from threading import Thread
+from typing import Optional
+import asyncio
+import logging
+import struct
+
+# Third-party imports
+
+
+# Local imports
+from mqtt.topic_trie import TopicTrie
+
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+def _packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    # Fixed header then remaining length as a variable length integer
+    header = bytearray([(packet_type << 4) | flags])
+    length = len(body)
+    while True:
+        byte = length % 128
+        length //= 128
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            break
+    return bytes(header) + body
+
+
+def _string(data: bytes, offset: int) -> tuple[bytes, int]:
+    (length,) = struct.unpack_from("!H", data, offset)
+    offset += 2
+    return data[offset:offset + length], offset + length
+
+
+class _Session:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.client_id: str = ""
+        self.will: Optional[tuple[str, bytes, int]] = None
+        # Topic filter -> QoS
+        self.subscriptions = TopicTrie()
+        self.next_packet_id: int = 1
+
+    def packet_id(self) -> int:
+        packet_id = self.next_packet_id
+        self.next_packet_id = packet_id % 0xFFFF + 1
+        return packet_id
+
+
+class LocalBroker:
+    """
+    Minimal in-process MQTT 3.1.1 broker for testing and simulation. It
+    listens on a real TCP port so paho based clients connect to it
+    unmodified, and can be stopped / restarted to simulate broker outages.
+
+    Supports QoS 0 and 1 (QoS 2 publishes from clients are accepted but
+    delivered at QoS 1), + / # wildcards and last will messages. Retained
+    messages, persistent sessions and authentication are not supported.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.logger = logging.getLogger(__name__)
+        self.sessions: set[_Session] = set()
+        self.messages_routed: int = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[Thread] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+        # If port 0 was requested, remember the one we were given so a
+        # restart comes back on the same port
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        """
+        Drops every client without sending will messages, as if the
+        broker had crashed
+        """
+        if self._server is not None:
+            self._server.close()
+            for session in list(self.sessions):
+                session.will = None
+                session.writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        self.sessions.clear()
+
+    def start_in_thread(self) -> None:
+        """
+        Runs the broker in its own event loop on a background thread, for
+        use from synchronous code
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(
+            target=self._loop.run_forever, name="LocalBroker", daemon=True
+        )
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self._loop).result()
+
+    def stop_thread(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0) -> None:
+        """
+        Publishes a message from the broker itself. Safe to call from any
+        thread if the broker was started with start_in_thread()
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._route, topic, payload, qos)
+        else:
+            self._route(topic, payload, qos)
+
+    async def _read_packet(
+        self, reader: asyncio.StreamReader
+    ) -> tuple[int, int, bytes]:
+        first = (await reader.readexactly(1))[0]
+        length = 0
+        multiplier = 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        body = await reader.readexactly(length)
+        return first >> 4, first & 0x0F, body
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        session = _Session(writer)
+        self.sessions.add(session)
+        try:
+            while True:
+                packet_type, flags, body = await self._read_packet(reader)
+                if packet_type == DISCONNECT:
+                    session.will = None
+                    break
+                self._handle_packet(session, packet_type, flags, body)
+                await writer.drain()
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.CancelledError,
+            ConnectionError,
+        ):
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+            if session.will is not None:
+                self._route(*session.will)
+
+    def _handle_packet(
+        self, session: _Session, packet_type: int, flags: int, body: bytes
+    ) -> None:
+        write = session.writer.write
+        if packet_type == CONNECT:
+            _, offset = _string(body, 0)
+            connect_flags = body[offset + 1]
+            offset += 4  # Protocol level, flags, keepalive
+            client_id, offset = _string(body, offset)
+            session.client_id = client_id.decode("utf-8")
+            if connect_flags & 0x04:
+                will_topic, offset = _string(body, offset)
+                will_payload, offset = _string(body, offset)
+                session.will = (
+                    will_topic.decode("utf-8"),
+                    will_payload,
+                    (connect_flags >> 3) & 0x03,
+                )
+            write(_packet(CONNACK, 0, b"\x00\x00"))
+
+        elif packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, offset = _string(body, 0)
+            if qos:
+                (packet_id,) = struct.unpack_from("!H", body, offset)
+                offset += 2
+                response = PUBACK if qos == 1 else PUBREC
+                write(_packet(response, 0, struct.pack("!H", packet_id)))
+            self._route(topic.decode("utf-8"), body[offset:], qos)
+
+        elif packet_type == PUBREL:
+            write(_packet(PUBCOMP, 0, body[:2]))
+
+        elif packet_type == SUBSCRIBE:
+            packet_id = body[:2]
+            offset = 2
+            granted = bytearray()
+            while offset < len(body):
+                topic_filter, offset = _string(body, offset)
+                qos = min(body[offset], 1)
+                offset += 1
+                session.subscriptions.insert(
+                    topic_filter.decode("utf-8"), qos
+                )
+                granted.append(qos)
+            write(_packet(SUBACK, 0, packet_id + bytes(granted)))
+
+        elif packet_type == UNSUBSCRIBE:
+            offset = 2
+            while offset < len(body):
+                topic_filter, offset = _string(body, offset)
+                topic_filter = topic_filter.decode("utf-8")
+                if topic_filter in session.subscriptions:
+                    session.subscriptions.remove(topic_filter)
+            write(_packet(UNSUBACK, 0, body[:2]))
+
+        elif packet_type == PINGREQ:
+            write(_packet(PINGRESP, 0, b""))
+
+        # PUBACK / PUBREC / PUBCOMP for messages we sent are ignored as
+        # there's no redelivery
+
+    def _route(self, topic: str, payload: bytes, qos: int) -> None:
+        self.messages_routed += 1
+        encoded_topic = topic.encode("utf-8")
+        for session in list(self.sessions):
+            matches = session.subscriptions.match(topic)
+            if not matches:
+                continue
+            delivery_qos = min(max(matches), qos, 1)
+            body = struct.pack("!H", len(encoded_topic)) + encoded_topic
+            if delivery_qos:
+                body += struct.pack("!H", session.packet_id())
+            session.writer.write(
+                _packet(PUBLISH, delivery_qos << 1, body + payload)
+            )
@@ -2,8 +2,11 @@
 import logging
 import socket
 import json
+import ipaddress
+from dataclasses import dataclass
 from json.decoder import JSONDecodeError
-from queue import Queue
+from queue import Empty, Queue
+from time import monotonic
 from typing import Callable, Optional
 
 # Third-party imports
@@ -13,19 +16,75 @@ from paho.mqtt.enums import CallbackAPIVersion
 
 # Local imports
 from m0wut_drivers.linux_cpu import get_mac_address
+from metrics.metrics import REGISTRY, MetricsRegistry
+from mqtt.topic_trie import TopicTrie
 
 
 class BrokerConnectionError(Exception):
     pass
 
 
+def routed_ip_address(destination: str = "192.0.2.1") -> Optional[str]:
+    """
+    Returns the address of the interface packets to destination leave
+    from, by default the one with the default route, or None if there
+    isn't a route. Connecting a UDP socket doesn't send anything
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect((destination, 9))
+        except OSError:
+            return None
+        return sock.getsockname()[0]
+
+
+def is_loopback(address: str) -> bool:
+    try:
+        return ipaddress.ip_address(address).is_loopback
+    except ValueError:
+        return address == "localhost"
+
+
+@dataclass
+class MqttStatistics:
+    messages_received: int = 0
+    messages_processed: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    # Time between a message arriving and it being handled
+    last_latency_s: float = 0
+    max_latency_s: float = 0
+    total_latency_s: float = 0
+    # Ticks that stopped with messages still queued
+    budget_exhausted: int = 0
+
+    @property
+    def mean_latency_s(self) -> float:
+        if self.messages_processed == 0:
+            return 0
+        return self.total_latency_s / self.messages_processed
+
+
 class MqttHandler:
     def __init__(
         self,
         broker_ip_address: str,
         broker_port: int,
         node_name: str,
+        tick_max_messages: int = 1,
+        tick_time_budget_s: float = 0,
+        on_message_queued: Optional[Callable[[], None]] = None,
+        discovery_info: Optional[dict] = None,
+        advertise_ip_address: Optional[str] = None,
+        metrics: MetricsRegistry = REGISTRY,
     ):
+        """
+        discovery_info is added to the /status/discovery messages, along
+        with this node's IP address once connected. That's
+        advertise_ip_address if given, otherwise the address the broker
+        is reached from, unless the broker is on this node in which case
+        it's the interface with the default route
+        """
         super().__init__()
         self.client = mqtt.Client(CallbackAPIVersion.VERSION2)
         self.client.on_connect = self.on_connect
@@ -34,57 +93,132 @@ class MqttHandler:
         self.broker_ip_address = broker_ip_address
         self.broker_port = broker_port
         self.node_name = node_name
-        self.callbacks = {}
+        # Topic filter -> (callback, whether callback wants the topic)
+        self.callbacks = TopicTrie()
+        # Subscriptions are lost when the connection drops so these are
+        # made again every time we connect
+        self.subscriptions: set[str] = set()
         self.message_queue = Queue()
+        self.tick_max_messages = tick_max_messages
+        self.tick_time_budget_s = tick_time_budget_s
+        # Called (from paho's thread) whenever a message is queued so the
+        # main loop can be woken to deal with it
+        self.on_message_queued = on_message_queued
+        self.statistics = MqttStatistics()
+        metrics.gauge(
+            "mqtt_queue_depth",
+            "Received MQTT messages waiting to be handled",
+            func=self.message_queue.qsize,
+        )
+        self.latency_metric = metrics.histogram(
+            "mqtt_message_latency_seconds",
+            "Time from an MQTT message arriving to it being handled",
+        )
+        self.received_metric = metrics.counter(
+            "mqtt_messages_received_total", "MQTT messages received"
+        )
+        self.published_metric = metrics.counter(
+            "mqtt_messages_published_total", "MQTT messages published"
+        )
+        self.disconnects_metric = metrics.counter(
+            "mqtt_disconnects_total", "Times the MQTT connection dropped"
+        )
         self.logger: logging.Logger = logging.getLogger(__name__)
         self.mqtt_connected: bool = False
+        self.discovery_info: dict = discovery_info if discovery_info else {}
+        self.advertise_ip_address = advertise_ip_address
+        self.ip_address: Optional[str] = None
 
         try:
             self.client.will_set(
-                "/status/discovery",
-                json.dumps(
-                    {
-                        "mac_address": get_mac_address(),
-                        "node_name": f"{self.node_name}",
-                        "status": "disconnected",
-                    }
-                ),
+                "/status/discovery", self._discovery_message("disconnected")
             )
             self.client.connect(
                 self.broker_ip_address, self.broker_port, keepalive=5
             )
             self.client.loop_start()
 
-        except (socket.timeout, ConnectionRefusedError):
+        except (socket.timeout, OSError):
             raise BrokerConnectionError
 
     def tick(self) -> None:
-        # This deliberately only deals with one thing at a time
-        # Prevents locking up everything else if swamped with messages
-        if not self.message_queue.empty():
-            self.message_handler(self.message_queue.get())
+        """
+        Handles queued messages until tick_max_messages have been dealt
+        with or tick_time_budget_s has been used (0 for no time limit).
+        Prevents locking up everything else if swamped with messages
+        """
+        start_time = monotonic()
+        for _ in range(self.tick_max_messages):
+            try:
+                received_time, msg = self.message_queue.get_nowait()
+            except Empty:
+                # Caught up, so nothing's been left for the next tick
+                self.statistics.queue_depth = self.message_queue.qsize()
+                return
+            latency = monotonic() - received_time
+            self.statistics.messages_processed += 1
+            self.statistics.last_latency_s = latency
+            self.statistics.total_latency_s += latency
+            self.statistics.max_latency_s = max(
+                latency, self.statistics.max_latency_s
+            )
+            self.latency_metric.observe(latency)
+            self.message_handler(msg)
+            if (
+                self.tick_time_budget_s
+                and monotonic() - start_time >= self.tick_time_budget_s
+            ):
+                break
+        self.statistics.queue_depth = self.message_queue.qsize()
+        if self.statistics.queue_depth:
+            self.statistics.budget_exhausted += 1
 
     def on_connect(
         self, client, userdata, flags, reason_code, properties
     ) -> None:
         if reason_code == 0:
-            self.client.publish(
-                "/status/discovery",
-                json.dumps(
-                    {
-                        "mac_address": get_mac_address(),
-                        "node_name": self.node_name,
-                        "status": "connected",
-                    }
-                ),
-            )
+            self.ip_address = self._find_ip_address()
+            self.announce()
             self.mqtt_connected = True
+            for topic in list(self.subscriptions):
+                self._subscribe(topic)
             self.logger.info(
                 f"Connected to MQTT broker at {self.broker_ip_address}:{self.broker_port}"
             )
         else:
             raise BrokerConnectionError(reason_code)
 
+    def _find_ip_address(self) -> Optional[str]:
+        if self.advertise_ip_address is not None:
+            return self.advertise_ip_address
+        sock = self.client.socket()
+        if sock is not None:
+            address = sock.getsockname()[0]
+            if not is_loopback(address):
+                return address
+        # Talking to a broker on this node says nothing about how other
+        # nodes reach it, so use the interface they're most likely on
+        return routed_ip_address()
+
+    def announce(self) -> None:
+        """
+        Publishes that this node is connected on /status/discovery
+        """
+        self.client.publish(
+            "/status/discovery", self._discovery_message("connected")
+        )
+
+    def _discovery_message(self, status: str) -> str:
+        message = {
+            "mac_address": get_mac_address(),
+            "node_name": self.node_name,
+            "status": status,
+            **self.discovery_info,
+        }
+        if self.ip_address is not None:
+            message["ip_address"] = self.ip_address
+        return json.dumps(message)
+
     @classmethod
     def message_to_dict(cls, message: mqtt.MQTTMessage) -> dict[str, str]:
         result = json.loads(message.payload.decode("utf-8"))
@@ -94,21 +228,35 @@ class MqttHandler:
         self, client, userdata, disconnect_flags, reason_code, properties
     ) -> None:
         self.mqtt_connected = False
+        self.disconnects_metric.inc()
         self.logger.warning("Disconnected from MQTT server")
 
     def on_message(self, client, userdata, msg: mqtt.MQTTMessage) -> None:
         # This is called in a seperate thread so put message on queue
         # and let message_handler deal with it
-        self.message_queue.put(msg)
+        self.message_queue.put((monotonic(), msg))
+        self.statistics.messages_received += 1
+        self.received_metric.inc()
+        self.statistics.queue_depth = self.message_queue.qsize()
+        self.statistics.max_queue_depth = max(
+            self.statistics.queue_depth, self.statistics.max_queue_depth
+        )
+        if self.on_message_queued is not None:
+            self.on_message_queued()
 
     def message_handler(self, msg: mqtt.MQTTMessage) -> None:
-        if msg.topic in self.callbacks.keys():
+        callbacks = self.callbacks.match(msg.topic)
+        if callbacks:
             try:
                 message_dict = self.message_to_dict(msg)
                 self.logger.debug(
                     f"Received MQTT: [{msg.topic}] {message_dict}"
                 )
-                self.callbacks[msg.topic](message_dict)
+                for func, include_topic in callbacks:
+                    if include_topic:
+                        func(msg.topic, message_dict)
+                    else:
+                        func(message_dict)
 
             except UnicodeDecodeError:
                 self.logger.warning("Malformed message received")
@@ -127,26 +275,48 @@ class MqttHandler:
                 f"Received message on topic: {msg.topic} with no registered callback"
             )
 
-    def publish(self, topic: str, payload: str) -> None:
-        if self.mqtt_connected:
-            self.client.publish(topic, payload)
+    def publish(self, topic: str, payload: str) -> bool:
+        """
+        Returns False if the message couldn't be handed to the broker
+        connection, e.g. because it's dropped
+        """
+        if not self.mqtt_connected:
+            return False
+        info = self.client.publish(topic, payload)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            return False
+        self.published_metric.inc()
+        return True
 
-    def register_callback(self, topic: str, func: Callable) -> None:
+    def register_callback(
+        self, topic: str, func: Callable, include_topic: bool = False
+    ) -> None:
+        """
+        topic may contain MQTT + / # wildcards. If include_topic is True,
+        func is called with the topic the message arrived on as well as
+        the message e.g. func(topic, message_dict)
+        """
         assert (
-            topic not in self.callbacks.keys()
+            topic not in self.callbacks
         ), f"Topic: {topic} already has a callback function registered"
+        TopicTrie.validate(topic)
+        self.callbacks.insert(topic, (func, include_topic))
+        self.subscriptions.add(topic)
+        # If not connected yet, on_connect will subscribe
+        if self.mqtt_connected:
+            self._subscribe(topic)
+
+    def _subscribe(self, topic: str) -> None:
         error, _ = self.client.subscribe(topic)
         if error != mqtt.MQTT_ERR_SUCCESS:
             self.logger.error(
                 f"Failed to subscribe to topic {topic}",
             )
-
         else:
-            self.callbacks[topic] = func
             self.logger.info(f"Subscribed to MQTT topic: {topic}")
 
     def remove_callback(self, topic: str) -> None:
-        assert topic in self.callbacks.keys(), (
+        assert topic in self.callbacks, (
             f"Attempted to remove topic ({topic}) that's not "
             "currently subscribed to"
         )
@@ -156,7 +326,8 @@ class MqttHandler:
             self.logger.error(f"Failed to unsubscribe from topic {topic}")
 
         else:
-            self.callbacks.pop(topic)
+            self.callbacks.remove(topic)
+            self.subscriptions.discard(topic)
             self.logger.info(f"Unsubscribed from MQTT topic: {topic}")
 
     def __enter__(self):
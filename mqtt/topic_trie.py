@@ -0,0 +1,131 @@
+# Standard imports
+from typing import Any, Optional
+
+# Third-party imports
+
+
+# Local imports
+
+
+class TopicTrie:
+    """
+    Maps MQTT topic filters (which may contain + and # wildcards) to values
+    and finds every value whose filter matches a topic. A lookup walks one
+    trie level per topic level so its cost depends on the depth of the
+    topic, not on how many filters are registered.
+    """
+
+    class _Node:
+        __slots__ = ("children", "value", "has_value")
+
+        def __init__(self):
+            self.children: dict[str, "TopicTrie._Node"] = {}
+            self.value: Any = None
+            self.has_value: bool = False
+
+    def __init__(self):
+        self._root = self._Node()
+        self._count: int = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, topic_filter: str) -> bool:
+        node = self._find(topic_filter)
+        return node is not None and node.has_value
+
+    @staticmethod
+    def validate(topic_filter: str) -> None:
+        levels = topic_filter.split("/")
+        for i, level in enumerate(levels):
+            if "#" in level and (level != "#" or i != len(levels) - 1):
+                raise ValueError(
+                    f"'#' must be the whole of the last level: {topic_filter}"
+                )
+            if "+" in level and level != "+":
+                raise ValueError(
+                    f"'+' must be a whole topic level: {topic_filter}"
+                )
+
+    def insert(self, topic_filter: str, value: Any) -> None:
+        self.validate(topic_filter)
+        node = self._root
+        for level in topic_filter.split("/"):
+            node = node.children.setdefault(level, self._Node())
+        if not node.has_value:
+            self._count += 1
+        node.value = value
+        node.has_value = True
+
+    def remove(self, topic_filter: str) -> None:
+        # Keep the path so empty branches can be pruned afterwards
+        path = [(None, self._root)]
+        for level in topic_filter.split("/"):
+            node = path[-1][1].children.get(level)
+            if node is None:
+                raise KeyError(topic_filter)
+            path.append((level, node))
+        node = path[-1][1]
+        if not node.has_value:
+            raise KeyError(topic_filter)
+        node.value = None
+        node.has_value = False
+        self._count -= 1
+
+        for i in range(len(path) - 1, 0, -1):
+            level, node = path[i]
+            if node.has_value or node.children:
+                break
+            del path[i - 1][1].children[level]
+
+    def get(self, topic_filter: str) -> Any:
+        node = self._find(topic_filter)
+        if node is None or not node.has_value:
+            raise KeyError(topic_filter)
+        return node.value
+
+    def match(self, topic: str) -> list[Any]:
+        """
+        Values of every filter matching topic
+        """
+        levels = topic.split("/")
+        result = []
+        # Wildcards don't match topics starting with $ (e.g. $SYS)
+        self._match(self._root, levels, 0, result, topic.startswith("$"))
+        return result
+
+    def _match(
+        self,
+        node: "_Node",
+        levels: list[str],
+        index: int,
+        result: list[Any],
+        system_topic: bool,
+    ) -> None:
+        wildcards_allowed = not (system_topic and index == 0)
+
+        # "a/#" also matches "a"
+        multi = node.children.get("#")
+        if multi is not None and multi.has_value and wildcards_allowed:
+            result.append(multi.value)
+
+        if index == len(levels):
+            if node.has_value:
+                result.append(node.value)
+            return
+
+        child = node.children.get(levels[index])
+        if child is not None:
+            self._match(child, levels, index + 1, result, system_topic)
+
+        single = node.children.get("+")
+        if single is not None and wildcards_allowed:
+            self._match(single, levels, index + 1, result, system_topic)
+
+    def _find(self, topic_filter: str) -> Optional["_Node"]:
+        node = self._root
+        for level in topic_filter.split("/"):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node
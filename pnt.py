@@ -1,6 +1,7 @@
 # Local imports
 import logging.handlers
 import time
+from typing import Callable, Optional
 import logging.config
 import pathlib
 import json
@@ -10,106 +11,141 @@ import json
 
 
 # Local imports
-from m0wut_drivers.ds2431 import DS2431
-from m0wut_drivers.rs485_message_handler import MessageHandler
-from m0wut_drivers.gps_monitor import GPSMonitor, GPSFixStatus
 from m0wut_drivers.git_helper import GitHelper
 import config
+from metrics.metrics import MetricsPublisher, PrometheusServer
+from scheduler.scheduler import Scheduler
 from sfp.primary import SFPPrimary
+from timing.aux_sync import AuxiliarySync
+from timing.quality_monitor import TimingQualityMonitor
 from warning_handler.warning_handler import WarningHandler
 
 
-class TimingReference:
-    def __init__(
-        self,
-        logger: logging.Logger,
-        is_master: bool = True,
-    ):
-        self.logger = logger
-        # EEPROM
-        self.eeprom = DS2431()
-
-        # GPS Monitor
-        if is_master:
-            self.gps_monitor = GPSMonitor()
-        else:
-            self.gps_monitor = None
-
-        # RS485 Traffic Handler
-        self.card_address = self.eeprom.read_card_address()
-        self.logger.info(f"Read card address as {self.card_address}")
-        self.message_handler = MessageHandler(
-            config.UART_RS485, 115200, config.GPIO_RS485_TRX, self.card_address
-        )
-
-    def wait_for_valid_timesync(self) -> None:
-        """
-        Blocks until time is synced. If this is a master reference,
-        the source is the GPS receiver, is this is an auxiliary reference
-        this is a NTP sync with a master reference
-        """
-
-        if self.gps_monitor:
-            while self.gps_monitor.get_fix_status() not in [
-                GPSFixStatus.FIX_2D,
-                GPSFixStatus.FIX_3D,
-            ]:
-                # self.led_status_red.toggle()
-                time.sleep(0.5)
-        else:
-            # @TODO NTP sync to master node
-            raise NotImplementedError
-
-
-def main(is_master: bool = True):
-    pass
+def main(
+    is_master: bool = True,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Optional[Callable[[float], None]] = None,
+    setup: Optional[Callable[[Scheduler, SFPPrimary], None]] = None,
+    until: Optional[Callable[[], bool]] = None,
+    handler_options: Optional[dict] = None,
+):
+    """
+    clock and sleep drive the main loop (see Scheduler), so a simulation
+    can run it on virtual time. setup(scheduler, sfp) is called once
+    everything is running, e.g. to add scenario tasks, and the loop exits
+    once until() returns True. handler_options are passed to the
+    WarningHandler the logging config creates, e.g. a different broker
+    """
     git_helper = GitHelper(pathlib.Path())
 
     # Setup logging
     config_file = pathlib.Path("logging_config.json")
     with open(config_file) as config_in:
-        logging.config.dictConfig(json.load(config_in))
+        logging_config = json.load(config_in)
+    if handler_options:
+        logging_config["handlers"]["warning_handler"].update(handler_options)
+    logging.config.dictConfig(logging_config)
     logger = logging.getLogger(__name__)
     logger.info(f"Software Version: {git_helper.get_git_version()}")
 
     # There's a nice function "getHandlerByName" but it's Python 3.12 only :(
     warning_handler = [
-        x for x in logging.getLogger().handlers if isinstance(x, WarningHandler)
+        x
+        for x in logging.getLogger().handlers
+        if isinstance(x, WarningHandler)
     ][0]
-    # Call warning handler tick function for first time to finish initialisation
+    # Lets auxiliary references find the primary to sync to
+    warning_handler.set_discovery_info(
+        role="primary" if is_master else "auxiliary"
+    )
+    # Call warning handler tick function for first time to finish
+    # initialisation
     warning_handler.tick()
 
-    with SFPPrimary(
+    # Each part of the application runs at its own rate, or when woken
+    scheduler = Scheduler(clock=clock, sleep=sleep)
+    warning_handler.on_mqtt_message = lambda: scheduler.wake("mqtt")
+    if warning_handler.mqtt is not None:
+        warning_handler.mqtt.on_message_queued = (
+            warning_handler.on_mqtt_message
+        )
+
+    metrics_server = PrometheusServer(
+        host=config.METRICS_HTTP_HOST, port=config.METRICS_HTTP_PORT
+    )
+    metrics_publisher = MetricsPublisher(
+        warning_handler.publish_telemetry,
+        period_s=config.METRICS_PERIOD_S,
+        clock=clock,
+    )
+
+    with metrics_server, SFPPrimary(
         i2c_bus=config.I2C_SFP_BUS,
         i2c_addr=config.I2C_SFP_ADDRESS,
         gpio_present=config.GPIO_SFP_PRESENT,
         gpio_tx_enable=config.GPIO_SFP_TX_ENABLE,
         gpio_tx_fault=config.GPIO_SFP_TX_FAULT,
         gpio_los=config.GPIO_SFP_LOS,
+        debounce_s=config.SFP_DEBOUNCE_S,
+        on_event=lambda delay_s: scheduler.wake("sfp", delay_s),
+        ddm_period_s=config.SFP_DDM_PERIOD_S,
+        publish_telemetry=warning_handler.publish_telemetry,
+        clock=clock,
     ) as sfp:
-        while True:
-            sfp.tick()
-            warning_handler.tick()
-            time.sleep(0.1)
-
-    # # Wait for time synchronisation
-    # reference = TimingReference(logger=logger, is_master=is_master)
-    # logger.info("Waiting for time synchronisation")
-    # reference.wait_for_valid_timesync()
-    # logger.info("Time synchronised. Starting main application!")
-    # reference.led_status_red.write(0)
-    # reference.led_status_green.write(1)
-
-    # # Here we go!
-
-    # x = 0
-    # while True:
-    #     # reference.led_comms_red.write(x & 0x01)
-    #     # reference.led_comms_green.write(x & 0x02)
-    #     # reference.led_status_red.write(x & 0x04)
-    #     # reference.led_status_green.write(x & 0x08)
-    #     x += 1
-    #     time.sleep(0.5)
+        scheduler.add_task("sfp", sfp.tick, period_s=config.SFP_TICK_PERIOD_S)
+        scheduler.add_task(
+            "mqtt",
+            warning_handler.tick_mqtt,
+            period_s=config.MQTT_TICK_PERIOD_S,
+        )
+        scheduler.add_task(
+            "leds",
+            warning_handler.tick_leds,
+            period_s=0.5 * warning_handler.blink_period_s,
+        )
+        scheduler.add_task(
+            "metrics", metrics_publisher.tick, period_s=config.METRICS_PERIOD_S
+        )
+        if is_master:
+            timing_monitor = TimingQualityMonitor(
+                gpsd=config.GPSD,
+                chronyc=config.CHRONYC,
+                publish_telemetry=warning_handler.publish_telemetry,
+                window=config.TIMING_WINDOW,
+                chrony_period_s=config.CHRONY_POLL_PERIOD_S,
+                min_satellites=config.GPS_MIN_SATELLITES,
+                max_hdop=config.GPS_MAX_HDOP,
+                max_rms_offset_s=config.TIMING_MAX_RMS_OFFSET_S,
+                holdover_max_error_s=config.HOLDOVER_MAX_ERROR_S,
+                clock=clock,
+            )
+            scheduler.add_task(
+                "timing",
+                timing_monitor.tick,
+                period_s=config.TIMING_TICK_PERIOD_S,
+            )
+        else:
+            aux_sync = AuxiliarySync(
+                chronyc=config.CHRONYC,
+                max_offset_s=config.AUX_SYNC_MAX_OFFSET_S,
+                window=config.AUX_SYNC_WINDOW,
+                min_samples=config.AUX_SYNC_MIN_SAMPLES,
+                poll_period_s=config.AUX_SYNC_POLL_PERIOD_S,
+                clock=clock,
+            )
+            warning_handler.add_discovery_listener(aux_sync.on_discovery)
+            scheduler.add_task(
+                "timesync",
+                aux_sync.tick,
+                period_s=config.AUX_SYNC_POLL_PERIOD_S,
+            )
+        if setup is not None:
+            setup(scheduler, sfp)
+        try:
+            scheduler.run(until=until)
+        finally:
+            scheduler.log_statistics()
+            config.I2C_SFP_BUS.log_statistics()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,275 @@
+# Standard imports
+from dataclasses import dataclass
+from typing import Callable, Optional
+import asyncio
+import logging
+
+# Third-party imports
+import serial
+
+# Local imports
+from m0wut_drivers.gpio import GPIO
+from rs485.capture import RX, TX, TrafficCapture
+from rs485.framing import FrameParser, RS485Packet
+
+
+@dataclass
+class AsyncRS485Statistics:
+    requests: int = 0
+    responses: int = 0
+    timeouts: int = 0
+    crc_errors: int = 0
+    # Bytes thrown away after the TX -> RX switch or between frames
+    glitch_bytes_discarded: int = 0
+    # Valid frames that didn't match an outstanding request
+    unsolicited: int = 0
+
+
+@dataclass
+class _Request:
+    packet: RS485Packet
+    timeout_s: float
+    future: asyncio.Future
+
+
+class AsyncRS485Transport:
+    """
+    asyncio version of MessageHandler. query() queues a request and
+    returns once its response arrives (or it times out), without blocking
+    the event loop, so any number of callers can have queries waiting.
+
+    The bus is half duplex, so a single writer task sends one request at
+    a time and waits for its response before the next. Each request gets
+    a sequence number which the card echoes. Responses are matched to
+    waiting requests by it, so a late answer to a timed-out request
+    doesn't get mistaken for the answer to the next one.
+
+    tx_guard_s is waited after enabling the driver before transmitting,
+    and rx_guard_s after the last byte has left before switching back to
+    receive. Anything received while switching is discarded and counted.
+    A partial frame is given up on once the line has been quiet for
+    idle_gap_s.
+
+    Ports without a file descriptor are read from a worker thread, which
+    is parked (after its last read has been handled) while transmitting
+    so the port's input isn't touched from two threads at once.
+    """
+
+    TX = 1
+    RX = 0
+
+    def __init__(
+        self,
+        port: serial.Serial,
+        gpio: GPIO,
+        timeout_s: float = 0.2,
+        tx_guard_s: float = 0,
+        rx_guard_s: float = 0,
+        idle_gap_s: float = 0.005,
+        on_unsolicited: Optional[Callable[[RS485Packet], None]] = None,
+        capture: Optional[TrafficCapture] = None,
+    ):
+        self.port = port
+        self.gpio = gpio
+        self.timeout_s = timeout_s
+        self.tx_guard_s = tx_guard_s
+        self.rx_guard_s = rx_guard_s
+        self.idle_gap_s = idle_gap_s
+        self.on_unsolicited = on_unsolicited
+        self.capture = capture
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.statistics = AsyncRS485Statistics()
+        self.parser = FrameParser()
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._requests: asyncio.Queue[_Request] = asyncio.Queue()
+        # Sequence number -> future for its response
+        self._waiting: dict[int, asyncio.Future] = {}
+        self._sequence: int = 0
+        self._tasks: list[asyncio.Task] = []
+        self._fd: Optional[int] = None
+        self._idle_timer: Optional[asyncio.TimerHandle] = None
+        # Worker thread reads only: cleared to ask _read_loop() to stop
+        # reading, which sets _read_parked once it has
+        self._read_allowed = asyncio.Event()
+        self._read_parked = asyncio.Event()
+
+        self.gpio.set_direction(GPIO.OUTPUT)
+        self.gpio.write(self.RX)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        await self.stop()
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self.port.reset_input_buffer()
+        try:
+            self._fd = self.port.fileno()
+        except (AttributeError, OSError):
+            self._fd = None
+        if self._fd is not None:
+            # Non-blocking reads when the event loop says data is waiting
+            self.port.timeout = 0
+            self._loop.add_reader(self._fd, self._on_readable)
+        else:
+            # Ports without a file descriptor (e.g. simulated) are read
+            # from a worker thread. A read returning nothing means the
+            # line has been idle, and transmitting waits for it to return
+            self.port.timeout = self.idle_gap_s
+            self._read_allowed.set()
+            self._tasks.append(asyncio.create_task(self._read_loop()))
+        self._tasks.append(asyncio.create_task(self._write_loop()))
+
+    async def stop(self) -> None:
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        for future in self._waiting.values():
+            if not future.done():
+                future.cancel()
+        self._waiting.clear()
+
+    # ----- Public API -----
+
+    async def query(
+        self, packet: RS485Packet, timeout_s: Optional[float] = None
+    ) -> Optional[RS485Packet]:
+        """
+        Sends packet and returns the response, or None if none arrived
+        within timeout_s of it being sent
+        """
+        future = self._loop.create_future()
+        await self._requests.put(
+            _Request(
+                packet,
+                timeout_s if timeout_s is not None else self.timeout_s,
+                future,
+            )
+        )
+        return await future
+
+    # ----- Internals -----
+
+    def _next_sequence(self) -> int:
+        # Skip any still waiting, which can only happen with >255 queued
+        for _ in range(256):
+            self._sequence = (self._sequence + 1) % 256
+            if self._sequence not in self._waiting:
+                return self._sequence
+        raise RuntimeError("No free RS485 sequence numbers")
+
+    async def _write_loop(self) -> None:
+        while True:
+            request = await self._requests.get()
+            if request.future.cancelled():
+                continue
+            request.packet.sequence = self._next_sequence()
+            response = self._loop.create_future()
+            self._waiting[request.packet.sequence] = response
+            try:
+                await self._transmit(request.packet.encode())
+                self.statistics.requests += 1
+                result = await asyncio.wait_for(
+                    response, timeout=request.timeout_s
+                )
+                self.statistics.responses += 1
+            except asyncio.TimeoutError:
+                self.statistics.timeouts += 1
+                result = None
+            except OSError as e:
+                self.logger.error(f"RS485 transmit failed: {e}")
+                result = None
+            finally:
+                self._waiting.pop(request.packet.sequence, None)
+            if not request.future.done():
+                request.future.set_result(result)
+
+    async def _transmit(self, frame: bytes) -> None:
+        if self._fd is None:
+            # Wait for any read in progress to finish and be handled
+            self._read_allowed.clear()
+            await self._read_parked.wait()
+            try:
+                await self._transmit_frame(frame)
+            finally:
+                self._read_allowed.set()
+        else:
+            await self._transmit_frame(frame)
+
+    async def _transmit_frame(self, frame: bytes) -> None:
+        self.gpio.write(self.TX)
+        try:
+            if self.tx_guard_s:
+                await asyncio.sleep(self.tx_guard_s)
+            self.port.write(frame)
+            # Wait for the UART to empty before releasing the bus
+            await self._loop.run_in_executor(None, self.port.flush)
+            if self.rx_guard_s:
+                await asyncio.sleep(self.rx_guard_s)
+        finally:
+            self.gpio.write(self.RX)
+        if self.capture is not None:
+            self.capture.record(TX, frame)
+        # Changing direction glitches the RX line
+        self.statistics.glitch_bytes_discarded += self.port.in_waiting
+        self.port.reset_input_buffer()
+        self.parser.reset()
+
+    def _on_readable(self) -> None:
+        try:
+            data = self.port.read(self.port.in_waiting or 1)
+        except (OSError, serial.SerialException) as e:
+            self.logger.error(f"RS485 read failed: {e}")
+            return
+        self._received(data)
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+        if self.parser.buffer:
+            self._idle_timer = self._loop.call_later(
+                self.idle_gap_s, self._received_idle
+            )
+
+    async def _read_loop(self) -> None:
+        while True:
+            if not self._read_allowed.is_set():
+                self._read_parked.set()
+                await self._read_allowed.wait()
+                self._read_parked.clear()
+            data = await self._loop.run_in_executor(
+                None, lambda: self.port.read(max(1, self.port.in_waiting))
+            )
+            if data:
+                self._received(data)
+            else:
+                self._received_idle()
+
+    def _received(self, data: bytes) -> None:
+        if self.capture is not None:
+            self.capture.record(RX, data)
+        self._dispatch(self.parser.feed(data))
+
+    def _received_idle(self) -> None:
+        self._dispatch(self.parser.idle())
+
+    def _dispatch(self, packets: list[RS485Packet]) -> None:
+        self.statistics.crc_errors = self.parser.crc_errors
+        self.statistics.glitch_bytes_discarded += self.parser.discarded_bytes
+        self.parser.discarded_bytes = 0
+        for packet in packets:
+            future = self._waiting.get(packet.sequence)
+            if future is not None and not future.done():
+                future.set_result(packet)
+                continue
+            self.statistics.unsolicited += 1
+            self.logger.debug("Unsolicited RS485 frame: %s", packet)
+            if self.on_unsolicited is not None:
+                self.on_unsolicited(packet)
@@ -0,0 +1,202 @@
+# Standard imports
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Callable, Optional
+import logging
+
+# Third-party imports
+
+
+# Local imports
+from message_handler import MessageHandler
+from rs485.framing import RS485Packet
+
+
+@dataclass
+class CardStats:
+    polls: int = 0
+    responses: int = 0
+    timeouts: int = 0
+    consecutive_timeouts: int = 0
+    # Smoothed round trip time and its mean deviation, as TCP does
+    srtt_s: Optional[float] = None
+    rttvar_s: float = 0
+    last_rtt_s: float = 0
+    min_rtt_s: float = 0
+    max_rtt_s: float = 0
+
+
+@dataclass
+class Card:
+    address: int
+    command: int
+    period_s: float
+    on_response: Optional[Callable[[RS485Packet], None]] = None
+    payload: bytes = b""
+    next_poll: float = 0
+    stats: CardStats = field(default_factory=CardStats)
+
+    @property
+    def responding(self) -> bool:
+        return self.stats.consecutive_timeouts == 0
+
+
+class BusMaster:
+    """
+    Polls the cards on the RS485 bus from a table of address, command
+    and period. Each tick() polls the due cards back to back, most
+    overdue first, until tick_budget_s is used up.
+
+    Each card's timeout adapts to its measured round trip time
+    (smoothed RTT + 4 x deviation, clamped to min/max_timeout_s) so a
+    quick card doesn't pay for a slow one. Each timeout doubles the
+    card's timeout, up to max_timeout_s, until it answers again (RFC 6298
+    5.5) so a card that's slowed down past its estimate is still heard.
+    A card that doesn't answer is polled exponentially less often, up to
+    max_backoff_s, so an empty slot or dead card doesn't eat the bus.
+    """
+
+    # Gains for the RTT estimate (RFC 6298)
+    RTT_ALPHA = 1 / 8
+    RTT_BETA = 1 / 4
+
+    def __init__(
+        self,
+        message_handler: MessageHandler,
+        min_timeout_s: float = 0.005,
+        max_timeout_s: float = 0.2,
+        max_backoff_s: float = 30,
+        tick_budget_s: float = 0.05,
+        clock: Callable[[], float] = monotonic,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.message_handler = message_handler
+        self.min_timeout_s = min_timeout_s
+        self.max_timeout_s = max_timeout_s
+        self.max_backoff_s = max_backoff_s
+        self.tick_budget_s = tick_budget_s
+        self.clock = clock
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.cards: dict[int, Card] = {}
+
+    def add_card(
+        self,
+        address: int,
+        command: int,
+        period_s: float,
+        on_response: Optional[Callable[[RS485Packet], None]] = None,
+        payload: bytes = b"",
+    ) -> Card:
+        assert address not in self.cards, f"Card {address} already exists"
+        card = Card(
+            address=address,
+            command=command,
+            period_s=period_s,
+            on_response=on_response,
+            payload=payload,
+            next_poll=self.clock(),
+        )
+        self.cards[address] = card
+        return card
+
+    def remove_card(self, address: int) -> None:
+        self.cards.pop(address, None)
+
+    def timeout_for(self, card: Card) -> float:
+        stats = card.stats
+        if stats.srtt_s is None:
+            # Nothing measured yet
+            return self.max_timeout_s
+        timeout = max(self.min_timeout_s, stats.srtt_s + 4 * stats.rttvar_s)
+        # Back off until the next response, which resets the count
+        if stats.consecutive_timeouts:
+            timeout *= 2 ** min(stats.consecutive_timeouts, 32)
+        return min(self.max_timeout_s, timeout)
+
+    def next_poll_in(self) -> Optional[float]:
+        """
+        Time until the next card is due, None if there are no cards
+        """
+        if not self.cards:
+            return None
+        next_poll = min(x.next_poll for x in self.cards.values())
+        return max(0, next_poll - self.clock())
+
+    def tick(self) -> None:
+        start = self.clock()
+        due = sorted(
+            (x for x in self.cards.values() if x.next_poll <= start),
+            key=lambda x: x.next_poll,
+        )
+        for card in due:
+            self.poll(card)
+            if self.clock() - start >= self.tick_budget_s:
+                # The rest stay due and go first next tick
+                break
+
+    def poll(self, card: Card) -> Optional[RS485Packet]:
+        stats = card.stats
+        stats.polls += 1
+        sent = self.clock()
+        response = self.message_handler.query(
+            RS485Packet(card.address, card.command, card.payload),
+            timeout=self.timeout_for(card),
+        )
+        now = self.clock()
+
+        if response is None:
+            stats.timeouts += 1
+            stats.consecutive_timeouts += 1
+            if stats.consecutive_timeouts == 1:
+                self.logger.warning(
+                    f"RS485 card {card.address} stopped responding"
+                )
+            backoff = min(
+                card.period_s * 2**stats.consecutive_timeouts,
+                self.max_backoff_s,
+            )
+            card.next_poll = now + max(backoff, card.period_s)
+            return None
+
+        if not card.responding:
+            self.logger.info(
+                f"RS485 card {card.address} responding again after "
+                f"{stats.consecutive_timeouts} timeouts"
+            )
+        stats.consecutive_timeouts = 0
+        stats.responses += 1
+        self._update_rtt(stats, now - sent)
+        # Keep to the period rather than drifting by the RTT each poll,
+        # but don't try to catch up if we've fallen behind
+        card.next_poll = max(card.next_poll + card.period_s, now)
+        if card.on_response is not None:
+            card.on_response(response)
+        return response
+
+    def _update_rtt(self, stats: CardStats, rtt: float) -> None:
+        stats.last_rtt_s = rtt
+        if stats.srtt_s is None:
+            stats.srtt_s = rtt
+            stats.rttvar_s = rtt / 2
+            stats.min_rtt_s = rtt
+            stats.max_rtt_s = rtt
+            return
+        stats.rttvar_s += self.RTT_BETA * (
+            abs(stats.srtt_s - rtt) - stats.rttvar_s
+        )
+        stats.srtt_s += self.RTT_ALPHA * (rtt - stats.srtt_s)
+        stats.min_rtt_s = min(rtt, stats.min_rtt_s)
+        stats.max_rtt_s = max(rtt, stats.max_rtt_s)
+
+    def log_statistics(self) -> None:
+        for address, card in sorted(self.cards.items()):
+            stats = card.stats
+            srtt = stats.srtt_s if stats.srtt_s is not None else 0
+            self.logger.info(
+                f"RS485 card {address}: {stats.polls} polls, "
+                f"{stats.responses} responses, {stats.timeouts} timeouts, "
+                f"RTT mean {srtt * 1e3:.3f} ms, "
+                f"min {stats.min_rtt_s * 1e3:.3f} ms, "
+                f"max {stats.max_rtt_s * 1e3:.3f} ms, "
+                f"timeout {self.timeout_for(card) * 1e3:.3f} ms"
+            )
@@ -0,0 +1,297 @@
+# Standard imports
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import monotonic, time
+from typing import Callable, Iterator, Optional
+import argparse
+import mmap
+import struct
+import sys
+
+# Third-party imports
+
+
+# Local imports
+from rs485.framing import FrameParser, RS485Packet
+
+
+# Capture file layout: header, then a ring of records. Each record is a
+# monotonic timestamp, direction and length followed by the raw bytes
+MAGIC = b"RS485CAP"
+VERSION = 1
+# magic, version, wall clock time at start, capacity, head, tail, count
+HEADER = struct.Struct(">8sBxxxdIIII")
+RECORD = struct.Struct(">dBH")
+TX = 0
+RX = 1
+# Marks the rest of the ring as unused, the next record is at the start
+WRAP = 0xFF
+
+
+@dataclass
+class CaptureRecord:
+    timestamp: float
+    direction: int
+    data: bytes
+
+
+class TrafficCapture:
+    """
+    Records raw RS485 bytes sent and received into a fixed size ring file,
+    overwriting the oldest records once it's full. The file is memory
+    mapped, so recording is a copy into memory rather than a write()
+    call per packet, and nothing is formatted until the capture is read
+    back.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        capacity: int = 1024 * 1024,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.path = Path(path)
+        self.capacity = capacity
+        self.clock = clock
+        self.head: int = 0
+        self.tail: int = 0
+        self.count: int = 0
+        self.start_time = time()
+
+        with open(self.path, "wb") as f:
+            f.truncate(HEADER.size + capacity)
+        self._file = open(self.path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), HEADER.size + capacity)
+        self._write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def close(self) -> None:
+        if self._map.closed:
+            return
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+    def record(self, direction: int, data: bytes) -> None:
+        size = RECORD.size + len(data)
+        if size > self.capacity // 2:
+            raise ValueError(f"Record of {size} bytes too big for capture")
+        if self.head + size > self.capacity:
+            # Doesn't fit before the end, so mark the rest as unused and
+            # carry on from the start
+            self._evict(self.head, self.capacity)
+            if self.capacity - self.head >= RECORD.size:
+                RECORD.pack_into(
+                    self._map, HEADER.size + self.head, 0, WRAP, 0
+                )
+            self.head = 0
+        self._evict(self.head, self.head + size)
+        if self.count == 0:
+            self.tail = self.head
+
+        offset = HEADER.size + self.head
+        RECORD.pack_into(self._map, offset, self.clock(), direction, len(data))
+        self._map[offset + RECORD.size:offset + size] = data
+        self.head += size
+        self.count += 1
+        self._write_header()
+
+    def _evict(self, start: int, end: int) -> None:
+        # Drops the oldest records until none start in [start, end)
+        while self.count and start <= self.tail < end:
+            if self.capacity - self.tail < RECORD.size:
+                self.tail = 0
+                continue
+            _, direction, length = RECORD.unpack_from(
+                self._map, HEADER.size + self.tail
+            )
+            if direction == WRAP:
+                self.tail = 0
+                continue
+            self.tail += RECORD.size + length
+            self.count -= 1
+
+    def _write_header(self) -> None:
+        HEADER.pack_into(
+            self._map,
+            0,
+            MAGIC,
+            VERSION,
+            self.start_time,
+            self.capacity,
+            self.head,
+            self.tail,
+            self.count,
+        )
+
+
+def read_capture(path: Path) -> Iterator[CaptureRecord]:
+    """
+    Yields the records in a capture file, oldest first
+    """
+    data = Path(path).read_bytes()
+    magic, version, _, capacity, _, tail, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not an RS485 capture")
+    position = tail
+    while count:
+        if capacity - position < RECORD.size:
+            position = 0
+            continue
+        offset = HEADER.size + position
+        timestamp, direction, length = RECORD.unpack_from(data, offset)
+        if direction == WRAP:
+            position = 0
+            continue
+        start = offset + RECORD.size
+        yield CaptureRecord(timestamp, direction, data[start:start + length])
+        position += RECORD.size + length
+        count -= 1
+
+
+@dataclass
+class Exchange:
+    request: RS485Packet
+    sent: float
+    response: Optional[RS485Packet] = None
+    # First byte back, and the response complete
+    first_byte: Optional[float] = None
+    received: Optional[float] = None
+    crc_errors: int = 0
+
+
+@dataclass
+class AddressSummary:
+    requests: int = 0
+    responses: int = 0
+    timeouts: int = 0
+    crc_errors: int = 0
+    turnaround_s: list[float] = field(default_factory=list)
+    round_trip_s: list[float] = field(default_factory=list)
+
+
+def reconstruct_exchanges(
+    records: Iterator[CaptureRecord],
+) -> Iterator[Exchange]:
+    """
+    Pairs each request sent with the response carrying its sequence
+    number, received before the next request
+    """
+    tx_parser = FrameParser()
+    rx_parser = FrameParser()
+    current: Optional[Exchange] = None
+    for record in records:
+        if record.direction == TX:
+            for packet in tx_parser.feed(record.data):
+                if current is not None:
+                    yield current
+                current = Exchange(packet, record.timestamp)
+                rx_parser = FrameParser()
+            continue
+        if current is None:
+            continue
+        if current.first_byte is None:
+            current.first_byte = record.timestamp
+        crc_errors = rx_parser.crc_errors
+        for packet in rx_parser.feed(record.data):
+            if current.response is None and (
+                packet.sequence == current.request.sequence
+            ):
+                current.response = packet
+                current.received = record.timestamp
+        current.crc_errors += rx_parser.crc_errors - crc_errors
+    if current is not None:
+        yield current
+
+
+def summarise(exchanges: Iterator[Exchange]) -> dict[int, AddressSummary]:
+    summaries: dict[int, AddressSummary] = {}
+    for exchange in exchanges:
+        summary = summaries.setdefault(
+            exchange.request.address, AddressSummary()
+        )
+        summary.requests += 1
+        summary.crc_errors += exchange.crc_errors
+        if exchange.response is None:
+            summary.timeouts += 1
+            continue
+        summary.responses += 1
+        summary.turnaround_s.append(exchange.first_byte - exchange.sent)
+        summary.round_trip_s.append(exchange.received - exchange.sent)
+    return summaries
+
+
+def _ms(values: list[float]) -> str:
+    if not values:
+        return "-"
+    return (
+        f"{min(values) * 1e3:.3f}/{sum(values) / len(values) * 1e3:.3f}/"
+        f"{max(values) * 1e3:.3f}"
+    )
+
+
+def replay(path: Path) -> int:
+    """
+    Sends each recorded request through a MessageHandler on a port that
+    answers with the recorded bytes, and checks the handler decodes the
+    recorded response. Returns the number of mismatches
+    """
+    # Deferred as the handler needs the GPIO drivers
+    from message_handler import MessageHandler
+    from simulation.gpio import FakeGPIO
+    from simulation.rs485 import ReplaySerial
+
+    port = ReplaySerial(list(read_capture(path)))
+    handler = MessageHandler(FakeGPIO(), "", 0, timeout=0.05, port=port)
+    mismatches = 0
+    for exchange in reconstruct_exchanges(iter(port.records)):
+        handler.write(exchange.request)
+        response = handler.read()
+        if response != exchange.response:
+            mismatches += 1
+            print(
+                f"Request {exchange.request}: expected "
+                f"{exchange.response}, got {response}"
+            )
+    mismatches += port.tx_mismatches
+    return mismatches
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Inspect, analyse or replay an RS485 traffic capture"
+    )
+    parser.add_argument("command", choices=["dump", "analyse", "replay"])
+    parser.add_argument("capture", type=Path, help="Capture file")
+    args = parser.parse_args(argv)
+
+    if args.command == "dump":
+        for record in read_capture(args.capture):
+            direction = "TX" if record.direction == TX else "RX"
+            print(f"{record.timestamp:.6f} {direction} {record.data.hex(' ')}")
+    elif args.command == "analyse":
+        exchanges = reconstruct_exchanges(read_capture(args.capture))
+        summaries = summarise(exchanges)
+        print(
+            "address requests responses timeouts crc_errors "
+            "turnaround_ms(min/mean/max) round_trip_ms(min/mean/max)"
+        )
+        for address, summary in sorted(summaries.items()):
+            print(
+                f"{address} {summary.requests} {summary.responses} "
+                f"{summary.timeouts} {summary.crc_errors} "
+                f"{_ms(summary.turnaround_s)} {_ms(summary.round_trip_s)}"
+            )
+    else:
+        mismatches = replay(args.capture)
+        print(f"{mismatches} mismatches")
+        sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
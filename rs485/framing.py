@@ -0,0 +1,127 @@
+# Standard imports
+from binascii import crc_hqx
+from dataclasses import dataclass
+import struct
+
+# Third-party imports
+
+
+# Local imports
+
+
+# Frame layout: sync, address, sequence, command, payload length, payload,
+# CRC16. The CRC (CRC-16/CCITT-FALSE, big endian) covers address to
+# payload. Cards echo the sequence number of the request they answer
+SYNC = 0xA5
+HEADER = struct.Struct(">BBBBB")
+CRC = struct.Struct(">H")
+MAX_PAYLOAD_LENGTH = 255
+MAX_FRAME_LENGTH = HEADER.size + MAX_PAYLOAD_LENGTH + CRC.size
+
+
+def crc16(data: bytes) -> int:
+    return crc_hqx(data, 0xFFFF)
+
+
+@dataclass
+class RS485Packet:
+    address: int
+    command: int
+    payload: bytes = b""
+    sequence: int = 0
+
+    def encode(self) -> bytes:
+        if len(self.payload) > MAX_PAYLOAD_LENGTH:
+            raise ValueError(
+                f"RS485 payload over {MAX_PAYLOAD_LENGTH} bytes "
+                f"({len(self.payload)})"
+            )
+        header = HEADER.pack(
+            SYNC,
+            self.address,
+            self.sequence,
+            self.command,
+            len(self.payload),
+        )
+        body = header[1:] + self.payload
+        return header[:1] + body + CRC.pack(crc16(body))
+
+
+class FrameParser:
+    """
+    Incremental decoder for RS485 frames. Bytes can be fed in chunks split
+    anywhere. Anything before a sync byte is discarded, and a frame with
+    a bad CRC is rejected by skipping its sync byte and searching again,
+    so the parser resynchronises on the next real frame.
+
+    A sync byte in noise can look like the start of a long frame and hold
+    back real frames behind it until enough bytes arrive to check its
+    CRC. Calling idle() when the line goes quiet gives up on an
+    incomplete frame and re-parses whatever followed it.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.frames: int = 0
+        self.crc_errors: int = 0
+        self.discarded_bytes: int = 0
+
+    def reset(self) -> None:
+        self.discarded_bytes += len(self.buffer)
+        self.buffer.clear()
+
+    def feed(self, data: bytes) -> list[RS485Packet]:
+        """
+        Adds received bytes and returns every frame they complete
+        """
+        self.buffer += data
+        packets = []
+        while True:
+            start = self.buffer.find(SYNC)
+            if start < 0:
+                self.discarded_bytes += len(self.buffer)
+                self.buffer.clear()
+                return packets
+            if start:
+                self.discarded_bytes += start
+                del self.buffer[:start]
+
+            if len(self.buffer) < HEADER.size:
+                return packets
+            _, address, sequence, command, length = HEADER.unpack_from(
+                self.buffer
+            )
+            end = HEADER.size + length + CRC.size
+            if len(self.buffer) < end:
+                return packets
+
+            (crc,) = CRC.unpack_from(self.buffer, end - CRC.size)
+            if crc != crc16(self.buffer[1:end - CRC.size]):
+                # Probably a sync byte in noise or a corrupted frame
+                self.crc_errors += 1
+                self.discarded_bytes += 1
+                del self.buffer[:1]
+                continue
+
+            packets.append(
+                RS485Packet(
+                    address=address,
+                    command=command,
+                    payload=bytes(self.buffer[HEADER.size:end - CRC.size]),
+                    sequence=sequence,
+                )
+            )
+            self.frames += 1
+            del self.buffer[:end]
+
+    def idle(self) -> list[RS485Packet]:
+        """
+        Call when nothing has been received for at least a frame gap.
+        Returns any frames found after discarding an incomplete one
+        """
+        packets = []
+        while self.buffer:
+            self.discarded_bytes += 1
+            del self.buffer[:1]
+            packets += self.feed(b"")
+        return packets
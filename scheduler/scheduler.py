@@ -0,0 +1,253 @@
+# Standard imports
+from dataclasses import dataclass, field
+from threading import Condition
+from time import monotonic
+from typing import Callable, Optional
+import heapq
+import logging
+
+# Third-party imports
+
+
+# Local imports
+from metrics.metrics import REGISTRY, Histogram, MetricsRegistry
+
+
+@dataclass
+class TaskStats:
+    runs: int = 0
+    # Runs that took longer than the task's period
+    overruns: int = 0
+    # Deadlines skipped because the task was more than a period late
+    missed_deadlines: int = 0
+    last_run_time_s: float = 0
+    max_run_time_s: float = 0
+    total_run_time_s: float = 0
+    # How late the task started relative to its deadline
+    max_lateness_s: float = 0
+
+    @property
+    def mean_run_time_s(self) -> float:
+        if self.runs == 0:
+            return 0
+        return self.total_run_time_s / self.runs
+
+
+@dataclass
+class Task:
+    name: str
+    func: Callable[[], None]
+    # None for a task that only runs when woken
+    period_s: Optional[float]
+    stats: TaskStats = field(default_factory=TaskStats)
+    run_time: Optional[Histogram] = None
+    lateness: Optional[Histogram] = None
+    # Bumped whenever the task is rescheduled so older heap entries for it
+    # can be recognised and skipped
+    generation: int = 0
+    deadline: Optional[float] = None
+
+
+class Scheduler:
+    """
+    Cooperative scheduler for the main loop. Each component registers a
+    task with its own period and/or gets woken (from any thread) when it
+    has something to do. Tasks run in deadline order from a heap and the
+    scheduler sleeps until the next deadline or wake-up, rather than
+    polling everything at a fixed rate.
+
+    Tasks run to completion so must not block. Per-task run times are
+    recorded and a run taking longer than the task's period is counted as
+    an overrun. Overruns are only logged at debug level. WarningHandler
+    ignores that level, so a slow tick doesn't light the warning LED or
+    get broadcast to every node.
+
+    clock and sleep can be replaced (e.g. with virtual time for
+    simulation). With a custom sleep, wake() from another thread can't
+    interrupt it.
+
+    Run times and lateness are also recorded as histograms in metrics,
+    labelled by task.
+    """
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = monotonic,
+        sleep: Optional[Callable[[float], None]] = None,
+        logger: Optional[logging.Logger] = None,
+        metrics: MetricsRegistry = REGISTRY,
+    ):
+        self.clock = clock
+        self.sleep = sleep
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.metrics = metrics
+        self.tasks: dict[str, Task] = {}
+        self._heap: list[tuple[float, int, int, Task]] = []
+        self._sequence: int = 0
+        self._condition = Condition()
+        self._running: bool = False
+
+    def add_task(
+        self,
+        name: str,
+        func: Callable[[], None],
+        period_s: Optional[float] = None,
+        start_delay_s: float = 0,
+    ) -> Task:
+        assert name not in self.tasks, f"Task {name} already exists"
+        task = Task(
+            name=name,
+            func=func,
+            period_s=period_s,
+            run_time=self.metrics.histogram(
+                "scheduler_task_run_seconds",
+                "Time taken by each run of a main loop task",
+                {"task": name},
+            ),
+            lateness=self.metrics.histogram(
+                "scheduler_task_lateness_seconds",
+                "How late each main loop task started",
+                {"task": name},
+            ),
+        )
+        self.tasks[name] = task
+        if period_s is not None:
+            with self._condition:
+                self._schedule(task, self.clock() + start_delay_s)
+        return task
+
+    def remove_task(self, name: str) -> None:
+        with self._condition:
+            task = self.tasks.pop(name)
+            # Invalidates anything left in the heap for it
+            task.generation += 1
+
+    def wake(self, name: str, delay_s: float = 0) -> None:
+        """
+        Runs the named task as soon as possible, or within delay_s if
+        given, e.g. once an input has finished debouncing. Never delays a
+        run that's already due sooner. Safe to call from any thread, e.g.
+        GPIO or MQTT callbacks
+        """
+        with self._condition:
+            task = self.tasks.get(name)
+            if task is None:
+                return
+            deadline = self.clock() + delay_s
+            if task.deadline is None or task.deadline > deadline:
+                self._schedule(task, deadline)
+            self._condition.notify()
+
+    def run_once(self) -> Optional[float]:
+        """
+        Runs every task that is due. Returns the time until the next
+        deadline, or None if nothing is scheduled
+        """
+        while True:
+            with self._condition:
+                task = self._pop_due()
+                if task is None:
+                    if not self._heap:
+                        return None
+                    return max(0, self._heap[0][0] - self.clock())
+                deadline = task.deadline
+                task.deadline = None
+            self._run(task, deadline)
+
+    def run(self, until: Optional[Callable[[], bool]] = None) -> None:
+        """
+        Runs tasks until stop() is called or until() returns True
+        """
+        self._running = True
+        while self._running and not (until and until()):
+            delay = self.run_once()
+            if self.sleep is not None:
+                self.sleep(delay if delay is not None else 1)
+                continue
+            with self._condition:
+                # Woken early by wake() or stop()
+                if self._running and not self._due():
+                    self._condition.wait(delay)
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def log_statistics(self) -> None:
+        for task in self.tasks.values():
+            stats = task.stats
+            self.logger.info(
+                f"Task {task.name}: {stats.runs} runs, "
+                f"mean {stats.mean_run_time_s * 1e3:.3f} ms, "
+                f"max {stats.max_run_time_s * 1e3:.3f} ms, "
+                f"max lateness {stats.max_lateness_s * 1e3:.3f} ms, "
+                f"{stats.overruns} overruns, "
+                f"{stats.missed_deadlines} missed deadlines"
+            )
+
+    def _schedule(self, task: Task, deadline: float) -> None:
+        # Must be called with self._condition held
+        task.generation += 1
+        task.deadline = deadline
+        self._sequence += 1
+        heapq.heappush(
+            self._heap, (deadline, self._sequence, task.generation, task)
+        )
+
+    def _due(self) -> bool:
+        # Must be called with self._condition held
+        self._discard_stale()
+        return bool(self._heap) and self._heap[0][0] <= self.clock()
+
+    def _discard_stale(self) -> None:
+        while self._heap and self._heap[0][2] != self._heap[0][3].generation:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self) -> Optional[Task]:
+        # Must be called with self._condition held
+        if not self._due():
+            return None
+        _, _, _, task = heapq.heappop(self._heap)
+        return task
+
+    def _run(self, task: Task, deadline: float) -> None:
+        start = self.clock()
+        try:
+            task.func()
+        except Exception:
+            self.logger.exception(f"Task {task.name} raised an exception")
+        end = self.clock()
+
+        stats = task.stats
+        run_time = end - start
+        stats.runs += 1
+        stats.last_run_time_s = run_time
+        stats.total_run_time_s += run_time
+        stats.max_run_time_s = max(run_time, stats.max_run_time_s)
+        stats.max_lateness_s = max(start - deadline, stats.max_lateness_s)
+        task.run_time.observe(run_time)
+        task.lateness.observe(max(0, start - deadline))
+
+        if task.period_s is None:
+            return
+        if run_time > task.period_s:
+            stats.overruns += 1
+            self.logger.debug(
+                f"Task {task.name} overran: took {run_time * 1e3:.1f} ms "
+                f"with period {task.period_s * 1e3:.1f} ms"
+            )
+
+        with self._condition:
+            if task.name not in self.tasks or task.deadline is not None:
+                # Removed, or woken again while running
+                return
+            next_deadline = deadline + task.period_s
+            if next_deadline < end:
+                # Fallen behind. Skip the missed deadlines rather than
+                # running back to back to catch up
+                stats.missed_deadlines += int(
+                    (end - next_deadline) // task.period_s
+                ) + 1
+                next_deadline = end + task.period_s
+            self._schedule(task, next_deadline)
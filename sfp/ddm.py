@@ -0,0 +1,217 @@
+# Standard library imports
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from enum import Enum
+from math import log10
+from time import monotonic
+from typing import Any, Callable, Optional
+import struct
+
+# Third-party library imports
+
+
+# Local imports
+from i2c.i2c_bus import I2CBus
+
+
+# SFF-8472 addresses / offsets
+DDM_I2C_ADDRESS = 0x51
+# A0h
+DIAGNOSTIC_MONITORING_TYPE = 92
+DDM_IMPLEMENTED = 0x40
+DDM_INTERNALLY_CALIBRATED = 0x20
+VENDOR_NAME = (20, 16)
+VENDOR_SERIAL = (68, 16)
+# A2h
+THRESHOLDS = (0, 40)
+DIAGNOSTICS = (96, 10)
+
+
+def _dbm(power_mw: float) -> Optional[float]:
+    # No light at all has no dBm value, None so it survives JSON encoding
+    if power_mw <= 0:
+        return None
+    return round(10 * log10(power_mw), 2)
+
+
+@dataclass
+class DDMReading:
+    temperature_c: float
+    vcc_v: float
+    tx_bias_ma: float
+    tx_power_mw: float
+    rx_power_mw: float
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DDMReading":
+        """
+        Decodes internally calibrated values as laid out at A2h bytes
+        96-105 (or the same layout in each row of the threshold table)
+        """
+        temperature, vcc, bias, tx_power, rx_power = struct.unpack(
+            ">hHHHH", bytes(data)
+        )
+        return cls(
+            temperature_c=temperature / 256,
+            vcc_v=vcc * 100e-6,
+            tx_bias_ma=bias * 2e-3,
+            tx_power_mw=tx_power * 1e-4,
+            rx_power_mw=rx_power * 1e-4,
+        )
+
+    def to_dict(self) -> dict[str, Optional[float]]:
+        # Compact and rounded to what the module actually resolves
+        return {
+            "temperature_c": round(self.temperature_c, 2),
+            "vcc_v": round(self.vcc_v, 4),
+            "tx_bias_ma": round(self.tx_bias_ma, 3),
+            "tx_power_dbm": _dbm(self.tx_power_mw),
+            "rx_power_dbm": _dbm(self.rx_power_mw),
+        }
+
+
+class DDMLevel(Enum):
+    NORMAL = 0
+    WARNING = 1
+    ALARM = 2
+
+
+@dataclass
+class DDMThresholds:
+    """
+    The module's own alarm / warning limits from A2h bytes 0-39
+    """
+
+    high_alarm: DDMReading
+    low_alarm: DDMReading
+    high_warning: DDMReading
+    low_warning: DDMReading
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DDMThresholds":
+        # Stored per quantity (temp, vcc, bias, tx, rx) as high alarm, low
+        # alarm, high warning, low warning. Reorder into one row per limit
+        words = struct.unpack(">20H", bytes(data))
+        rows = [struct.pack(">5H", *words[i::4]) for i in range(4)]
+        return cls(*(DDMReading.from_bytes(x) for x in rows))
+
+    def check(self, reading: DDMReading) -> dict[str, DDMLevel]:
+        """
+        Level of each quantity in reading against these thresholds
+        """
+        result = {}
+        for field in fields(DDMReading):
+            value = getattr(reading, field.name)
+            if value >= getattr(self.high_alarm, field.name) or (
+                value <= getattr(self.low_alarm, field.name)
+            ):
+                result[field.name] = DDMLevel.ALARM
+            elif value >= getattr(self.high_warning, field.name) or (
+                value <= getattr(self.low_warning, field.name)
+            ):
+                result[field.name] = DDMLevel.WARNING
+            else:
+                result[field.name] = DDMLevel.NORMAL
+        return result
+
+
+class SFPInfoCache:
+    """
+    Static A0h identification data for the last max_entries modules seen,
+    keyed by vendor name and serial number, so re-inserting a module
+    doesn't need the full EEPROM read
+    """
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[bytes, Any] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def read_key(i2c_bus: I2CBus, i2c_addr: int) -> bytes:
+        vendor, serial = i2c_bus.read_ranges(
+            i2c_addr, [VENDOR_NAME, VENDOR_SERIAL]
+        )
+        return bytes(vendor) + bytes(serial)
+
+    def get(self, key: bytes) -> Optional[Any]:
+        info = self._entries.get(key)
+        if info is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return info
+
+    def put(self, key: bytes, info: Any) -> None:
+        self._entries[key] = info
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class DDMPoller:
+    """
+    Reads an SFP's digital diagnostics (temperature, Vcc, TX bias, TX
+    power, RX power) every period_s, as a single block read of A2h bytes
+    96-105. Each reading is passed to on_reading along with the level
+    (normal / warning / alarm) of each quantity against the module's own
+    thresholds.
+    """
+
+    def __init__(
+        self,
+        i2c_bus: I2CBus,
+        on_reading: Callable[[DDMReading, dict[str, DDMLevel]], None],
+        period_s: float = 1,
+        i2c_addr: int = DDM_I2C_ADDRESS,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.i2c_bus = i2c_bus
+        self.on_reading = on_reading
+        self.period_s = period_s
+        self.i2c_addr = i2c_addr
+        self.clock = clock
+        self.thresholds: Optional[DDMThresholds] = None
+        self.last_reading: Optional[DDMReading] = None
+        self.next_poll: float = 0
+
+    @staticmethod
+    def supported(i2c_bus: I2CBus, a0_addr: int) -> bool:
+        """
+        True if the module implements internally calibrated DDM
+        """
+        monitoring_type = i2c_bus.read_byte_data(
+            a0_addr, DIAGNOSTIC_MONITORING_TYPE
+        )
+        return bool(monitoring_type & DDM_IMPLEMENTED) and bool(
+            monitoring_type & DDM_INTERNALLY_CALIBRATED
+        )
+
+    def start(self) -> None:
+        """
+        Reads the module's thresholds. Call when a module is inserted
+        """
+        data = self.i2c_bus.read_block(self.i2c_addr, *THRESHOLDS)
+        self.thresholds = DDMThresholds.from_bytes(data)
+        self.next_poll = self.clock()
+
+    def stop(self) -> None:
+        self.thresholds = None
+        self.last_reading = None
+
+    def read(self) -> DDMReading:
+        return DDMReading.from_bytes(
+            self.i2c_bus.read_block(self.i2c_addr, *DIAGNOSTICS)
+        )
+
+    def tick(self) -> None:
+        now = self.clock()
+        if self.thresholds is None or now < self.next_poll:
+            return
+        self.next_poll = now + self.period_s
+        self.last_reading = self.read()
+        self.on_reading(
+            self.last_reading, self.thresholds.check(self.last_reading)
+        )
@@ -0,0 +1,88 @@
+# Standard imports
+from time import monotonic
+from typing import Callable, Optional
+
+# Third-party library imports
+
+
+# Local imports
+from m0wut_drivers.gpio import GPIO
+
+
+class LineMonitor:
+    """
+    Debounced view of an SFP status line (present, TX fault, LOS).
+
+    If the GPIO supports edge events (has add_edge_callback()), the line
+    is only read when it changes and on_edge is called straight away from
+    the GPIO's callback thread, e.g. to wake the state machine. Otherwise,
+    or if the GPIO can't provide them, it falls back to reading the line
+    every time update() is called.
+
+    A change is only reported by update() once the line has held its new
+    level for debounce_s. settle_in() gives how long is left, so whatever
+    calls update() can come back exactly when the change is due.
+    """
+
+    def __init__(
+        self,
+        read: Callable[[], bool],
+        gpio: Optional[GPIO] = None,
+        debounce_s: float = 0,
+        on_edge: Optional[Callable[[bool], None]] = None,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.read = read
+        self.debounce_s = debounce_s
+        self.on_edge = on_edge
+        self.clock = clock
+        self.edges: int = 0
+        self.level: bool = False
+        self._raw_level: bool = False
+        # When the latest change will have been stable for debounce_s
+        self._settle_at: float = clock()
+        self.edge_driven: bool = False
+        if gpio is not None and hasattr(gpio, "add_edge_callback"):
+            try:
+                gpio.add_edge_callback(self._edge)
+                self.edge_driven = True
+            except OSError:
+                # e.g. the line is already claimed for edge events
+                pass
+        # Only read once edges are being reported, so a change in between
+        # can't be missed
+        self._raw_level = bool(read())
+        self.level = self._raw_level
+
+    def _edge(self, level: bool) -> None:
+        # Called from the GPIO's thread. Read the line rather than
+        # trusting level as it's already been through the drivers' polarity
+        self._sample()
+        self.edges += 1
+        if self.on_edge is not None:
+            self.on_edge(self._raw_level)
+
+    def _sample(self) -> None:
+        raw_level = bool(self.read())
+        if raw_level != self._raw_level:
+            self._raw_level = raw_level
+            self._settle_at = self.clock() + self.debounce_s
+
+    def update(self) -> bool:
+        """
+        Returns the debounced level of the line
+        """
+        if not self.edge_driven:
+            self._sample()
+        if self._raw_level != self.level and self.clock() >= self._settle_at:
+            self.level = self._raw_level
+        return self.level
+
+    def settle_in(self) -> Optional[float]:
+        """
+        Time until a change seen on the line will be reported by update(),
+        None if there's no change waiting
+        """
+        if self._raw_level == self.level:
+            return None
+        return max(0, self._settle_at - self.clock())
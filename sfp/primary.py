@@ -1,11 +1,17 @@
 # Standard library imports
 from enum import Enum, auto
+from time import monotonic
+from typing import Callable, Optional, Union
 
 # Third-party library imports
 import smbus2
 
 # Local imports
+from i2c.i2c_bus import I2CBus
+from metrics.metrics import REGISTRY, MetricsRegistry
 from sfp.common import SFP
+from sfp.line_monitor import LineMonitor
+from sfp.ddm import DDMLevel, DDMPoller, DDMReading, SFPInfoCache
 from m0wut_drivers.gpio import GPIO
 
 
@@ -20,13 +26,41 @@ class SFPPrimary(SFP):
 
     def __init__(
         self,
-        i2c_bus: smbus2.SMBus,
+        i2c_bus: Union[I2CBus, smbus2.SMBus],
         i2c_addr: int,
         gpio_present: GPIO,
         gpio_tx_enable: GPIO,
         gpio_tx_fault: GPIO,
         gpio_los: GPIO,
+        debounce_s: float = 0.05,
+        on_event: Optional[Callable[[float], None]] = None,
+        ddm_period_s: float = 1,
+        publish_telemetry: Optional[Callable[[str, dict], None]] = None,
+        info_cache: Optional[SFPInfoCache] = None,
+        clock: Callable[[], float] = monotonic,
+        metrics: MetricsRegistry = REGISTRY,
     ):
+        """
+        If the GPIOs support edge events, changes on the present, TX fault
+        and LOS lines call on_event(delay_s) (e.g. to wake whatever calls
+        tick() after delay_s) instead of waiting to be polled, and a TX
+        fault disables the laser immediately from the GPIO callback.
+        Present and LOS are debounced by debounce_s, so ask for tick() once
+        the change has settled. tick() also does this for changes that are
+        still settling, whether or not edges are available
+
+        While active, the module's diagnostics are read every ddm_period_s
+        and passed to publish_telemetry("sfp", values). Identification
+        data is cached by vendor / serial number in info_cache
+
+        A bare SMBus is wrapped in an I2CBus so the diagnostics can use
+        block transfers. Debouncing and DDM polling are timed by clock
+
+        The FSM state and transitions into each state are recorded in
+        metrics
+        """
+        if not isinstance(i2c_bus, I2CBus):
+            i2c_bus = I2CBus(i2c_bus)
         super().__init__(
             i2c_bus=i2c_bus,
             i2c_addr=i2c_addr,
@@ -36,8 +70,71 @@ class SFPPrimary(SFP):
             gpio_los=gpio_los,
         )
 
+        self.i2c_bus = i2c_bus
+        self.i2c_addr = i2c_addr
         self.state = self.FSMState.DISCONNECTED
         self.dev.disable_tx()
+        self.state_metric = metrics.gauge(
+            "sfp_state", "SFP FSM state (SFPPrimary.FSMState value)"
+        )
+        self.state_metric.set(self.state.value)
+        self.transition_metrics = {
+            x: metrics.counter(
+                "sfp_state_transitions_total",
+                "SFP FSM transitions into each state",
+                {"state": x.name.lower()},
+            )
+            for x in self.FSMState
+        }
+
+        self.info_cache = info_cache if info_cache else SFPInfoCache()
+        self.publish_telemetry = publish_telemetry
+        self.ddm = DDMPoller(
+            i2c_bus, self._on_ddm_reading, period_s=ddm_period_s, clock=clock
+        )
+        self.ddm_levels: dict[str, DDMLevel] = {}
+        self.ddm_failed: bool = False
+
+        self.on_event = on_event
+        self.debounce_s = debounce_s
+        self.present_line = LineMonitor(
+            self.dev.is_present,
+            gpio_present,
+            debounce_s=debounce_s,
+            on_edge=self._on_debounced_edge,
+            clock=clock,
+        )
+        # TX fault isn't debounced as it's a laser safety signal
+        self.tx_fault_line = LineMonitor(
+            self.dev.tx_fault,
+            gpio_tx_fault,
+            on_edge=self._on_tx_fault_edge,
+            clock=clock,
+        )
+        self.los_line = LineMonitor(
+            gpio_los.read,
+            gpio_los,
+            debounce_s=debounce_s,
+            on_edge=self._on_debounced_edge,
+            clock=clock,
+        )
+        self.los: bool = self.los_line.level
+        if not self.present_line.edge_driven:
+            self.logger.info(
+                "SFP GPIOs don't support edge events, polling instead"
+            )
+
+    def _on_debounced_edge(self, level: bool) -> None:
+        # Called from the GPIO's thread
+        if self.on_event is not None:
+            self.on_event(self.debounce_s)
+
+    def _on_tx_fault_edge(self, level: bool) -> None:
+        # Called from the GPIO's thread
+        if level and self.state == self.FSMState.ACTIVE:
+            self.dev.disable_tx()
+        if self.on_event is not None:
+            self.on_event(0)
 
     def tick(self):
         # Used as a jump table to function corresponding to
@@ -49,41 +146,136 @@ class SFPPrimary(SFP):
             self.FSMState.ACTIVE: self.in_active_state,
             self.FSMState.SFP_TX_FAULT: self.in_sfp_tx_fault_state,
         }
-        STATE_FUNCTIONS[self.state]()
+        state = self.state
+        STATE_FUNCTIONS[state]()
+        if self.state != state:
+            self.state_metric.set(self.state.value)
+            self.transition_metrics[self.state].inc()
+            if self.on_event is not None:
+                # Run the new state straight away rather than a period later
+                self.on_event(0)
+
+        los = self.los_line.update()
+        if los != self.los:
+            self.los = los
+            if self.state != self.FSMState.DISCONNECTED:
+                self.logger.info(
+                    f"SFP loss of signal {'asserted' if los else 'cleared'}"
+                )
+
+        if self.on_event is not None:
+            # Come back as soon as a change (including one seen again
+            # since the edge's wake-up) has been stable for long enough.
+            # Not every state reads every line, so update them all first
+            # or one that's settled would keep asking to come back now
+            settle_times = []
+            for line in (self.present_line, self.tx_fault_line, self.los_line):
+                line.update()
+                x = line.settle_in()
+                if x is not None:
+                    settle_times.append(x)
+            if settle_times:
+                self.on_event(min(settle_times))
 
     def in_disconnected_state(self):
-        if self.dev.is_present():
+        if self.present_line.update():
             self.logger.info("SFP Inserted, attempting to read data")
             self.state = self.FSMState.QUERYING_SFP
 
     def in_querying_sfp_state(self):
-        sfp_info = self.dev.read_sfp_info()
+        # Reading the serial number is much quicker than the whole of the
+        # identification data so check if we've seen this module before
+        try:
+            key = SFPInfoCache.read_key(self.i2c_bus, self.i2c_addr)
+            sfp_info = self.info_cache.get(key)
+        except OSError:
+            key = None
+            sfp_info = None
+
+        if sfp_info:
+            self.logger.debug("Using cached SFP info")
+        else:
+            sfp_info = self.dev.read_sfp_info()
+            if sfp_info and key is not None:
+                self.info_cache.put(key, sfp_info)
+
         if sfp_info:
             self.logger.debug(f"Read SFP info: {sfp_info}")
             self.sfp_info = sfp_info
             self.dev.enable_tx()
             self.state = self.FSMState.ACTIVE
+            self._start_ddm()
         else:
             self.logger.warning("Failed to read valid SFP Info")  # @TODO
             self.state = self.FSMState.INVALID_SFP
 
     def in_invalid_sfp_state(self):
-        if not self.dev.is_present():
+        if not self.present_line.update():
             self.logger.warning("SFP disconnected")  # @TODO
             self.state = self.FSMState.DISCONNECTED
 
     def in_active_state(self):
-        if not self.dev.is_present():
+        if not self.present_line.update():
             self.dev.disable_tx()
+            self.ddm.stop()
             self.logger.warning("SFP disconnected")  # @TODO
             self.state = self.FSMState.DISCONNECTED
             return
-        if self.dev.tx_fault():
+        if self.tx_fault_line.update():
             self.dev.disable_tx()
+            self.ddm.stop()
             self.logger.error("SFP reported TX Fault")  # @TODO
             self.state = self.FSMState.SFP_TX_FAULT
+            return
+        self._poll_ddm()
 
     def in_sfp_tx_fault_state(self):
-        if not self.dev.is_present():
+        if not self.present_line.update():
             self.logger.info("SFP disconnected")
             self.state = self.FSMState.DISCONNECTED
+
+    def _start_ddm(self):
+        self.ddm_levels = {}
+        self.ddm_failed = False
+        try:
+            if DDMPoller.supported(self.i2c_bus, self.i2c_addr):
+                self.ddm.start()
+            else:
+                self.logger.info(
+                    "SFP doesn't support internally calibrated DDM"
+                )
+        except OSError as e:
+            self.logger.warning(f"Failed to read SFP DDM thresholds: {e}")
+
+    def _poll_ddm(self):
+        try:
+            self.ddm.tick()
+            self.ddm_failed = False
+        except OSError as e:
+            # Only report the first of a run of failures
+            if not self.ddm_failed:
+                self.logger.warning(f"Failed to read SFP diagnostics: {e}")
+            self.ddm_failed = True
+
+    def _on_ddm_reading(
+        self, reading: DDMReading, levels: dict[str, DDMLevel]
+    ) -> None:
+        if self.publish_telemetry is not None:
+            self.publish_telemetry("sfp", reading.to_dict())
+
+        # A primary only uses the TX side so RX power is meaningless
+        levels.pop("rx_power_mw", None)
+        # Only report changes so a module sat at a limit doesn't flood logs
+        for name, level in levels.items():
+            if level == self.ddm_levels.get(name, DDMLevel.NORMAL):
+                continue
+            value = getattr(reading, name)
+            if level == DDMLevel.ALARM:
+                self.logger.error(f"SFP {name} at alarm level: {value:.4g}")
+            elif level == DDMLevel.WARNING:
+                self.logger.warning(
+                    f"SFP {name} at warning level: {value:.4g}"
+                )
+            else:
+                self.logger.info(f"SFP {name} back to normal: {value:.4g}")
+        self.ddm_levels = levels
@@ -0,0 +1,91 @@
+# Standard imports
+from time import monotonic, time
+from typing import Callable, Optional
+import random
+
+# Third-party imports
+
+
+# Local imports
+
+
+class FakeChrony:
+    """
+    Stand-in for chronyc (timing.sources.run_chronyc) modelling a clock
+    being steered onto a single NTP server. Once a server is added, chrony
+    selects it after select_delay_s and then every update_interval_s
+    removes gain of the remaining offset, plus noise_s of measurement
+    noise. Time comes from clock so it can run on simulated time.
+    """
+
+    def __init__(
+        self,
+        initial_offset_s: float = 0.01,
+        update_interval_s: float = 1,
+        gain: float = 0.5,
+        noise_s: float = 10e-6,
+        select_delay_s: float = 2,
+        clock: Callable[[], float] = monotonic,
+        seed: Optional[int] = None,
+    ):
+        self.offset_s = initial_offset_s
+        self.update_interval_s = update_interval_s
+        self.gain = gain
+        self.noise_s = noise_s
+        self.select_delay_s = select_delay_s
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.servers: dict[str, float] = {}
+        self.reference: Optional[str] = None
+        self.reference_time: float = 0
+        self.last_offset_s: float = 0
+        self.next_update: Optional[float] = None
+        # Offset from wall clock time to clock() for reference times
+        self._epoch = time() - clock()
+
+    def __call__(self, command: str) -> Optional[str]:
+        args = command.split()
+        if args[:2] == ["add", "server"]:
+            self.servers[args[2]] = self.clock()
+            return ""
+        if args[:1] == ["delete"]:
+            if self.servers.pop(args[1], None) is None:
+                return None
+            if self.reference == args[1]:
+                self.reference = None
+            return ""
+        if args == ["tracking"]:
+            self._update()
+            return self.tracking()
+        return None
+
+    def _update(self) -> None:
+        now = self.clock()
+        if self.reference is None:
+            for server, added in self.servers.items():
+                if now - added >= self.select_delay_s:
+                    self.reference = server
+                    self.next_update = now
+                    break
+        if self.reference is None:
+            return
+        while self.next_update <= now:
+            measured = self.offset_s + self.random.gauss(0, self.noise_s)
+            self.last_offset_s = measured
+            self.offset_s -= self.gain * measured
+            self.reference_time = self._epoch + self.next_update
+            self.next_update += self.update_interval_s
+
+    def tracking(self) -> str:
+        if self.reference is None:
+            return (
+                "7F7F0101,,0,0.000000000,0.000000000,0.000000000,"
+                "0.000000000,0.000,0.000,0.000,0.000000000,0.000000000,"
+                "0.0,Not synchronised\n"
+            )
+        return (
+            f"C0A80001,{self.reference},2,{self.reference_time:.9f},"
+            f"{self.offset_s:.9f},{self.last_offset_s:.9f},"
+            f"{self.noise_s:.9f},-1.000,0.001,0.010,0.000100000,"
+            f"0.000050000,{self.update_interval_s:.1f},Normal\n"
+        )
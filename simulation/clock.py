@@ -0,0 +1,41 @@
+# Standard imports
+from threading import Lock
+import time
+
+# Third-party imports
+
+
+# Local imports
+
+
+class VirtualClock:
+    """
+    Simulated monotonic time for running the main loop faster than real
+    time. Pass monotonic as the clock and sleep to Scheduler and anything
+    else with a clock parameter.
+
+    sleep() advances time by the requested amount, actually sleeping for
+    1 / speed of it so threads that still run in real time (MQTT, the
+    broker) keep up. A speed of 0 doesn't sleep at all.
+    """
+
+    def __init__(self, start_s: float = 0, speed: float = 0):
+        self.now = start_s
+        self.speed = speed
+        self._lock = Lock()
+
+    def monotonic(self) -> float:
+        return self.now
+
+    __call__ = monotonic
+
+    def sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        if self.speed:
+            time.sleep(seconds / self.speed)
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> None:
+        with self._lock:
+            self.now += seconds
@@ -0,0 +1,22 @@
+# Standard imports
+
+
+# Third-party imports
+
+
+# Local imports
+
+
+class FakeDS2431:
+    """
+    Stand-in for the m0wut_drivers DS2431 1-Wire EEPROM that holds the
+    card's RS485 address
+    """
+
+    def __init__(self, card_address: int = 1):
+        self.card_address = card_address
+        self.reads: int = 0
+
+    def read_card_address(self) -> int:
+        self.reads += 1
+        return self.card_address
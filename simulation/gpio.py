@@ -0,0 +1,68 @@
+# Standard imports
+from threading import Lock
+from typing import Callable, Optional
+
+# Third-party imports
+
+
+# Local imports
+from m0wut_drivers.gpio import GPIO
+
+
+class FakeGPIO:
+    """
+    Stand-in for an m0wut_drivers GPIO for running off-target. Values are
+    logical levels (i.e. polarity has already been applied), the same as
+    read() / write() on the real thing.
+
+    Inputs are driven by calling set_level(), which also calls any edge
+    callbacks registered with add_edge_callback(), from the calling thread.
+    """
+
+    def __init__(
+        self,
+        pin: Optional[int] = None,
+        direction: int = GPIO.INPUT,
+        value: bool = False,
+        name: str = "",
+    ):
+        self.pin = pin
+        self.direction = direction
+        self.value = bool(value)
+        self.name = name
+        self.writes: int = 0
+        self.edge_callbacks: list[Callable[[bool], None]] = []
+        self._lock = Lock()
+
+    def read(self) -> bool:
+        return self.value
+
+    def write(self, x: bool) -> None:
+        self.value = bool(x)
+        self.writes += 1
+
+    def toggle(self) -> None:
+        self.write(not self.value)
+
+    def set_direction(self, direction: int) -> None:
+        self.direction = direction
+
+    def cleanup(self) -> None:
+        self.edge_callbacks.clear()
+
+    def add_edge_callback(self, callback: Callable[[bool], None]) -> None:
+        """
+        callback(level) is called on every change of level
+        """
+        self.edge_callbacks.append(callback)
+
+    def set_level(self, value: bool) -> None:
+        """
+        Simulates the line being driven externally
+        """
+        with self._lock:
+            changed = bool(value) != self.value
+            self.value = bool(value)
+        if changed:
+            for callback in list(self.edge_callbacks):
+                callback(self.value)
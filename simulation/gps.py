@@ -0,0 +1,133 @@
+# Standard imports
+from collections import deque
+from pathlib import Path
+from time import monotonic
+from typing import Callable, Iterable, Optional
+import json
+
+# Third-party imports
+
+
+# Local imports
+
+
+class RecordedGPSD:
+    """
+    Stand-in for timing.sources.GPSDClient that plays back recorded gpsd
+    JSON, lines_per_poll reports at a time
+    """
+
+    def __init__(self, lines: Iterable[str], lines_per_poll: int = 5):
+        self.lines = deque(x for x in lines if x.strip())
+        self.lines_per_poll = lines_per_poll
+
+    @classmethod
+    def from_file(cls, path: Path, **kwargs) -> "RecordedGPSD":
+        """
+        e.g. recorded with `gpspipe -w > gpsd.jsonl`
+        """
+        return cls(Path(path).read_text().splitlines(), **kwargs)
+
+    def poll(self) -> list[str]:
+        count = min(self.lines_per_poll, len(self.lines))
+        return [self.lines.popleft() for _ in range(count)]
+
+    def close(self) -> None:
+        pass
+
+
+class RecordedChronyc:
+    """
+    Stand-in for timing.sources.run_chronyc returning recorded output. Each
+    call for a command returns the next recording of it, None once they
+    run out
+    """
+
+    def __init__(self, outputs: Iterable[tuple[str, str]]):
+        self.outputs: dict[str, deque[str]] = {}
+        for command, output in outputs:
+            self.outputs.setdefault(command, deque()).append(output)
+
+    @classmethod
+    def from_file(cls, path: Path) -> "RecordedChronyc":
+        """
+        JSON lines of {"command": "tracking", "output": "<chronyc -c
+        output>"}
+        """
+        records = [
+            json.loads(x) for x in Path(path).read_text().splitlines() if x
+        ]
+        return cls((x["command"], x["output"]) for x in records)
+
+    def __call__(self, command: str) -> Optional[str]:
+        outputs = self.outputs.get(command)
+        if not outputs:
+            return None
+        return outputs.popleft()
+
+
+class FakeGPSD:
+    """
+    Stand-in for timing.sources.GPSDClient reporting a GPS receiver whose
+    state is set directly. A TPV and SKY report are produced every
+    report_interval_s of clock, as gpsd does once a second
+    """
+
+    def __init__(
+        self,
+        mode: int = 3,
+        satellites_used: int = 8,
+        satellites_visible: int = 12,
+        hdop: float = 0.9,
+        report_interval_s: float = 1,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.mode = mode
+        self.satellites_used = satellites_used
+        self.satellites_visible = satellites_visible
+        self.hdop = hdop
+        self.report_interval_s = report_interval_s
+        self.clock = clock
+        self.next_report = clock()
+
+    def poll(self) -> list[str]:
+        lines = []
+        now = self.clock()
+        while self.next_report <= now:
+            self.next_report += self.report_interval_s
+            lines.append(json.dumps({"class": "TPV", "mode": self.mode}))
+            lines.append(
+                json.dumps(
+                    {
+                        "class": "SKY",
+                        "nSat": self.satellites_visible,
+                        "uSat": self.satellites_used,
+                        "hdop": self.hdop,
+                    }
+                )
+            )
+        return lines
+
+    def close(self) -> None:
+        pass
+
+
+class FakeGPSMonitor:
+    """
+    Stand-in for the m0wut_drivers GPSMonitor, reporting the fix of a
+    FakeGPSD
+    """
+
+    # gpsd mode -> GPSFixStatus member
+    FIX_STATUS = {2: "FIX_2D", 3: "FIX_3D"}
+
+    def __init__(self, gpsd: FakeGPSD):
+        self.gpsd = gpsd
+
+    def get_fix_status(self):
+        from m0wut_drivers.gps_monitor import GPSFixStatus
+
+        name = self.FIX_STATUS.get(self.gpsd.mode)
+        # Anything without a fix is reported as None, which doesn't match
+        # either fix status
+        return getattr(GPSFixStatus, name) if name else None
@@ -0,0 +1,102 @@
+# Standard imports
+import ctypes
+
+
+# Third-party imports
+
+
+# Local imports
+
+
+class FakeSMBus:
+    """
+    Stand-in for smbus2.SMBus backed by a 256 byte array per device
+    address. Reading an address with no device raises OSError like the
+    real bus does when nothing ACKs.
+
+    i2c_rdwr() takes smbus2.i2c_msg messages: a write sets the register
+    pointer (and writes any following bytes) and a read carries on from
+    the pointer, as an EEPROM would.
+    """
+
+    # Largest SMBus block transfer
+    MAX_BLOCK_LENGTH = 32
+    # i2c_msg flag for a read
+    I2C_M_RD = 0x0001
+
+    def __init__(self):
+        self.devices: dict[int, bytearray] = {}
+        self.transactions: int = 0
+        self.pointers: dict[int, int] = {}
+
+    def add_device(self, i2c_addr: int, data: bytes = b"") -> bytearray:
+        memory = bytearray(256)
+        memory[: len(data)] = data
+        self.devices[i2c_addr] = memory
+        return memory
+
+    def remove_device(self, i2c_addr: int) -> None:
+        self.devices.pop(i2c_addr, None)
+
+    def _device(self, i2c_addr: int) -> bytearray:
+        self.transactions += 1
+        try:
+            return self.devices[i2c_addr]
+        except KeyError:
+            raise OSError(121, "Remote I/O error") from None
+
+    def read_byte_data(self, i2c_addr: int, register: int) -> int:
+        return self._device(i2c_addr)[register]
+
+    def write_byte_data(self, i2c_addr: int, register: int, value: int):
+        self._device(i2c_addr)[register] = value
+
+    def read_word_data(self, i2c_addr: int, register: int) -> int:
+        memory = self._device(i2c_addr)
+        # SMBus words are little endian
+        return memory[register] | (memory[(register + 1) % 256] << 8)
+
+    def read_i2c_block_data(
+        self, i2c_addr: int, register: int, length: int
+    ) -> list[int]:
+        if length > self.MAX_BLOCK_LENGTH:
+            raise ValueError(
+                f"Desired block length over {self.MAX_BLOCK_LENGTH} bytes"
+            )
+        memory = self._device(i2c_addr)
+        return [memory[(register + i) % 256] for i in range(length)]
+
+    def write_i2c_block_data(
+        self, i2c_addr: int, register: int, data: list[int]
+    ) -> None:
+        memory = self._device(i2c_addr)
+        for i, value in enumerate(data):
+            memory[(register + i) % 256] = value
+
+    def i2c_rdwr(self, *messages) -> None:
+        # All messages in one call form a single transaction
+        self.transactions += 1
+        for msg in messages:
+            try:
+                memory = self.devices[msg.addr]
+            except KeyError:
+                raise OSError(121, "Remote I/O error") from None
+            pointer = self.pointers.get(msg.addr, 0)
+            if msg.flags & self.I2C_M_RD:
+                data = bytes(
+                    memory[(pointer + i) % 256] for i in range(msg.len)
+                )
+                ctypes.memmove(msg.buf, data, msg.len)
+                pointer += msg.len
+            else:
+                data = ctypes.string_at(msg.buf, msg.len)
+                if not data:
+                    continue
+                pointer = data[0]
+                for value in data[1:]:
+                    memory[pointer % 256] = value
+                    pointer += 1
+            self.pointers[msg.addr] = pointer % 256
+
+    def close(self) -> None:
+        pass
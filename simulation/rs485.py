@@ -0,0 +1,148 @@
+# Standard imports
+from threading import Condition
+from time import monotonic
+from typing import Optional
+
+# Third-party imports
+
+
+# Local imports
+from rs485.capture import TX, CaptureRecord
+
+
+class FakeRS485Bus:
+    """
+    Half duplex bus joining FakeSerial ports. Bytes written by one port
+    are received by every other port on the bus, like a real RS485 pair
+    """
+
+    def __init__(self):
+        self.ports: list["FakeSerial"] = []
+        self.bytes_transferred: int = 0
+
+    def port(self, timeout: Optional[float] = 0.2) -> "FakeSerial":
+        port = FakeSerial(self, timeout=timeout)
+        self.ports.append(port)
+        return port
+
+    def transmit(self, sender: "FakeSerial", data: bytes) -> None:
+        self.bytes_transferred += len(data)
+        for port in self.ports:
+            if port is not sender:
+                port.receive(data)
+
+
+class FakeSerial:
+    """
+    Stand-in for the parts of serial.Serial used on the RS485 link.
+    read() blocks for up to timeout like the real thing
+    """
+
+    def __init__(self, bus: FakeRS485Bus, timeout: Optional[float] = 0.2):
+        self.bus = bus
+        self.timeout = timeout
+        self.is_open: bool = True
+        self._rx = bytearray()
+        self._condition = Condition()
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._rx)
+
+    def receive(self, data: bytes) -> None:
+        """
+        Bytes arriving from the bus, can also be used to inject noise
+        """
+        with self._condition:
+            self._rx += data
+            self._condition.notify_all()
+
+    def write(self, data: bytes) -> int:
+        self.bus.transmit(self, bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = None if self.timeout is None else monotonic() + self.timeout
+        with self._condition:
+            while len(self._rx) < size:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                self._condition.wait(remaining)
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+            return data
+
+    def reset_input_buffer(self) -> None:
+        with self._condition:
+            self._rx.clear()
+
+    def close(self) -> None:
+        self.is_open = False
+        self.bus.ports.remove(self)
+
+
+class ReplaySerial:
+    """
+    Serial port that plays back a capture. Each write() is checked against
+    the next request recorded, and the bytes recorded after that request
+    are returned by read() as if the card had sent them
+    """
+
+    def __init__(self, records: list[CaptureRecord]):
+        self.records = records
+        self.timeout: Optional[float] = 0
+        self.is_open: bool = True
+        self.tx_mismatches: int = 0
+        self._position: int = 0
+        self._staged: list[bytes] = []
+        self._rx = bytearray()
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._rx)
+
+    def write(self, data: bytes) -> int:
+        while (
+            self._position < len(self.records)
+            and self.records[self._position].direction != TX
+        ):
+            self._position += 1
+        if self._position >= len(self.records):
+            self.tx_mismatches += 1
+            return len(data)
+        if self.records[self._position].data != bytes(data):
+            self.tx_mismatches += 1
+        self._position += 1
+        # Released on the next read, so they survive the input buffer
+        # being cleared after the direction switch
+        self._staged.clear()
+        while (
+            self._position < len(self.records)
+            and self.records[self._position].direction != TX
+        ):
+            self._staged.append(self.records[self._position].data)
+            self._position += 1
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def read(self, size: int = 1) -> bytes:
+        for data in self._staged:
+            self._rx += data
+        self._staged.clear()
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+    def reset_input_buffer(self) -> None:
+        self._rx.clear()
+
+    def close(self) -> None:
+        self.is_open = False
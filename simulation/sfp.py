@@ -0,0 +1,101 @@
+# Standard imports
+import struct
+
+# Third-party imports
+
+
+# Local imports
+from sfp.ddm import (
+    DDM_I2C_ADDRESS,
+    DDM_IMPLEMENTED,
+    DDM_INTERNALLY_CALIBRATED,
+    DIAGNOSTIC_MONITORING_TYPE,
+    DIAGNOSTICS,
+    VENDOR_NAME,
+    VENDOR_SERIAL,
+)
+from simulation.i2c import FakeSMBus
+
+
+# Value of one LSB of each diagnostic quantity (internally calibrated)
+LSB = {
+    "temperature_c": 1 / 256,
+    "vcc_v": 100e-6,
+    "tx_bias_ma": 2e-3,
+    "tx_power_mw": 1e-4,
+    "rx_power_mw": 1e-4,
+}
+
+
+class FakeSFPModule:
+    """
+    SFF-8472 memory map of an SFP module (A0h identification and A2h
+    diagnostics) on a FakeSMBus. insert() / remove() make it appear and
+    disappear from the bus
+    """
+
+    # Typical limits as (high alarm, low alarm, high warning, low warning)
+    THRESHOLDS = {
+        "temperature_c": (85, -10, 75, 0),
+        "vcc_v": (3.6, 3.0, 3.5, 3.1),
+        "tx_bias_ma": (15, 0.5, 12, 1),
+        "tx_power_mw": (1.5, 0.05, 1.2, 0.1),
+        "rx_power_mw": (1.5, 0.001, 1.2, 0.002),
+    }
+
+    def __init__(
+        self,
+        bus: FakeSMBus,
+        i2c_addr: int = 0x50,
+        vendor: str = "SIMULATED",
+        serial: str = "SIM0001",
+        ddm: bool = True,
+    ):
+        self.bus = bus
+        self.i2c_addr = i2c_addr
+        self.a0 = bytearray(256)
+        self.a2 = bytearray(256)
+        self.a0[VENDOR_NAME[0]:sum(VENDOR_NAME)] = vendor.encode(
+            "ascii"
+        ).ljust(VENDOR_NAME[1])
+        self.a0[VENDOR_SERIAL[0]:sum(VENDOR_SERIAL)] = serial.encode(
+            "ascii"
+        ).ljust(VENDOR_SERIAL[1])
+        if ddm:
+            self.a0[DIAGNOSTIC_MONITORING_TYPE] = (
+                DDM_IMPLEMENTED | DDM_INTERNALLY_CALIBRATED
+            )
+        # Thresholds are stored per quantity as HA, LA, HW, LW
+        words = [
+            round(limit / LSB[name])
+            for name, limits in self.THRESHOLDS.items()
+            for limit in limits
+        ]
+        self.a2[0:40] = struct.pack(">4h16H", *words)
+        self.set_diagnostics(35, 3.3, 6, 0.5, 0)
+
+    def set_diagnostics(
+        self,
+        temperature_c: float,
+        vcc_v: float,
+        tx_bias_ma: float,
+        tx_power_mw: float,
+        rx_power_mw: float,
+    ) -> None:
+        self.a2[DIAGNOSTICS[0]:sum(DIAGNOSTICS)] = struct.pack(
+            ">hHHHH",
+            round(temperature_c / LSB["temperature_c"]),
+            round(vcc_v / LSB["vcc_v"]),
+            round(tx_bias_ma / LSB["tx_bias_ma"]),
+            round(tx_power_mw / LSB["tx_power_mw"]),
+            round(rx_power_mw / LSB["rx_power_mw"]),
+        )
+
+    def insert(self) -> None:
+        # Share the byte arrays so later changes are seen on the bus
+        self.bus.devices[self.i2c_addr] = self.a0
+        self.bus.devices[DDM_I2C_ADDRESS] = self.a2
+
+    def remove(self) -> None:
+        self.bus.remove_device(self.i2c_addr)
+        self.bus.remove_device(DDM_I2C_ADDRESS)
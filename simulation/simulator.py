@@ -0,0 +1,490 @@
+# Standard imports
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+import argparse
+import heapq
+import json
+import logging
+import sys
+import tempfile
+import time
+
+# Third-party imports
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+
+# Local imports
+from hardware.backends import SimulationBackend, use_backend
+from mqtt.local_broker import LocalBroker
+from simulation.clock import VirtualClock
+from simulation.sfp import FakeSFPModule
+import config
+import pnt
+
+
+@dataclass
+class LatencyStats:
+    samples_s: list[float] = field(default_factory=list)
+    # Measurements whose condition never became true
+    timeouts: int = 0
+
+    def to_dict(self) -> dict:
+        samples = sorted(self.samples_s)
+        return {
+            "count": len(samples),
+            "timeouts": self.timeouts,
+            "mean_ms": 1e3 * sum(samples) / len(samples) if samples else None,
+            "p95_ms": (
+                1e3 * samples[int(0.95 * (len(samples) - 1))]
+                if samples
+                else None
+            ),
+            "max_ms": 1e3 * samples[-1] if samples else None,
+        }
+
+
+@dataclass
+class _Measurement:
+    name: str
+    condition: Callable[[], bool]
+    start: float
+    timeout_s: float
+
+
+class Simulator:
+    """
+    Runs pnt.main() against the simulation hardware backend and an
+    in-process MQTT broker, on virtual time running speed times faster
+    than real time. A scenario schedules actions (inserting an SFP,
+    stopping the broker...) with at(), optionally measuring how long it
+    takes, in virtual time, for the application to react.
+
+    Actions and reaction checks run from a scheduler task every
+    resolution_s so share the main loop's thread. The hardware backend
+    and the hardware config creates from it are process wide, so there
+    can only be one Simulator per process.
+    """
+
+    def __init__(
+        self,
+        speed: float = 20,
+        is_master: bool = True,
+        resolution_s: float = 0.01,
+        log_folder: Optional[Path] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.clock = VirtualClock(speed=speed)
+        self.is_master = is_master
+        self.resolution_s = resolution_s
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.backend = SimulationBackend(clock=self.clock)
+        use_backend(self.backend)
+
+        self.broker = LocalBroker()
+        self.broker.start_in_thread()
+        self.broker_up: bool = True
+        if log_folder is None:
+            log_folder = Path(tempfile.mkdtemp(prefix="pnt-simulation-"))
+        self.log_folder = log_folder
+        # Any free port, so it can run alongside the real thing
+        config.METRICS_HTTP_PORT = 0
+
+        self.sfp_module = FakeSFPModule(
+            self.backend.i2c_bus(4), config.I2C_SFP_ADDRESS
+        )
+        self.latencies: dict[str, LatencyStats] = {}
+        self.topics = Counter()
+        self.scheduler = None
+        self.sfp = None
+        self.warning_handler = None
+        self._events: list[tuple[float, int, Callable[[], None]]] = []
+        self._sequence: int = 0
+        self._measurements: list[_Measurement] = []
+
+        # Sees everything on the broker, as another node would
+        self.monitor = mqtt.Client(CallbackAPIVersion.VERSION2)
+        self.monitor.on_connect = lambda *args: self.monitor.subscribe("#")
+        self.monitor.on_message = lambda c, u, msg: self.topics.update(
+            [msg.topic]
+        )
+        self.monitor.connect(self.broker.host, self.broker.port)
+        self.monitor.loop_start()
+
+    # ----- Scenario API -----
+
+    def at(
+        self,
+        time_s: float,
+        action: Callable[[], None],
+        measure: Optional[str] = None,
+        until: Optional[Callable[[], bool]] = None,
+        timeout_s: float = 10,
+    ) -> None:
+        """
+        Calls action at time_s. If measure is given, records as its
+        latency the time from then until until() returns True
+        """
+        self._sequence += 1
+
+        def event():
+            action()
+            if measure is not None:
+                self.measure(measure, until, timeout_s)
+
+        heapq.heappush(self._events, (time_s, self._sequence, event))
+
+    def measure(
+        self, name: str, condition: Callable[[], bool], timeout_s: float = 10
+    ) -> None:
+        self.latencies.setdefault(name, LatencyStats())
+        self._measurements.append(
+            _Measurement(name, condition, self.clock(), timeout_s)
+        )
+
+    def every(
+        self,
+        start_s: float,
+        stop_s: float,
+        period_s: float,
+        action: Callable[[], None],
+    ) -> None:
+        t = start_s
+        while t < stop_s:
+            self.at(t, action)
+            t += period_s
+
+    def insert_sfp(self) -> None:
+        self.sfp_module.insert()
+        config.GPIO_SFP_PRESENT.set_level(True)
+
+    def remove_sfp(self) -> None:
+        config.GPIO_SFP_PRESENT.set_level(False)
+        self.sfp_module.remove()
+
+    def set_tx_fault(self, level: bool) -> None:
+        config.GPIO_SFP_TX_FAULT.set_level(level)
+
+    def set_los(self, level: bool) -> None:
+        config.GPIO_SFP_LOS.set_level(level)
+
+    def tx_enabled(self) -> bool:
+        return config.GPIO_SFP_TX_ENABLE.read()
+
+    def stop_broker(self) -> None:
+        self.broker.stop_thread()
+        self.broker_up = False
+
+    def start_broker(self) -> None:
+        self.broker.start_in_thread()
+        self.broker_up = True
+
+    def mqtt_connected(self) -> bool:
+        mqtt_handler = self.warning_handler.mqtt
+        return mqtt_handler is not None and mqtt_handler.mqtt_connected
+
+    def outbox_empty(self) -> bool:
+        return self.mqtt_connected() and not len(self.warning_handler.outbox)
+
+    def publish_warning(
+        self, node: int, level: str = "warning", message: str = ""
+    ) -> None:
+        """
+        Publishes a notification as if from another node
+        """
+        if not self.broker_up:
+            return
+        payload = {
+            "mac_address": f"02:00:00:00:{node >> 8:02X}:{node & 0xFF:02X}",
+            "node_name": f"Simulated node {node}",
+            "category": "simulation",
+            "message": message or f"Simulated {level}",
+            "time": datetime.now(tz=timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": level,
+        }
+        self.broker.publish(
+            f"/status/{level}s", json.dumps(payload).encode("utf-8")
+        )
+
+    # ----- Running -----
+
+    def run(self, duration_s: float) -> dict:
+        """
+        Runs pnt.main() for duration_s of virtual time. Returns a report
+        of reaction latencies, main loop task statistics and MQTT traffic
+        """
+        start = time.monotonic()
+        try:
+            pnt.main(
+                is_master=self.is_master,
+                clock=self.clock,
+                sleep=self.clock.sleep,
+                setup=self._setup,
+                until=lambda: self.clock() >= duration_s,
+                handler_options={
+                    "broker_ip_address": self.broker.host,
+                    "broker_port": self.broker.port,
+                    "log_folder_name": str(self.log_folder),
+                },
+            )
+        finally:
+            self.close()
+        return self.report(duration_s, time.monotonic() - start)
+
+    def _setup(self, scheduler, sfp) -> None:
+        self.scheduler = scheduler
+        self.sfp = sfp
+        self.warning_handler = next(
+            x
+            for x in logging.getLogger().handlers
+            if type(x).__name__ == "WarningHandler"
+        )
+        scheduler.add_task(
+            "simulation", self._tick, period_s=self.resolution_s
+        )
+
+    def _tick(self) -> None:
+        now = self.clock()
+        while self._events and self._events[0][0] <= now:
+            _, _, event = heapq.heappop(self._events)
+            event()
+        remaining = []
+        for x in self._measurements:
+            if x.condition():
+                self.latencies[x.name].samples_s.append(now - x.start)
+            elif now - x.start >= x.timeout_s:
+                self.latencies[x.name].timeouts += 1
+            else:
+                remaining.append(x)
+        self._measurements = remaining
+
+    def close(self) -> None:
+        for x in self._measurements:
+            self.latencies[x.name].timeouts += 1
+        self._measurements = []
+        self.monitor.loop_stop()
+        if self.warning_handler is not None and self.warning_handler.mqtt:
+            self.warning_handler.mqtt.__exit__()
+        if self.broker_up:
+            self.stop_broker()
+
+    def report(self, duration_s: float, real_time_s: float) -> dict:
+        # Task times are virtual, and virtual time only passes while the
+        # scheduler sleeps, so run times are always 0 and lateness comes
+        # from the resolution of the scheduler's sleeps
+        tasks = {}
+        if self.scheduler is not None:
+            for name, task in self.scheduler.tasks.items():
+                stats = task.stats
+                tasks[name] = {
+                    "runs": stats.runs,
+                    "max_run_time_ms": 1e3 * stats.max_run_time_s,
+                    "max_lateness_ms": 1e3 * stats.max_lateness_s,
+                    "overruns": stats.overruns,
+                    "missed_deadlines": stats.missed_deadlines,
+                }
+        mqtt_statistics = None
+        if self.warning_handler is not None and self.warning_handler.mqtt:
+            statistics = self.warning_handler.mqtt.statistics
+            mqtt_statistics = {
+                "messages_processed": statistics.messages_processed,
+                "max_latency_ms": 1e3 * statistics.max_latency_s,
+                "mean_latency_ms": 1e3 * statistics.mean_latency_s,
+                "budget_exhausted": statistics.budget_exhausted,
+            }
+        return {
+            "virtual_time_s": duration_s,
+            "real_time_s": real_time_s,
+            "latencies": {
+                name: x.to_dict() for name, x in self.latencies.items()
+            },
+            "tasks": tasks,
+            "mqtt": mqtt_statistics,
+            "messages_routed": self.broker.messages_routed,
+            "topics": dict(self.topics),
+        }
+
+
+# ----- Scenarios -----
+# Each schedules its actions on a Simulator and returns how long to run for
+
+
+def sfp_insert_remove(sim: Simulator, cycles: int = 10) -> float:
+    """
+    Repeatedly inserts and removes an SFP, measuring how long until the
+    laser is turned on / off
+    """
+    for i in range(cycles):
+        t = 1 + 4 * i
+        sim.at(t, sim.insert_sfp, "tx_enable", sim.tx_enabled)
+        sim.at(
+            t + 2, sim.remove_sfp, "tx_disable", lambda: not sim.tx_enabled()
+        )
+    return 1 + 4 * cycles
+
+
+def tx_fault_storm(
+    sim: Simulator, cycles: int = 50, chatter: int = 20
+) -> float:
+    """
+    Each cycle inserts an SFP, asserts TX fault with the line chattering
+    chatter times, then removes it. Measures how long until the laser is
+    turned off
+    """
+
+    def fault():
+        for i in range(chatter):
+            sim.set_tx_fault(i % 2 == 0)
+        sim.set_tx_fault(True)
+
+    def remove():
+        sim.remove_sfp()
+        sim.set_tx_fault(False)
+
+    for i in range(cycles):
+        t = 1 + i
+        sim.at(t, sim.insert_sfp, "tx_enable", sim.tx_enabled)
+        sim.at(t + 0.5, fault, "tx_fault", lambda: not sim.tx_enabled())
+        sim.at(t + 0.8, remove)
+    return 2 + cycles
+
+
+def broker_outage(
+    sim: Simulator, outages: int = 3, down_s: float = 20, up_s: float = 40
+) -> float:
+    """
+    Logs a warning every second while the broker is repeatedly stopped
+    and restarted. Measures how long until the connection is back and
+    until the warnings held in the outbox have been sent
+    """
+    logger = logging.getLogger("simulation")
+    duration = 5 + outages * (down_s + up_s)
+    sim.every(
+        1, duration, 1, lambda: logger.warning("Simulated warning")
+    )
+    for i in range(outages):
+        t = 5 + i * (down_s + up_s)
+        sim.at(t, sim.stop_broker)
+        sim.at(
+            t + down_s,
+            sim.start_broker,
+            "mqtt_reconnect",
+            sim.mqtt_connected,
+            timeout_s=up_s,
+        )
+        sim.at(
+            t + down_s,
+            lambda: None,
+            "outbox_drained",
+            sim.outbox_empty,
+            timeout_s=up_s,
+        )
+    return duration
+
+
+def warning_storm(
+    sim: Simulator,
+    nodes: int = 50,
+    rate_per_s: float = 500,
+    duration_s: float = 30,
+) -> float:
+    """
+    nodes other nodes publish warnings at a total of rate_per_s while an
+    SFP is inserted and removed, to check the main loop keeps up
+    """
+    period_s = 0.1
+    per_period = max(1, round(rate_per_s * period_s))
+    count = 0
+
+    def spam():
+        nonlocal count
+        for _ in range(per_period):
+            sim.publish_warning(count % nodes)
+            count += 1
+
+    sim.every(1, duration_s, period_s, spam)
+    for t in range(2, int(duration_s), 4):
+        sim.at(t, sim.insert_sfp, "tx_enable", sim.tx_enabled)
+        sim.at(
+            t + 2, sim.remove_sfp, "tx_disable", lambda: not sim.tx_enabled()
+        )
+    return duration_s + 1
+
+
+SCENARIOS: dict[str, Callable[..., float]] = {
+    "sfp_insert_remove": sfp_insert_remove,
+    "tx_fault_storm": tx_fault_storm,
+    "broker_outage": broker_outage,
+    "warning_storm": warning_storm,
+}
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Runs pnt.main() on simulated hardware through a "
+        "scripted scenario and prints a JSON report"
+    )
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=20,
+        help="Virtual time per real second, 0 for as fast as possible",
+    )
+    parser.add_argument(
+        "--auxiliary", action="store_true", help="Run as an auxiliary"
+    )
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Passed to the scenario function, e.g. outages=1",
+    )
+    parser.add_argument(
+        "--max-latency-ms",
+        action="append",
+        default=[],
+        metavar="NAME=MS",
+        help="Exit with an error if a reaction takes longer than this, or "
+        "never happens",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Write the report here rather than stdout, which also has the "
+        "application's log",
+    )
+    args = parser.parse_args(argv)
+
+    params = {}
+    for param in args.param:
+        name, value = param.split("=")
+        params[name] = float(value) if "." in value else int(value)
+    sim = Simulator(speed=args.speed, is_master=not args.auxiliary)
+    duration = SCENARIOS[args.scenario](sim, **params)
+    report = {"scenario": args.scenario, **sim.run(duration)}
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2), file=sys.stdout)
+
+    failed = False
+    for limit in args.max_latency_ms:
+        name, max_ms = limit.split("=")
+        latency = report["latencies"].get(name)
+        if latency is None:
+            continue
+        max_ms = float(max_ms)
+        if latency["timeouts"] or (latency["max_ms"] or 0) > max_ms:
+            print(f"{name} exceeded {max_ms} ms", file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+# Standard imports
+from pathlib import Path
+import sys
+
+# Third-party imports
+import pytest
+
+# Local imports
+
+
+# Modules are imported from the repository root, as when running pnt.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class FakeClock:
+    """
+    Stands in for monotonic. Time only moves when a test sets it
+    """
+
+    def __init__(self):
+        self.time: float = 0
+
+    def __call__(self) -> float:
+        return self.time
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
@@ -15,6 +15,7 @@ fake_message = json.dumps(
         "time": dt.datetime.now(tz=dt.timezone.utc).isoformat(
             timespec="milliseconds"
         ),
+        "level": "warning",
     }
 )
 
@@ -0,0 +1,121 @@
+# Standard imports
+from typing import Callable
+import asyncio
+import json
+
+# Third-party imports
+import pytest
+
+# Local imports
+from mqtt.async_mqtt_handler import AsyncMqttHandler
+from mqtt.local_broker import LocalBroker
+from mqtt.mqtt_handler import BrokerConnectionError
+
+
+async def wait_until(condition: Callable[[], bool], timeout_s: float = 5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout_s)
+
+
+def make_handler(broker: LocalBroker, **kwargs) -> AsyncMqttHandler:
+    return AsyncMqttHandler(
+        broker.host, broker.port, "test node", reconnect_delay_s=0.05, **kwargs
+    )
+
+
+def test_wildcard_callback_receives_publish():
+    async def main():
+        broker = LocalBroker()
+        await broker.start()
+        received = []
+        try:
+            async with make_handler(broker) as subscriber, make_handler(
+                broker
+            ) as publisher:
+                subscriber.register_callback(
+                    "/status/+/temperature",
+                    lambda topic, message: received.append((topic, message)),
+                    include_topic=True,
+                )
+                runner = asyncio.create_task(subscriber.run())
+                await wait_until(
+                    lambda: subscriber.mqtt_connected
+                    and publisher.mqtt_connected
+                )
+                # Let the subscription reach the broker
+                await asyncio.sleep(0.1)
+                await publisher.publish(
+                    "/status/sfp/temperature", json.dumps({"value": 42}), 1
+                )
+                await wait_until(lambda: received)
+                runner.cancel()
+        finally:
+            await broker.stop()
+        assert received == [("/status/sfp/temperature", {"value": 42})]
+        assert publisher.statistics.messages_published == 1
+
+    asyncio.run(main())
+
+
+def test_publishes_held_until_broker_returns():
+    async def main():
+        broker = LocalBroker()
+        await broker.start()
+        await broker.stop()
+        async with make_handler(broker) as publisher:
+            futures = [
+                await publisher.publish("/test", str(i), wait=False)
+                for i in range(3)
+            ]
+            await asyncio.sleep(0.1)
+            assert not any(future.done() for future in futures)
+
+            await broker.start()
+            try:
+                await asyncio.wait_for(asyncio.gather(*futures), 5)
+            finally:
+                await broker.stop()
+            assert publisher.statistics.reconnects >= 1
+            assert publisher.statistics.messages_published == 3
+
+    asyncio.run(main())
+
+
+def test_publish_waits_for_space():
+    async def main():
+        broker = LocalBroker()
+        await broker.start()
+        await broker.stop()
+        async with make_handler(broker, max_outbound=1) as publisher:
+            await publisher.publish("/test", "1", wait=False)
+            second = asyncio.create_task(
+                publisher.publish("/test", "2", wait=False)
+            )
+            await asyncio.sleep(0.1)
+            # Buffer is full and nothing can be sent while disconnected
+            assert not second.done()
+            assert publisher.statistics.publish_waits == 1
+
+            await broker.start()
+            try:
+                await asyncio.wait_for(await second, 5)
+            finally:
+                await broker.stop()
+
+    asyncio.run(main())
+
+
+def test_wait_for_connection_raises_without_broker():
+    async def main():
+        broker = LocalBroker()
+        await broker.start()
+        await broker.stop()
+        handler = make_handler(broker)
+        with pytest.raises(BrokerConnectionError):
+            await handler.start(wait_for_connection=True)
+        await handler.stop()
+
+    asyncio.run(main())
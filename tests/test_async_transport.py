@@ -0,0 +1,106 @@
+# Standard imports
+from threading import Event, Thread
+import asyncio
+
+# Third-party imports
+
+
+# Local imports
+from rs485.async_transport import AsyncRS485Transport
+from rs485.framing import FrameParser, RS485Packet
+from simulation.gpio import FakeGPIO
+from simulation.rs485 import FakeRS485Bus
+
+
+class Card:
+    """
+    Answers requests on a FakeRS485Bus from a thread, except for commands
+    in ignore
+    """
+
+    def __init__(self, bus: FakeRS485Bus, delay_s: float = 0.001):
+        self.port = bus.port(timeout=0.005)
+        self.delay = delay_s
+        self.ignore: set[int] = set()
+        self.stopped = Event()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        parser = FrameParser()
+        while not self.stopped.is_set():
+            data = self.port.read(max(1, self.port.in_waiting))
+            for request in parser.feed(data) if data else parser.idle():
+                if request.command in self.ignore:
+                    continue
+                if self.stopped.wait(self.delay):
+                    return
+                response = RS485Packet(
+                    0, request.command, b"ok", request.sequence
+                )
+                self.port.write(response.encode())
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def run_with_card(test, delay_s: float = 0.001, **kwargs):
+    bus = FakeRS485Bus()
+    port = bus.port()
+    card = Card(bus, delay_s)
+
+    async def main():
+        async with AsyncRS485Transport(port, FakeGPIO(), **kwargs) as t:
+            await test(t, card)
+
+    try:
+        asyncio.run(main())
+    finally:
+        card.stop()
+
+
+def test_concurrent_queries_matched():
+    async def test(transport, card):
+        responses = await asyncio.gather(
+            *(transport.query(RS485Packet(1, i)) for i in range(20))
+        )
+        assert [x.command for x in responses] == list(range(20))
+        assert transport.statistics.requests == 20
+        assert transport.statistics.responses == 20
+
+    run_with_card(test)
+
+
+def test_timeout_returns_none():
+    async def test(transport, card):
+        card.ignore.add(1)
+        assert await transport.query(RS485Packet(1, 1), 0.02) is None
+        response = await transport.query(RS485Packet(1, 2))
+        assert response.command == 2
+        assert transport.statistics.timeouts == 1
+
+    run_with_card(test)
+
+
+def test_late_response_is_unsolicited():
+    unsolicited = []
+
+    async def test(transport, card):
+        assert await transport.query(RS485Packet(1, 1), 0.01) is None
+        await asyncio.sleep(0.05)
+        assert [x.command for x in unsolicited] == [1]
+        assert transport.statistics.unsolicited == 1
+
+    run_with_card(test, delay_s=0.02, on_unsolicited=unsolicited.append)
+
+
+def test_noise_discarded():
+    async def test(transport, card):
+        card.port.write(b"\x00\x01\x02")
+        await asyncio.sleep(0.02)
+        response = await transport.query(RS485Packet(1, 1))
+        assert response.command == 1
+        assert transport.statistics.glitch_bytes_discarded == 3
+
+    run_with_card(test)
@@ -0,0 +1,98 @@
+# Standard imports
+
+# Third-party imports
+import pytest
+
+# Local imports
+from simulation.chrony import FakeChrony
+from timing.aux_sync import AuxiliarySync
+from timing.statistics import ConvergenceDetector
+
+
+PRIMARY = {
+    "role": "primary",
+    "status": "connected",
+    "mac_address": "01:23:45:67:89:A0",
+    "node_name": "primary",
+    "ip_address": "192.168.0.10",
+}
+
+
+def test_convergence_needs_min_samples():
+    detector = ConvergenceDetector(1e-4, window=8, min_samples=4)
+    for t in range(3):
+        detector.push(t, 1e-6)
+    assert not detector.converged
+    detector.push(3, 1e-6)
+    assert detector.converged
+
+
+def test_convergence_rejects_large_offsets():
+    detector = ConvergenceDetector(1e-4, window=4)
+    for t in range(4):
+        detector.push(t, 2e-4)
+    assert not detector.converged
+
+
+def test_convergence_rejects_trend():
+    # Small enough on average, but still sweeping through zero
+    detector = ConvergenceDetector(1e-4, window=8)
+    for t in range(8):
+        detector.push(t, (3.5 - t) * 2e-5)
+    assert detector.offsets.rms() < 1e-4
+    assert detector.slope() == pytest.approx(-2e-5)
+    assert not detector.converged
+
+    detector.clear()
+    for t in range(8):
+        detector.push(t, (-1) ** t * 1e-5)
+    assert detector.converged
+
+
+def run_until_ready(sync: AuxiliarySync, clock, limit_s: float):
+    while not sync.tick() and clock.time < limit_s:
+        clock.time += 0.5
+
+
+def test_ready_once_converged(clock):
+    chrony = FakeChrony(initial_offset_s=0.01, seed=1, clock=clock)
+    ready = []
+    sync = AuxiliarySync(
+        chrony, on_ready=lambda: ready.append(clock.time), clock=clock
+    )
+    # Not until the primary has been found
+    assert not sync.tick()
+
+    sync.on_discovery({**PRIMARY, "role": "auxiliary"})
+    assert sync.primary_ip is None
+    sync.on_discovery(PRIMARY)
+    assert PRIMARY["ip_address"] in chrony.servers
+
+    run_until_ready(sync, clock, 120)
+    assert sync.ready
+    assert abs(chrony.offset_s) <= 1e-4
+    # Halving a 10 ms offset gets within 100 us in about 7 updates
+    assert ready and ready[0] < 30
+
+
+def test_restarts_when_primary_moves(clock):
+    chrony = FakeChrony(initial_offset_s=0.001, seed=2, clock=clock)
+    sync = AuxiliarySync(chrony, clock=clock)
+    sync.on_discovery(PRIMARY)
+    run_until_ready(sync, clock, 120)
+    assert sync.ready
+
+    sync.on_discovery({**PRIMARY, "ip_address": "192.168.0.11"})
+    assert list(chrony.servers) == ["192.168.0.11"]
+    assert not sync.ready
+    run_until_ready(sync, clock, 240)
+    assert sync.ready
+    assert sync.tracking.reference_name == "192.168.0.11"
+
+
+def test_ignores_loopback_primary(clock):
+    chrony = FakeChrony(clock=clock)
+    sync = AuxiliarySync(chrony, clock=clock)
+    sync.on_discovery({**PRIMARY, "ip_address": "127.0.0.1"})
+    assert sync.primary_ip is None
+    assert not chrony.servers
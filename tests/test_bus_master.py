@@ -0,0 +1,132 @@
+# Standard imports
+from typing import Optional
+
+# Third-party imports
+import pytest
+
+# Local imports
+from rs485.bus_master import BusMaster
+from rs485.framing import RS485Packet
+
+
+class FakeMessageHandler:
+    """
+    Answers each query after rtt_s of virtual time, or uses up the
+    timeout if rtt_s is None
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.rtt_s: dict[int, Optional[float]] = {}
+        self.timeouts: list[float] = []
+
+    def query(
+        self, packet: RS485Packet, timeout: float
+    ) -> Optional[RS485Packet]:
+        self.timeouts.append(timeout)
+        rtt = self.rtt_s.get(packet.address)
+        if rtt is None or rtt > timeout:
+            self.clock.time += timeout
+            return None
+        self.clock.time += rtt
+        return RS485Packet(0, packet.command, b"", packet.sequence)
+
+
+@pytest.fixture
+def handler(clock) -> FakeMessageHandler:
+    return FakeMessageHandler(clock)
+
+
+@pytest.fixture
+def master(clock, handler) -> BusMaster:
+    return BusMaster(
+        handler,
+        min_timeout_s=0.005,
+        max_timeout_s=0.2,
+        max_backoff_s=30,
+        clock=clock,
+    )
+
+
+def test_timeout_adapts_to_rtt(clock, handler, master):
+    handler.rtt_s[1] = 0.01
+    card = master.add_card(1, 0x10, period_s=1)
+    # Nothing measured, so the maximum
+    assert master.timeout_for(card) == 0.2
+
+    master.poll(card)
+    assert card.stats.srtt_s == pytest.approx(0.01)
+    assert card.stats.rttvar_s == pytest.approx(0.005)
+    assert master.timeout_for(card) == pytest.approx(0.03)
+
+    for _ in range(50):
+        master.poll(card)
+    # Converges on the RTT with the deviation decaying away
+    assert card.stats.srtt_s == pytest.approx(0.01)
+    assert master.timeout_for(card) == pytest.approx(0.01, abs=1e-4)
+
+    handler.rtt_s[1] = 0.001
+    for _ in range(50):
+        master.poll(card)
+    assert master.timeout_for(card) == 0.005
+
+
+def test_timeout_backs_off(clock, handler, master):
+    handler.rtt_s[1] = 0.01
+    card = master.add_card(1, 0x10, period_s=1)
+    for _ in range(50):
+        master.poll(card)
+    base = master.timeout_for(card)
+
+    # Slowed down past the estimate. Each timeout doubles it (RFC 6298
+    # 5.5) until the card is heard again
+    handler.rtt_s[1] = 0.05
+    timeouts = []
+    while master.poll(card) is None:
+        timeouts.append(handler.timeouts[-1])
+    assert timeouts == pytest.approx([base, 2 * base, 4 * base])
+    assert card.stats.consecutive_timeouts == 0
+    assert card.responding
+
+    handler.rtt_s[1] = None
+    for _ in range(40):
+        master.poll(card)
+    assert master.timeout_for(card) == 0.2
+
+
+def test_dead_card_polled_less_often(clock, handler, master):
+    card = master.add_card(1, 0x10, period_s=1)
+    intervals = []
+    for _ in range(8):
+        start = clock.time
+        master.poll(card)
+        intervals.append(card.next_poll - start - 0.2)
+    assert intervals == pytest.approx([2, 4, 8, 16, 30, 30, 30, 30])
+    assert not card.responding
+
+
+def test_tick_polls_most_overdue_first(clock, handler, master):
+    polled = []
+    for address in (1, 2, 3):
+        handler.rtt_s[address] = 0.001
+        master.add_card(
+            address,
+            0x10,
+            period_s=1,
+            on_response=lambda _, address=address: polled.append(address),
+        )
+    master.cards[3].next_poll = -0.5
+    master.tick()
+    assert polled == [3, 1, 2]
+    # Keeps to its period rather than the time it was actually polled
+    assert master.next_poll_in() == pytest.approx(0.5 - clock.time)
+
+
+def test_tick_budget(clock, handler, master):
+    for address in (1, 2, 3):
+        handler.rtt_s[address] = 0.03
+        master.add_card(address, 0x10, period_s=1)
+    master.tick()
+    # Two 30 ms polls use up the 50 ms budget
+    assert [card.stats.polls for card in master.cards.values()] == [1, 1, 0]
+    assert master.next_poll_in() == 0
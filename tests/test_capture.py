@@ -0,0 +1,94 @@
+# Standard imports
+from pathlib import Path
+from typing import Optional
+
+# Third-party imports
+import pytest
+
+# Local imports
+from rs485.capture import (
+    RX,
+    TX,
+    TrafficCapture,
+    read_capture,
+    reconstruct_exchanges,
+    replay,
+    summarise,
+)
+from rs485.framing import RS485Packet
+
+
+def record_exchange(
+    capture: TrafficCapture,
+    clock,
+    request: RS485Packet,
+    response: Optional[RS485Packet] = None,
+) -> None:
+    capture.record(TX, request.encode())
+    if response is not None:
+        clock.time += 0.001
+        data = response.encode()
+        # Arrives in two reads
+        capture.record(RX, data[:3])
+        clock.time += 0.001
+        capture.record(RX, data[3:])
+    clock.time += 0.01
+
+
+def test_ring_keeps_newest_records(tmp_path: Path, clock):
+    path = tmp_path / "capture.bin"
+    with TrafficCapture(path, capacity=200, clock=clock) as capture:
+        for i in range(50):
+            clock.time = i
+            capture.record(TX if i % 2 else RX, bytes([i]) * (i % 7 + 1))
+        count = capture.count
+    records = list(read_capture(path))
+    assert len(records) == count
+    assert 0 < count < 50
+    assert [x.timestamp for x in records] == list(range(50 - count, 50))
+    assert records[-1].data == bytes([49]) * (49 % 7 + 1)
+
+
+def test_record_too_big(tmp_path: Path):
+    with TrafficCapture(tmp_path / "capture.bin", capacity=64) as capture:
+        with pytest.raises(ValueError):
+            capture.record(TX, bytes(64))
+
+
+def test_analyse_pairs_requests_and_responses(tmp_path: Path, clock):
+    path = tmp_path / "capture.bin"
+    with TrafficCapture(path, clock=clock) as capture:
+        record_exchange(
+            capture,
+            clock,
+            RS485Packet(1, 0x10, b"", 1),
+            RS485Packet(0, 0x10, b"ok", 1),
+        )
+        record_exchange(capture, clock, RS485Packet(1, 0x10, b"", 2))
+        # Corrupted response
+        record_exchange(capture, clock, RS485Packet(2, 0x10, b"", 3))
+        bad = bytearray(RS485Packet(0, 0x10, b"ok", 3).encode())
+        bad[-1] ^= 0xFF
+        capture.record(RX, bytes(bad))
+
+    summaries = summarise(reconstruct_exchanges(read_capture(path)))
+    assert summaries[1].requests == 2
+    assert summaries[1].responses == 1
+    assert summaries[1].timeouts == 1
+    assert summaries[1].turnaround_s == [pytest.approx(0.001)]
+    assert summaries[1].round_trip_s == [pytest.approx(0.002)]
+    assert summaries[2].timeouts == 1
+    assert summaries[2].crc_errors == 1
+
+
+def test_replay_matches_recording(tmp_path: Path, clock):
+    path = tmp_path / "capture.bin"
+    with TrafficCapture(path, clock=clock) as capture:
+        for sequence in range(1, 4):
+            record_exchange(
+                capture,
+                clock,
+                RS485Packet(1, 0x10, b"", sequence),
+                RS485Packet(0, 0x10, bytes([sequence]), sequence),
+            )
+    assert replay(path) == 0
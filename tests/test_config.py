@@ -0,0 +1,78 @@
+# Standard imports
+
+# Third-party imports
+import pytest
+
+# Local imports
+from hardware import backends
+from hardware.backends import (
+    HardwareBackend,
+    SimulationBackend,
+    register_backend,
+    select_backend,
+)
+from simulation.gpio import FakeGPIO
+import config
+
+
+class CountingBackend(HardwareBackend):
+    name = "counting"
+
+    def __init__(self):
+        self.created: list[str] = []
+
+    def eeprom(self):
+        self.created.append("eeprom")
+        return object()
+
+
+@pytest.fixture(autouse=True)
+def fresh_hardware(monkeypatch):
+    """
+    No backend selected and no hardware created, put back afterwards
+    """
+    monkeypatch.setattr(backends, "_backend", None)
+    monkeypatch.delenv("PNT_HARDWARE_BACKEND", raising=False)
+    created_before = set(vars(config))
+    yield
+    for name in set(vars(config)) - created_before:
+        delattr(config, name)
+
+
+def test_settings_dont_create_hardware():
+    assert config.NODE_NAME
+    assert config.I2C_SFP_ADDRESS == 0x50
+    assert backends._backend is None
+
+
+def test_hardware_created_once_on_first_use(monkeypatch):
+    monkeypatch.setitem(backends.BACKENDS, "counting", CountingBackend)
+    backend = select_backend("counting")
+    eeprom = config.EEPROM
+    assert config.EEPROM is eeprom
+    assert backend.created == ["eeprom"]
+
+
+def test_backend_from_environment(monkeypatch):
+    monkeypatch.setenv("PNT_HARDWARE_BACKEND", "simulation")
+    assert isinstance(config.GPIO_STATUS_RED, FakeGPIO)
+    assert isinstance(backends.get_backend(), SimulationBackend)
+
+
+def test_backend_fixed_once_selected(monkeypatch):
+    monkeypatch.setitem(backends.BACKENDS, "counting", CountingBackend)
+    select_backend("simulation")
+    assert select_backend("simulation") is backends.get_backend()
+    with pytest.raises(RuntimeError):
+        select_backend("counting")
+
+
+def test_register_backend(monkeypatch):
+    monkeypatch.setattr(backends, "BACKENDS", dict(backends.BACKENDS))
+    register_backend("counting", CountingBackend)
+    assert isinstance(select_backend("counting"), CountingBackend)
+
+
+def test_unknown_name():
+    with pytest.raises(AttributeError):
+        config.NOT_A_SETTING
@@ -0,0 +1,83 @@
+# Standard imports
+
+# Third-party imports
+import pytest
+
+# Local imports
+from i2c.i2c_bus import I2CBus
+from sfp.ddm import DDMLevel, DDMPoller, SFPInfoCache
+from simulation.i2c import FakeSMBus
+from simulation.sfp import FakeSFPModule
+
+
+@pytest.fixture
+def smbus() -> FakeSMBus:
+    return FakeSMBus()
+
+
+@pytest.fixture
+def i2c_bus(smbus: FakeSMBus) -> I2CBus:
+    return I2CBus(smbus)
+
+
+def test_poller_reads_diagnostics(clock, smbus, i2c_bus):
+    module = FakeSFPModule(smbus)
+    module.set_diagnostics(40, 3.3, 6, 0.5, 0.25)
+    module.insert()
+    readings = []
+    poller = DDMPoller(
+        i2c_bus,
+        lambda reading, levels: readings.append((reading, levels)),
+        period_s=1,
+        clock=clock,
+    )
+    assert DDMPoller.supported(i2c_bus, 0x50)
+
+    # Nothing until started
+    poller.tick()
+    assert readings == []
+
+    poller.start()
+    poller.tick()
+    reading, levels = readings[0]
+    assert reading.temperature_c == pytest.approx(40)
+    assert reading.vcc_v == pytest.approx(3.3)
+    assert reading.tx_bias_ma == pytest.approx(6)
+    assert reading.rx_power_mw == pytest.approx(0.25)
+    assert reading.to_dict()["tx_power_dbm"] == pytest.approx(-3.01)
+    assert set(levels.values()) == {DDMLevel.NORMAL}
+
+    # Polled once per period
+    poller.tick()
+    assert len(readings) == 1
+    clock.time = 1
+    module.set_diagnostics(80, 3.3, 6, 0.5, 0)
+    poller.tick()
+    reading, levels = readings[1]
+    assert levels["temperature_c"] == DDMLevel.WARNING
+    assert levels["rx_power_mw"] == DDMLevel.ALARM
+    assert reading.to_dict()["rx_power_dbm"] is None
+
+
+def test_unsupported_module(smbus, i2c_bus):
+    FakeSFPModule(smbus, ddm=False).insert()
+    assert not DDMPoller.supported(i2c_bus, 0x50)
+
+
+def test_info_cache(smbus, i2c_bus):
+    cache = SFPInfoCache(max_entries=2)
+    modules = [FakeSFPModule(smbus, serial=f"SIM{i}") for i in range(3)]
+    keys = []
+    for module in modules:
+        module.insert()
+        keys.append(SFPInfoCache.read_key(i2c_bus, 0x50))
+    assert len(set(keys)) == 3
+
+    cache.put(keys[0], "first")
+    cache.put(keys[1], "second")
+    assert cache.get(keys[0]) == "first"
+    # Least recently used is evicted
+    cache.put(keys[2], "third")
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == "first"
+    assert (cache.hits, cache.misses) == (2, 1)
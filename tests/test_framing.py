@@ -0,0 +1,139 @@
+# Standard imports
+from threading import Event, Thread
+
+# Third-party imports
+import pytest
+
+# Local imports
+from message_handler import MessageHandler
+from rs485.framing import FrameParser, RS485Packet, crc16
+from simulation.gpio import FakeGPIO
+from simulation.rs485 import FakeRS485Bus
+
+
+def test_crc16_check_value():
+    # Standard check value for CRC-16/CCITT-FALSE
+    assert crc16(b"123456789") == 0x29B1
+
+
+@pytest.mark.parametrize("payload", [b"", b"\xa5" * 10, bytes(range(255))])
+def test_round_trip(payload):
+    packet = RS485Packet(address=3, command=7, payload=payload, sequence=9)
+    assert FrameParser().feed(packet.encode()) == [packet]
+
+
+def test_payload_too_long():
+    with pytest.raises(ValueError):
+        RS485Packet(1, 1, bytes(256)).encode()
+
+
+def test_split_anywhere():
+    packets = [RS485Packet(1, i, bytes([i]) * i, i) for i in range(5)]
+    stream = b"".join(x.encode() for x in packets)
+    parser = FrameParser()
+    received = []
+    for i in range(len(stream)):
+        received += parser.feed(stream[i:i + 1])
+    assert received == packets
+    assert parser.frames == 5
+    assert parser.discarded_bytes == 0
+
+
+def test_noise_discarded():
+    packet = RS485Packet(1, 2, b"data")
+    parser = FrameParser()
+    assert parser.feed(b"\x00\x01" + packet.encode() + b"\xff") == [packet]
+    assert parser.discarded_bytes == 3
+
+
+def test_bad_crc_resynchronises():
+    good = RS485Packet(1, 2, b"good")
+    corrupted = bytearray(RS485Packet(1, 2, b"bad").encode())
+    corrupted[-1] ^= 0xFF
+    parser = FrameParser()
+    assert parser.feed(bytes(corrupted) + good.encode()) == [good]
+    assert parser.crc_errors == 1
+
+
+def test_idle_drops_incomplete_frame():
+    packet = RS485Packet(1, 2, b"data")
+    # A sync byte in noise claiming a long payload holds back the frame
+    parser = FrameParser()
+    assert parser.feed(b"\xa5\x01\x00\x02\xff" + packet.encode()) == []
+    assert parser.idle() == [packet]
+    assert parser.buffer == bytearray()
+
+
+def test_reset_counts_discarded():
+    parser = FrameParser()
+    parser.feed(RS485Packet(1, 2, b"data").encode()[:4])
+    parser.reset()
+    assert parser.discarded_bytes == 4
+    assert parser.feed(b"") == []
+
+
+class Card:
+    """
+    Answers every request on a FakeRS485Bus from a thread
+    """
+
+    def __init__(self, bus: FakeRS485Bus, delay_s: float = 0):
+        self.port = bus.port(timeout=0.005)
+        self.delay = delay_s
+        self.stopped = Event()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        parser = FrameParser()
+        while not self.stopped.is_set():
+            data = self.port.read(max(1, self.port.in_waiting))
+            for request in parser.feed(data) if data else parser.idle():
+                if self.stopped.wait(self.delay):
+                    return
+                response = RS485Packet(
+                    0, request.command, b"ok", request.sequence
+                )
+                self.port.write(response.encode())
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def make_handler(bus: FakeRS485Bus, timeout: float) -> MessageHandler:
+    return MessageHandler(
+        FakeGPIO(),
+        "",
+        0,
+        timeout=timeout,
+        port=bus.port(),
+    )
+
+
+def test_message_handler_query():
+    bus = FakeRS485Bus()
+    handler = make_handler(bus, 1)
+    card = Card(bus)
+    try:
+        for command in range(3):
+            response = handler.query(RS485Packet(1, command))
+            assert response is not None
+            assert response.command == command
+            assert response.payload == b"ok"
+    finally:
+        card.stop()
+
+
+def test_message_handler_discards_late_response():
+    bus = FakeRS485Bus()
+    handler = make_handler(bus, 0.05)
+    card = Card(bus, delay_s=0.1)
+    try:
+        assert handler.query(RS485Packet(1, 1)) is None
+        # The late answer to the first query isn't taken for this one
+        response = handler.query(RS485Packet(1, 2), timeout=1)
+        assert response is not None
+        assert response.command == 2
+    finally:
+        card.stop()
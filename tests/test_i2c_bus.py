@@ -0,0 +1,68 @@
+# Standard imports
+from threading import Thread
+
+# Third-party imports
+import pytest
+
+# Local imports
+from i2c.i2c_bus import I2CBus
+from simulation.i2c import FakeSMBus
+
+
+@pytest.fixture
+def smbus() -> FakeSMBus:
+    smbus = FakeSMBus()
+    smbus.add_device(0x50, bytes(range(256)))
+    return smbus
+
+
+def test_read_ranges_coalesced(smbus):
+    bus = I2CBus(smbus, max_gap=8)
+    values = bus.read_ranges(0x50, [(40, 2), (0, 4), (10, 1), (100, 3)])
+    assert values == [[40, 41], [0, 1, 2, 3], [10], [100, 101, 102]]
+    # 0-3 and 10 are within max_gap so are one transfer, the others not
+    assert smbus.transactions == 3
+    assert bus.read_registers(0x50, [5, 3, 5]) == {3: 3, 5: 5}
+
+
+def test_block_read_without_i2c_rdwr(smbus):
+    bus = I2CBus(smbus)
+    bus.rdwr_supported = False
+    # SMBus block reads are split at 32 bytes
+    assert bus.read_block(0x50, 0, 40) == list(range(40))
+    assert smbus.transactions == 2
+
+
+def test_other_methods_passed_through(smbus):
+    bus = I2CBus(smbus)
+    assert bus.devices is smbus.devices
+    # Not wrapped by I2CBus, still run under the lock and counted against
+    # the address given
+    bus.add_device(0x51, b"\x07")
+    assert bus.read_byte_data(0x51, 0) == 7
+    assert bus.stats[0x51].transactions == 2
+
+
+def test_errors_counted(smbus):
+    bus = I2CBus(smbus)
+    with pytest.raises(OSError):
+        bus.read_byte_data(0x20, 0)
+    assert bus.stats[0x20].errors == 1
+    assert bus.stats[0x20].transactions == 1
+
+
+def test_threads_lose_no_counts(smbus):
+    bus = I2CBus(smbus)
+
+    def read():
+        for register in range(500):
+            bus.read_byte_data(0x50, register % 256)
+
+    threads = [Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = bus.stats[0x50]
+    assert stats.transactions == 2000
+    assert stats.bytes_read == 2000
@@ -0,0 +1,80 @@
+# Standard imports
+
+# Third-party imports
+import pytest
+
+# Local imports
+from sfp.line_monitor import LineMonitor
+from simulation.gpio import FakeGPIO
+
+
+class NoEdgeGPIO(FakeGPIO):
+    def add_edge_callback(self, callback) -> None:
+        raise OSError("Line busy")
+
+
+def test_edge_reported_after_debounce(clock):
+    gpio = FakeGPIO()
+    edges = []
+    monitor = LineMonitor(
+        gpio.read, gpio, debounce_s=0.05, on_edge=edges.append, clock=clock
+    )
+    assert monitor.edge_driven
+    assert monitor.settle_in() is None
+
+    gpio.set_level(True)
+    assert edges == [True]
+    assert monitor.update() is False
+    assert monitor.settle_in() == pytest.approx(0.05)
+
+    clock.time = 0.05
+    assert monitor.settle_in() == 0
+    assert monitor.update() is True
+    assert monitor.settle_in() is None
+
+
+def test_glitch_shorter_than_debounce_ignored(clock):
+    gpio = FakeGPIO()
+    monitor = LineMonitor(gpio.read, gpio, debounce_s=0.05, clock=clock)
+    gpio.set_level(True)
+    clock.time = 0.02
+    gpio.set_level(False)
+    assert monitor.settle_in() is None
+    clock.time = 0.1
+    assert monitor.update() is False
+    assert monitor.edges == 2
+
+
+def test_bounce_restarts_debounce(clock):
+    gpio = FakeGPIO()
+    monitor = LineMonitor(gpio.read, gpio, debounce_s=0.05, clock=clock)
+    gpio.set_level(True)
+    clock.time = 0.02
+    gpio.set_level(False)
+    clock.time = 0.03
+    gpio.set_level(True)
+    clock.time = 0.06
+    assert monitor.update() is False
+    clock.time = 0.08
+    assert monitor.update() is True
+
+
+def test_polls_without_edge_events(clock):
+    gpio = NoEdgeGPIO(value=True)
+    monitor = LineMonitor(gpio.read, gpio, debounce_s=0.05, clock=clock)
+    assert not monitor.edge_driven
+    assert monitor.update() is True
+
+    # No callback, so the change is only seen by update()
+    gpio.value = False
+    assert monitor.settle_in() is None
+    assert monitor.update() is True
+    clock.time = 0.05
+    assert monitor.update() is False
+
+
+def test_no_debounce(clock):
+    gpio = FakeGPIO()
+    monitor = LineMonitor(gpio.read, gpio, clock=clock)
+    gpio.set_level(True)
+    assert monitor.update() is True
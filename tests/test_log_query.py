@@ -0,0 +1,102 @@
+# Standard imports
+from datetime import datetime, timezone
+from pathlib import Path
+import json
+
+# Third-party imports
+
+
+# Local imports
+from warning_handler.log_query import LogIndex, NotificationQuery
+from warning_handler.log_rotation import segment_name
+
+
+def notification(node: str, level: str, second: int) -> str:
+    return json.dumps(
+        {
+            "mac_address": "01:23:45:67:89:AB",
+            "node_name": node,
+            "category": "test",
+            "message": f"{node} {second}",
+            "time": f"2024-10-17T16:10:{second:02d}.000+00:00",
+            "level": level,
+        }
+    )
+
+
+def append(path: Path, *lines: str) -> None:
+    with open(path, "a") as file:
+        file.write("".join(x + "\n" for x in lines))
+
+
+def rotate(log_file: Path, second: int) -> Path:
+    rotation_time = datetime(2024, 10, 17, 16, 10, second, 0, timezone.utc)
+    segment = log_file.with_name(segment_name(log_file, rotation_time))
+    log_file.rename(segment)
+    return segment
+
+
+def messages(index: LogIndex, **kwargs) -> list[str]:
+    return [x["message"] for x in index.query(NotificationQuery(**kwargs))]
+
+
+def test_query_filters(tmp_path: Path):
+    log_file = tmp_path / "full_log.jsonl"
+    append(
+        log_file,
+        notification("a", "info", 1),
+        notification("b", "warning", 2),
+        notification("a", "error", 3),
+    )
+    with LogIndex(log_file) as index:
+        assert messages(index, node_name="a") == ["a 1", "a 3"]
+        assert messages(index, level="warning") == ["b 2"]
+        assert messages(
+            index, since=datetime(2024, 10, 17, 16, 10, 2, 0, timezone.utc)
+        ) == ["b 2", "a 3"]
+
+
+def test_live_log_indexed_incrementally(tmp_path: Path):
+    log_file = tmp_path / "full_log.jsonl"
+    append(log_file, notification("a", "info", 1))
+    with LogIndex(log_file) as index:
+        assert messages(index) == ["a 1"]
+        # Partly written line is left for next time
+        with open(log_file, "a") as file:
+            file.write(notification("b", "info", 2)[:10])
+        assert messages(index) == ["a 1"]
+        with open(log_file, "a") as file:
+            file.write(notification("b", "info", 2)[10:] + "\n")
+        assert messages(index, node_name="b") == ["b 2"]
+
+
+def test_rotated_log_reindexed_from_start(tmp_path: Path):
+    log_file = tmp_path / "full_log.jsonl"
+    append(log_file, notification("a", "info", 1))
+    with LogIndex(log_file) as index:
+        index.update()
+        rotate(log_file, 2)
+        # The new file is already longer than the old one was, so only
+        # the change of inode shows it's been rotated
+        append(
+            log_file,
+            notification("c", "info", 3),
+            notification("b", "info", 4),
+        )
+        assert messages(index) == ["a 1", "c 3", "b 4"]
+        assert messages(index, node_name="c") == ["c 3"]
+
+
+def test_segments_without_match_not_read(tmp_path: Path):
+    log_file = tmp_path / "full_log.jsonl"
+    append(log_file, notification("a", "info", 1))
+    old = rotate(log_file, 2)
+    append(log_file, notification("b", "info", 3))
+    with LogIndex(log_file) as index:
+        index.update()
+        assert index.candidate_segments(NotificationQuery(node_name="b")) == [
+            log_file
+        ]
+        assert index.candidate_segments(NotificationQuery(node_name="a")) == [
+            old
+        ]
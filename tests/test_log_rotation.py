@@ -0,0 +1,71 @@
+# Standard imports
+from datetime import datetime, timezone
+from pathlib import Path
+import gzip
+import time
+
+# Third-party imports
+
+
+# Local imports
+from warning_handler.log_rotation import (
+    LogRotator,
+    list_segments,
+    segment_name,
+    segment_time,
+)
+from warning_handler.log_sink import LogSink
+
+
+def test_segment_name_round_trips(tmp_path: Path):
+    log_file = tmp_path / "full_log.jsonl"
+    rotation_time = datetime(2024, 10, 17, 16, 10, 0, 123000, timezone.utc)
+    name = segment_name(log_file, rotation_time)
+    assert name == "full_log.20241017T161000123Z.jsonl"
+    assert segment_time(log_file, tmp_path / name) == rotation_time
+    assert segment_time(log_file, tmp_path / (name + ".gz")) == rotation_time
+    assert segment_time(log_file, tmp_path / "other.jsonl") is None
+
+
+def test_should_rotate(tmp_path: Path):
+    log_file = tmp_path / "full_log.jsonl"
+    now = datetime.now(tz=timezone.utc)
+    rotator = LogRotator(max_bytes=100, max_age_s=60)
+    assert not rotator.should_rotate(log_file, 0, now)
+    assert not rotator.should_rotate(log_file, 99, now)
+    assert rotator.should_rotate(log_file, 100, now)
+    old = now.replace(year=now.year - 1)
+    assert rotator.should_rotate(log_file, 1, old)
+
+
+def test_rotated_segments_compressed_and_expired(tmp_path: Path):
+    log_file = tmp_path / "full_log.jsonl"
+    rotator = LogRotator(retention_segments=2)
+    for i in range(3):
+        log_file.write_text(f"{i}\n")
+        rotator.rotate(log_file)
+        # Segment names are only unique to the millisecond
+        time.sleep(0.002)
+        rotator.wait()
+    segments = list_segments(log_file)
+    assert [x.suffix for x in segments] == [".gz", ".gz"]
+    with gzip.open(segments[-1], "rt") as file:
+        assert file.read() == "2\n"
+    assert not log_file.exists()
+
+
+def test_sink_rolls_over_when_full(tmp_path: Path):
+    full_log = tmp_path / "full_log.jsonl"
+    sink = LogSink(
+        flush_max_records=1000,
+        rotator=LogRotator(max_bytes=10, compress=False),
+    )
+    sink.open(full_log, tmp_path / "warning_log.jsonl")
+    sink.write("0123456789")
+    sink.flush()
+    sink.write("next")
+    sink.close()
+    segments = list_segments(full_log)
+    assert len(segments) == 1
+    assert segments[0].read_text() == "0123456789\n"
+    assert full_log.read_text() == "next\n"
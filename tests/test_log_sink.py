@@ -0,0 +1,74 @@
+# Standard imports
+from pathlib import Path
+import time
+
+# Third-party imports
+
+
+# Local imports
+from warning_handler.log_sink import LogSink
+
+
+def lines(path: Path) -> list[str]:
+    return path.read_text().splitlines() if path.exists() else []
+
+
+def wait_for(condition, timeout_s: float = 5) -> bool:
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_lines_before_open_are_written(tmp_path: Path):
+    full_log, warning_log = tmp_path / "full.jsonl", tmp_path / "warn.jsonl"
+    sink = LogSink(flush_interval_s=60)
+    sink.write("info")
+    sink.write("warning", warning=True)
+    sink.flush()
+    assert not full_log.exists()
+
+    sink.open(full_log, warning_log)
+    sink.close()
+    assert lines(full_log) == ["info", "warning"]
+    assert lines(warning_log) == ["warning"]
+
+
+def test_oldest_dropped_when_writer_stalls(tmp_path: Path):
+    full_log = tmp_path / "full.jsonl"
+    sink = LogSink(flush_interval_s=60, max_pending_records=3)
+    for i in range(5):
+        sink.write(str(i))
+    assert sink.dropped_records == 2
+
+    sink.open(full_log, tmp_path / "warn.jsonl")
+    sink.close()
+    assert lines(full_log) == ["2", "3", "4"]
+
+
+def test_urgent_write_flushed_straight_away(tmp_path: Path):
+    full_log = tmp_path / "full.jsonl"
+    sink = LogSink(flush_interval_s=60)
+    sink.open(full_log, tmp_path / "warn.jsonl")
+    try:
+        sink.write("queued")
+        time.sleep(0.05)
+        assert lines(full_log) == []
+        sink.write("error", warning=True, urgent=True)
+        assert wait_for(lambda: lines(full_log) == ["queued", "error"])
+    finally:
+        sink.close()
+
+
+def test_batch_size_triggers_flush(tmp_path: Path):
+    full_log = tmp_path / "full.jsonl"
+    sink = LogSink(flush_interval_s=60, flush_max_records=3)
+    sink.open(full_log, tmp_path / "warn.jsonl")
+    try:
+        for i in range(3):
+            sink.write(str(i))
+        assert wait_for(lambda: len(lines(full_log)) == 3)
+    finally:
+        sink.close()
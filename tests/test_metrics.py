@@ -0,0 +1,84 @@
+# Standard imports
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+# Third-party imports
+import pytest
+
+# Local imports
+from metrics.metrics import MetricsPublisher, MetricsRegistry, PrometheusServer
+
+
+def test_same_metric_returned_by_name_and_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests", {"a": "1"})
+    assert registry.counter("requests_total", labels={"a": "1"}) is counter
+    other = registry.counter("requests_total", labels={"a": "2"})
+    assert other is not counter
+    with pytest.raises(AssertionError):
+        registry.gauge("requests_total", labels={"a": "1"})
+
+
+def test_snapshot():
+    registry = MetricsRegistry()
+    registry.counter("events_total").inc(3)
+    queue = [1, 2]
+    registry.gauge("queue_depth", func=lambda: len(queue))
+    histogram = registry.histogram("wait_seconds", buckets=(0.1, 1))
+    for x in (0.05, 0.5, 5):
+        histogram.observe(x)
+    queue.append(3)
+    assert registry.snapshot() == {
+        "events_total": 3,
+        "queue_depth": 3,
+        "wait_seconds": {"count": 3, "sum": 5.55, "buckets": [1, 1, 1]},
+    }
+
+
+def test_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("events_total", "Events", {"kind": "a"}).inc()
+    histogram = registry.histogram("wait_seconds", "Wait", buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    assert registry.prometheus_text().splitlines() == [
+        "# HELP events_total Events",
+        "# TYPE events_total counter",
+        'events_total{kind="a"} 1',
+        "# HELP wait_seconds Wait",
+        "# TYPE wait_seconds histogram",
+        'wait_seconds_bucket{le="0.1"} 1',
+        'wait_seconds_bucket{le="1"} 2',
+        'wait_seconds_bucket{le="+Inf"} 2',
+        "wait_seconds_sum 0.55",
+        "wait_seconds_count 2",
+    ]
+
+
+def test_publisher_period(clock):
+    registry = MetricsRegistry()
+    registry.counter("events_total")
+    published = []
+    publisher = MetricsPublisher(
+        lambda name, values: published.append((name, values)),
+        registry,
+        period_s=10,
+        clock=clock,
+    )
+    publisher.tick()
+    clock.time = 9
+    publisher.tick()
+    clock.time = 10
+    publisher.tick()
+    assert published == [("metrics", {"events_total": 0})] * 2
+
+
+def test_prometheus_server():
+    registry = MetricsRegistry()
+    registry.counter("events_total").inc()
+    with PrometheusServer(registry, port=0) as server:
+        url = f"http://{server.host}:{server.port}"
+        with urlopen(f"{url}/metrics") as response:
+            assert "events_total 1" in response.read().decode("utf-8")
+        with pytest.raises(HTTPError):
+            urlopen(f"{url}/other")
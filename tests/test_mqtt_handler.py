@@ -0,0 +1,116 @@
+# Standard imports
+from queue import Queue
+import json
+
+# Third-party imports
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+import pytest
+
+# Local imports
+from mqtt import mqtt_handler
+from mqtt.local_broker import LocalBroker
+from mqtt.mqtt_handler import MqttHandler
+
+
+@pytest.fixture
+def broker():
+    broker = LocalBroker()
+    broker.start_in_thread()
+    yield broker
+    broker.stop_thread()
+
+
+def announced(broker: LocalBroker, **kwargs) -> dict:
+    """
+    Connects a primary to broker and returns its first connected
+    /status/discovery message
+    """
+    received = Queue()
+    monitor = mqtt.Client(CallbackAPIVersion.VERSION2)
+    monitor.on_connect = lambda *args: monitor.subscribe("/status/discovery")
+    monitor.on_subscribe = lambda *args: received.put(None)
+    monitor.on_message = lambda c, u, msg: received.put(
+        json.loads(msg.payload)
+    )
+    monitor.connect(broker.host, broker.port)
+    monitor.loop_start()
+    try:
+        received.get(timeout=5)
+        handler = MqttHandler(
+            broker.host,
+            broker.port,
+            "primary",
+            discovery_info={"role": "primary"},
+            **kwargs,
+        )
+        with handler:
+            message = received.get(timeout=5)
+    finally:
+        monitor.loop_stop()
+    assert message["status"] == "connected"
+    return message
+
+
+def test_primary_on_loopback_announces_lan_address(broker, monkeypatch):
+    # The broker is on this node so the connection is over loopback
+    assert broker.host == "127.0.0.1"
+    monkeypatch.setattr(
+        mqtt_handler, "routed_ip_address", lambda: "192.168.0.10"
+    )
+    assert announced(broker)["ip_address"] == "192.168.0.10"
+
+
+def test_advertised_address_overrides(broker):
+    message = announced(broker, advertise_ip_address="10.0.0.5")
+    assert message["ip_address"] == "10.0.0.5"
+
+
+def queue_messages(handler: MqttHandler, count: int) -> None:
+    for i in range(count):
+        msg = mqtt.MQTTMessage(topic=b"/test")
+        msg.payload = json.dumps({"i": i}).encode("utf-8")
+        handler.on_message(None, None, msg)
+
+
+def test_tick_handles_at_most_max_messages(broker):
+    with MqttHandler(
+        broker.host, broker.port, "node", tick_max_messages=3
+    ) as handler:
+        received = []
+        handler.register_callback("/test", received.append)
+        queue_messages(handler, 5)
+        assert handler.statistics.max_queue_depth == 5
+
+        handler.tick()
+        assert [x["i"] for x in received] == [0, 1, 2]
+        assert handler.statistics.queue_depth == 2
+        assert handler.statistics.budget_exhausted == 1
+
+        handler.tick()
+        assert len(received) == 5
+        assert handler.statistics.queue_depth == 0
+        assert handler.statistics.budget_exhausted == 1
+
+
+def test_tick_stops_when_time_budget_used(broker, clock, monkeypatch):
+    monkeypatch.setattr(mqtt_handler, "monotonic", clock)
+    with MqttHandler(
+        broker.host,
+        broker.port,
+        "node",
+        tick_max_messages=100,
+        tick_time_budget_s=0.02,
+    ) as handler:
+        received = []
+
+        def slow(message_dict: dict) -> None:
+            received.append(message_dict)
+            clock.time += 0.01
+
+        handler.register_callback("/test", slow)
+        queue_messages(handler, 5)
+        handler.tick()
+        assert len(received) == 2
+        assert handler.statistics.queue_depth == 3
+        assert handler.statistics.max_latency_s == pytest.approx(0.01)
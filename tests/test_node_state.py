@@ -0,0 +1,65 @@
+# Standard imports
+from datetime import timedelta
+
+# Third-party imports
+
+
+# Local imports
+from warning_handler.node_state import NodeNotificationStore
+from warning_handler.warning_handler import Error, Warning
+
+
+def warning(node: str, mac: str = "01:23:45:67:89:AB", count: int = 1):
+    return Warning(mac, node, "test", "message", count=count)
+
+
+def test_buffers_bounded_but_totals_count_everything():
+    store = NodeNotificationStore(max_per_node=3)
+    for _ in range(5):
+        store.add_warning(warning("a"))
+    store.add_warning(warning("a", count=10))
+    state = store.get("a")
+    assert len(state.warnings) == 3
+    assert state.total_warnings == 15
+    assert store.has_warnings("a")
+    assert not store.has_errors("a")
+    assert not store.has_warnings("b")
+
+
+def test_acknowledge_by_name_or_mac():
+    store = NodeNotificationStore()
+    store.add_warning(warning("a", mac="0A"))
+    store.add_error(Error("0A", "a", "test", "message"))
+    store.add_warning(warning("b", mac="0B"))
+
+    store.acknowledge(mac_address="0A")
+    assert not store.has_warnings("a")
+    assert not store.has_errors("a")
+    assert store.get("a").total_errors == 0
+    assert store.has_warnings("b")
+
+    store.acknowledge(node_name="b")
+    assert not store.has_warnings("b")
+    # Unknown nodes are ignored
+    store.acknowledge(node_name="c")
+
+
+def test_mac_lookup_follows_node():
+    store = NodeNotificationStore()
+    store.add_warning(warning("a", mac="0A"))
+    store.add_warning(warning("a", mac="0C"))
+    assert store.get(mac_address="0C") is store.get("a")
+
+
+def test_expire_drops_old_notifications():
+    store = NodeNotificationStore(max_age_s=60)
+    old = warning("a")
+    new = warning("a")
+    new.creation_time = old.creation_time + timedelta(seconds=30)
+    store.add_warning(old)
+    store.add_warning(new)
+
+    store.expire(old.creation_time + timedelta(seconds=70))
+    assert list(store.get("a").warnings) == [new]
+    store.expire(old.creation_time + timedelta(seconds=100))
+    assert not store.has_warnings("a")
@@ -0,0 +1,114 @@
+# Standard imports
+from pathlib import Path
+
+# Third-party imports
+import pytest
+
+# Local imports
+from warning_handler.outbox import Outbox
+
+
+@pytest.fixture(autouse=True)
+def outbox_clock(clock, monkeypatch):
+    monkeypatch.setattr("warning_handler.outbox.monotonic", clock)
+
+
+def replay_all(outbox: Outbox) -> list[tuple[str, str]]:
+    sent = []
+
+    def publish(topic: str, payload: str) -> bool:
+        sent.append((topic, payload))
+        return True
+
+    outbox.replay(publish)
+    return sent
+
+
+def test_replay_rate_limited(clock):
+    outbox = Outbox(batch_size=3, max_rate_per_s=10)
+    for i in range(10):
+        outbox.append("/test", str(i))
+    assert [payload for _, payload in replay_all(outbox)] == ["0", "1", "2"]
+    assert replay_all(outbox) == []
+
+    clock.time += 0.2
+    assert [payload for _, payload in replay_all(outbox)] == ["3", "4"]
+    # Tokens never build up beyond one batch
+    clock.time += 10
+    assert len(replay_all(outbox)) == 3
+    assert len(outbox) == 2
+
+
+def test_unsent_messages_survive_restart(tmp_path: Path):
+    path = tmp_path / "outbox.jsonl"
+    outbox = Outbox(batch_size=2)
+    outbox.open(path)
+    for i in range(5):
+        outbox.append("/test", str(i))
+    assert len(replay_all(outbox)) == 2
+    outbox.close()
+
+    outbox = Outbox(batch_size=10)
+    outbox.open(path)
+    assert [payload for _, payload in replay_all(outbox)] == ["2", "3", "4"]
+    # Everything sent so the file starts again
+    assert path.stat().st_size == 0
+    outbox.close()
+
+    outbox = Outbox()
+    outbox.open(path)
+    assert len(outbox) == 0
+
+
+def test_partly_written_line_ignored(tmp_path: Path):
+    path = tmp_path / "outbox.jsonl"
+    path.write_text(
+        '{"topic": "/test", "payload": "0"}\n{"topic": "/test", "pay'
+    )
+    outbox = Outbox()
+    outbox.open(path)
+    assert replay_all(outbox) == [("/test", "0")]
+
+
+def test_messages_before_open_are_persisted(tmp_path: Path):
+    path = tmp_path / "outbox.jsonl"
+    outbox = Outbox()
+    outbox.append("/test", "early")
+    outbox.open(path)
+    outbox.close()
+
+    outbox = Outbox()
+    outbox.open(path)
+    assert replay_all(outbox) == [("/test", "early")]
+
+
+def test_oldest_dropped_when_full():
+    outbox = Outbox(batch_size=10, max_records=3)
+    for i in range(5):
+        outbox.append("/test", str(i))
+    assert outbox.dropped_records == 2
+    assert [payload for _, payload in replay_all(outbox)] == ["2", "3", "4"]
+
+
+def test_failed_publish_stays_queued(tmp_path: Path):
+    path = tmp_path / "outbox.jsonl"
+    outbox = Outbox(batch_size=10)
+    outbox.open(path)
+    for i in range(3):
+        outbox.append("/test", str(i))
+    sent = []
+
+    def publish(topic: str, payload: str) -> bool:
+        # Connection drops after the first message
+        if sent:
+            return False
+        sent.append(payload)
+        return True
+
+    assert outbox.replay(publish) == 1
+    assert len(outbox) == 2
+    outbox.close()
+
+    outbox = Outbox(batch_size=10)
+    outbox.open(path)
+    assert [payload for _, payload in replay_all(outbox)] == ["1", "2"]
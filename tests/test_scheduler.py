@@ -0,0 +1,108 @@
+# Standard imports
+from threading import Thread
+from typing import Optional
+import logging
+
+# Third-party imports
+import pytest
+
+# Local imports
+from scheduler.scheduler import Scheduler
+
+
+@pytest.fixture
+def scheduler(clock) -> Scheduler:
+    return Scheduler(clock=clock, sleep=None)
+
+
+def test_tasks_run_in_deadline_order(clock, scheduler):
+    runs = []
+    scheduler.add_task("slow", lambda: runs.append("slow"), 1)
+    scheduler.add_task("fast", lambda: runs.append("fast"), 0.3)
+
+    delays: list[Optional[float]] = []
+    while len(runs) < 6:
+        delays.append(scheduler.run_once())
+        clock.time += delays[-1]
+    assert runs == ["slow", "fast", "fast", "fast", "fast", "slow"]
+    assert delays[:2] == pytest.approx([0.3, 0.3])
+
+
+def test_wake_only_brings_deadline_forward(clock, scheduler):
+    runs = []
+    scheduler.add_task("task", lambda: runs.append(clock.time), 1, 1)
+    scheduler.wake("task", 2)
+    assert scheduler.run_once() == pytest.approx(1)
+
+    scheduler.wake("task", 0.5)
+    assert scheduler.run_once() == pytest.approx(0.5)
+    clock.time = 0.5
+    scheduler.run_once()
+    assert runs == [0.5]
+    # Period continues from the woken run
+    assert scheduler.run_once() == pytest.approx(1)
+
+
+def test_wake_only_task(clock, scheduler):
+    runs = []
+    scheduler.add_task("event", lambda: runs.append(clock.time))
+    assert scheduler.run_once() is None
+    scheduler.wake("event")
+    scheduler.run_once()
+    assert runs == [0]
+    assert scheduler.run_once() is None
+    # Unknown tasks are ignored
+    scheduler.wake("missing")
+
+
+def test_missed_deadlines_skipped(clock, scheduler, caplog):
+    def slow():
+        clock.time += 0.35
+
+    caplog.set_level(logging.DEBUG)
+    task = scheduler.add_task("slow", slow, 0.1)
+    scheduler.run_once()
+    # Kept below WarningHandler's level so it isn't broadcast
+    assert caplog.records
+    assert all(record.levelno < logging.INFO for record in caplog.records)
+    assert task.stats.overruns == 1
+    assert task.stats.missed_deadlines == 3
+    # Next run is a period after it finished, not straight away
+    assert scheduler.run_once() == pytest.approx(0.1)
+
+
+def test_exception_doesnt_stop_task(clock, scheduler):
+    def fail():
+        raise RuntimeError("oops")
+
+    task = scheduler.add_task("fail", fail, 1)
+    scheduler.run_once()
+    clock.time = 1
+    scheduler.run_once()
+    assert task.stats.runs == 2
+
+
+def test_removed_task_not_run(clock, scheduler):
+    runs = []
+    scheduler.add_task("task", lambda: runs.append(clock.time), 1)
+    scheduler.remove_task("task")
+    assert scheduler.run_once() is None
+    assert runs == []
+
+
+def test_wake_from_another_thread_interrupts_wait():
+    scheduler = Scheduler()
+    runs = []
+
+    def event():
+        runs.append(True)
+        scheduler.stop()
+
+    scheduler.add_task("idle", lambda: None, 60, 60)
+    scheduler.add_task("event", event)
+    thread = Thread(target=scheduler.run)
+    thread.start()
+    scheduler.wake("event")
+    thread.join(5)
+    assert not thread.is_alive()
+    assert runs == [True]
@@ -0,0 +1,92 @@
+# Standard imports
+from pathlib import Path
+import json
+import subprocess
+import sys
+
+# Third-party imports
+import pytest
+
+# Local imports
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_scenario(
+    scenario: str, output: Path, *args: str, speed: float = 0
+) -> dict:
+    # The hardware backend is process wide, so each scenario gets a
+    # process of its own
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "simulation.simulator",
+            scenario,
+            "--speed",
+            str(speed),
+            "--output",
+            str(output),
+            *args,
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    return json.loads(output.read_text())
+
+
+@pytest.mark.parametrize(
+    "scenario, reactions",
+    [
+        ("sfp_insert_remove", ["tx_enable", "tx_disable"]),
+        ("tx_fault_storm", ["tx_enable", "tx_fault"]),
+    ],
+)
+def test_sfp_reactions(scenario, reactions, tmp_path: Path):
+    # Debounce plus a tick period, with room for the simulator's steps
+    limits = [f"--max-latency-ms={name}=200" for name in reactions]
+    report = run_scenario(scenario, tmp_path / "report.json", *limits)
+    for name in reactions:
+        latency = report["latencies"][name]
+        assert latency["count"] > 0
+        assert latency["timeouts"] == 0
+    assert report["tasks"]["sfp"]["missed_deadlines"] == 0
+
+
+def test_broker_outage(tmp_path: Path):
+    # Reconnecting is paced by paho in real time, so this can't run
+    # flat out
+    report = run_scenario(
+        "broker_outage",
+        tmp_path / "report.json",
+        "--param=outages=2",
+        "--param=down_s=10",
+        "--param=up_s=30",
+        speed=20,
+    )
+    for name in ("mqtt_reconnect", "outbox_drained"):
+        latency = report["latencies"][name]
+        assert latency["count"] == 2
+        assert latency["timeouts"] == 0
+
+
+def test_warning_storm(tmp_path: Path):
+    reactions = ["tx_enable", "tx_disable"]
+    limits = [f"--max-latency-ms={name}=200" for name in reactions]
+    report = run_scenario(
+        "warning_storm",
+        tmp_path / "report.json",
+        "--param=nodes=10",
+        "--param=rate_per_s=200",
+        "--param=duration_s=12",
+        *limits,
+    )
+    for name in reactions:
+        assert report["latencies"][name]["count"] > 0
+    # Warnings from the other nodes were handled, in bounded batches
+    assert report["mqtt"]["messages_processed"] > 1000
+    assert report["tasks"]["sfp"]["missed_deadlines"] == 0
@@ -0,0 +1,92 @@
+# Standard imports
+from math import sqrt
+import random
+import statistics
+
+# Third-party imports
+import pytest
+
+# Local imports
+from timing.statistics import AllanDeviation, RingBuffer
+
+
+def test_ring_buffer_window():
+    buffer = RingBuffer(3)
+    assert buffer.mean() is None
+    assert buffer.std() is None
+    assert [buffer.push(x) for x in (1, 2, 3, 4)] == [None, None, None, 1]
+    assert list(buffer) == [2, 3, 4]
+    assert (buffer[0], buffer[-1]) == (2, 4)
+    with pytest.raises(IndexError):
+        buffer[3]
+    assert buffer.full
+    assert buffer.mean() == pytest.approx(3)
+    assert buffer.rms() == pytest.approx(sqrt(29 / 3))
+    assert buffer.std() == pytest.approx(1)
+
+    buffer.clear()
+    assert len(buffer) == 0
+    buffer.push(5)
+    assert list(buffer) == [5]
+    assert buffer.mean() == 5
+
+
+def test_ring_buffer_matches_direct_calculation():
+    rng = random.Random(1)
+    buffer = RingBuffer(50)
+    # Typical PPS offsets, after enough pushes for a few resyncs
+    values = [rng.gauss(1e-7, 2e-8) for _ in range(1000)]
+    buffer.extend(values)
+    window = values[-50:]
+    assert buffer.mean() == pytest.approx(statistics.fmean(window))
+    assert buffer.std() == pytest.approx(statistics.stdev(window))
+    assert buffer.rms() == pytest.approx(
+        sqrt(statistics.fmean(x * x for x in window))
+    )
+
+
+def direct_adev(phase: list[float], m: int, tau0: float) -> float:
+    differences = [
+        phase[i + 2 * m] - 2 * phase[i + m] + phase[i]
+        for i in range(len(phase) - 2 * m)
+    ]
+    tau = m * tau0
+    return sqrt(
+        sum(d * d for d in differences) / (2 * tau * tau * len(differences))
+    )
+
+
+def test_allan_deviation_matches_direct_calculation():
+    rng = random.Random(2)
+    phase = [rng.gauss(0, 1e-9) for _ in range(200)]
+    adev = AllanDeviation(tau0_s=8, window=1000, averaging_factors=(1, 4))
+    for x in phase:
+        adev.push(x)
+    for m in (1, 4):
+        assert adev.deviation(m) == pytest.approx(direct_adev(phase, m, 8))
+
+
+def test_allan_deviation_of_frequency_offset_and_drift():
+    adev = AllanDeviation(tau0_s=1, window=100)
+    assert adev.deviation() is None
+
+    # A constant frequency offset doesn't contribute
+    for t in range(100):
+        adev.push(1e-6 * t)
+    assert adev.deviation(1) == pytest.approx(0, abs=1e-15)
+
+    # Linear frequency drift gives drift * tau / sqrt(2)
+    adev.clear()
+    drift = 1e-9
+    for t in range(100):
+        adev.push(0.5 * drift * t * t)
+    for tau, deviation in adev.deviations().items():
+        assert deviation == pytest.approx(drift * tau / sqrt(2))
+
+
+def test_allan_deviation_needs_enough_samples():
+    adev = AllanDeviation(tau0_s=1, window=10, averaging_factors=(1, 8))
+    for x in range(5):
+        adev.push(x)
+    assert adev.deviation(1) is not None
+    assert adev.deviation(8) is None
@@ -0,0 +1,105 @@
+# Standard imports
+from threading import Thread
+
+# Third-party imports
+
+
+# Local imports
+from warning_handler.storm_filter import StormFilter
+
+
+def admit(storms: StormFilter, message: str = "TX fault", **kwargs) -> bool:
+    notification = {
+        "level": "error",
+        "mac_address": "01:23:45:67:89:A0",
+        "node_name": "test node",
+        "category": "sfp",
+        "message": message,
+        "broadcast": True,
+    }
+    notification.update(kwargs)
+    return storms.admit(**notification)
+
+
+def test_repeats_counted_and_summarised(clock):
+    storms = StormFilter(window_s=10, clock=clock)
+    assert admit(storms)
+    for _ in range(5):
+        clock.time += 1
+        assert not admit(storms)
+    # A different message has its own window
+    assert admit(storms, "LOS")
+    assert storms.suppressed == 5
+    assert storms.expired() == []
+
+    clock.time = 10
+    (repeats,) = storms.expired()
+    assert repeats.count == 5
+    assert repeats.message == "TX fault"
+    assert repeats.first_time <= repeats.last_time
+    # The LOS window is still open
+    assert len(storms) == 1
+
+    # The next copy starts a new window
+    assert admit(storms)
+    assert not admit(storms)
+
+
+def test_window_without_repeats_not_summarised(clock):
+    storms = StormFilter(window_s=10, clock=clock)
+    admit(storms)
+    clock.time = 10
+    assert storms.expired() == []
+
+
+def test_ended_window_closed_on_admit(clock):
+    storms = StormFilter(window_s=10, clock=clock)
+    admit(storms)
+    admit(storms)
+    clock.time = 10
+    # expired() not called yet, the window still ends here
+    assert admit(storms)
+    (repeats,) = storms.expired()
+    assert repeats.count == 1
+
+
+def test_oldest_window_closed_when_full(clock):
+    storms = StormFilter(window_s=10, max_keys=2, clock=clock)
+    for message in ("a", "b"):
+        admit(storms, message)
+        admit(storms, message)
+    admit(storms, "c")
+    assert len(storms) == 2
+    # Closed early but kept for the next expired()
+    (repeats,) = storms.expired()
+    assert repeats.message == "a"
+
+
+def test_drain_closes_everything(clock):
+    storms = StormFilter(window_s=10, clock=clock)
+    for message in ("a", "b", "c"):
+        admit(storms, message)
+    admit(storms, "b")
+    assert [x.message for x in storms.drain()] == ["b"]
+    assert len(storms) == 0
+
+
+def test_zero_window_admits_everything(clock):
+    storms = StormFilter(window_s=0, clock=clock)
+    assert all(admit(storms) for _ in range(10))
+    assert storms.suppressed == 0
+
+
+def test_threads_lose_no_repeats(clock):
+    storms = StormFilter(window_s=10, clock=clock)
+    threads = [
+        Thread(target=lambda: [admit(storms) for _ in range(1000)])
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    (repeats,) = storms.drain()
+    assert repeats.count == 3999
+    assert storms.suppressed == 3999
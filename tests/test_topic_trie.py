@@ -0,0 +1,79 @@
+# Standard imports
+
+# Third-party imports
+import pytest
+
+# Local imports
+from mqtt.topic_trie import TopicTrie
+
+
+def make_trie(*topic_filters: str) -> TopicTrie:
+    trie = TopicTrie()
+    for topic_filter in topic_filters:
+        trie.insert(topic_filter, topic_filter)
+    return trie
+
+
+def test_exact_match():
+    trie = make_trie("a/b", "a/c")
+    assert trie.match("a/b") == ["a/b"]
+    assert trie.match("a") == []
+    assert trie.match("a/b/c") == []
+
+
+def test_single_level_wildcard():
+    trie = make_trie("a/+/c")
+    assert trie.match("a/b/c") == ["a/+/c"]
+    assert trie.match("a//c") == ["a/+/c"]
+    assert trie.match("a/b/d") == []
+    assert trie.match("a/b/c/d") == []
+
+
+def test_multi_level_wildcard_matches_parent():
+    trie = make_trie("a/#")
+    assert trie.match("a") == ["a/#"]
+    assert trie.match("a/b/c") == ["a/#"]
+    assert trie.match("b") == []
+
+
+def test_every_matching_filter_returned():
+    trie = make_trie("#", "a/#", "a/+", "a/b", "+/b")
+    assert sorted(trie.match("a/b")) == sorted(
+        ["#", "a/#", "a/+", "a/b", "+/b"]
+    )
+
+
+def test_wildcards_skip_system_topics():
+    trie = make_trie("#", "+/broker", "$SYS/#")
+    assert trie.match("$SYS/broker") == ["$SYS/#"]
+
+
+@pytest.mark.parametrize("topic_filter", ["a/#/b", "a/b#", "a/b+", "+a"])
+def test_invalid_filters_rejected(topic_filter):
+    with pytest.raises(ValueError):
+        TopicTrie().insert(topic_filter, None)
+
+
+def test_insert_replaces_value():
+    trie = TopicTrie()
+    trie.insert("a/+", 1)
+    trie.insert("a/+", 2)
+    assert len(trie) == 1
+    assert trie.get("a/+") == 2
+
+
+def test_remove_prunes_branches():
+    trie = make_trie("a/b/c", "a")
+    trie.remove("a/b/c")
+    assert "a/b/c" not in trie
+    assert len(trie) == 1
+    assert trie._root.children["a"].children == {}
+    assert trie.match("a") == ["a"]
+
+
+def test_remove_missing_raises():
+    trie = make_trie("a/b")
+    with pytest.raises(KeyError):
+        trie.remove("a")
+    with pytest.raises(KeyError):
+        trie.remove("a/c")
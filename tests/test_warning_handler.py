@@ -0,0 +1,140 @@
+# Standard imports
+import json
+import logging
+
+# Third-party imports
+import pytest
+
+# Local imports
+from warning_handler.warning_handler import (
+    LOCAL_ONLY,
+    RELAYED_NOTIFICATION,
+    Error,
+    Warning,
+    WarningHandler,
+)
+
+
+@pytest.fixture
+def handler():
+    # Not initialised, so nothing is written to disk or sent and anything
+    # broadcast is held in the outbox
+    handler = WarningHandler()
+    yield handler
+    handler.close()
+
+
+def record(level: int, message: str) -> logging.LogRecord:
+    return logging.LogRecord("test", level, __file__, 0, message, (), None)
+
+
+def test_json_built_once():
+    warning = Warning("01:23", "node", "test", "message")
+    line = warning.to_json()
+    assert warning.to_json() is line
+    assert str(warning) is line
+    assert json.loads(line) == {
+        "mac_address": "01:23",
+        "node_name": "node",
+        "category": "test",
+        "message": "message",
+        "time": warning.creation_time.isoformat(timespec="milliseconds"),
+        "level": "warning",
+    }
+    assert not hasattr(warning, "__dict__")
+
+
+def test_summary_json_has_counts():
+    error = Error("01:23", "node", "test", "message", 5, "first", "last")
+    x = json.loads(error.to_json())
+    assert x["level"] == "error"
+    assert (x["count"], x["first_time"], x["last_time"]) == (
+        5,
+        "first",
+        "last",
+    )
+
+
+def test_emit_stores_and_broadcasts(handler):
+    handler.emit(record(logging.WARNING, "local"))
+    state = handler.notifications.get(handler.node_name)
+    assert [x.message for x in state.warnings] == ["local"]
+    assert len(handler.outbox) == 1
+
+
+def test_emit_ignores_relayed_echo(handler):
+    echo = record(logging.WARNING, "[other] relayed")
+    setattr(echo, RELAYED_NOTIFICATION, {})
+    handler.emit(echo)
+    assert handler.notifications.get(handler.node_name) is None
+    assert len(handler.outbox) == 0
+
+
+def relayed(mac_address: str, message: str) -> dict:
+    return {
+        "mac_address": mac_address,
+        "node_name": f"node {mac_address}",
+        "category": "test",
+        "message": message,
+        "time": "2024-10-17T16:10:00.000+00:00",
+        "level": "warning",
+    }
+
+
+def test_relayed_notification_stored_not_rebroadcast(handler):
+    handler.rx_warnings(relayed("0A", "remote warning"))
+    handler.rx_errors(relayed("0A", "remote error"))
+    state = handler.notifications.get(mac_address="0A")
+    assert [x.message for x in state.warnings] == ["remote warning"]
+    assert [x.message for x in state.errors] == ["remote error"]
+    assert len(handler.outbox) == 0
+
+
+def test_own_broadcast_coming_back_ignored(handler):
+    handler.emit(record(logging.WARNING, "local"))
+    handler.rx_warnings(relayed(handler.mac_address, "local"))
+    state = handler.notifications.get(handler.node_name)
+    assert len(state.warnings) == 1
+    assert len(handler.outbox) == 1
+
+
+def test_echo_of_relayed_not_stored_twice(handler, caplog):
+    handler.echo_relayed = True
+    handler.logger = logging.getLogger("test_warning_handler")
+    # Route the echo back through the handler as logging would
+    handler.logger.addHandler(handler)
+    try:
+        with caplog.at_level(logging.WARNING):
+            handler.rx_warnings(relayed("0A", "remote"))
+    finally:
+        handler.logger.removeHandler(handler)
+    assert [x.getMessage() for x in caplog.records] == ["[node 0A] remote"]
+    assert len(handler.notifications.get(mac_address="0A").warnings) == 1
+    assert handler.notifications.get(handler.node_name) is None
+    assert len(handler.outbox) == 0
+
+
+def test_local_only_stored_not_broadcast(handler):
+    error = record(logging.ERROR, "Failed to connect to broker")
+    setattr(error, LOCAL_ONLY, True)
+    handler.emit(error)
+    state = handler.notifications.get(handler.node_name)
+    assert [x.message for x in state.errors] == [error.msg]
+    assert len(handler.outbox) == 0
+
+
+class DroppingMqtt:
+    """
+    Connected as far as the handler knows, but every publish fails
+    """
+
+    mqtt_connected = True
+
+    def publish(self, topic: str, payload: str) -> bool:
+        return False
+
+
+def test_failed_publish_goes_to_outbox(handler):
+    handler.mqtt = DroppingMqtt()
+    handler.emit(record(logging.WARNING, "local"))
+    assert len(handler.outbox) == 1
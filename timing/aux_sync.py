@@ -0,0 +1,159 @@
+# Standard imports
+from time import monotonic
+from typing import Callable, Optional
+import ipaddress
+import logging
+
+# Third-party imports
+
+
+# Local imports
+from timing.sources import ChronyTracking, parse_chrony_tracking, run_chronyc
+from timing.statistics import ConvergenceDetector
+
+
+def _is_loopback(address: str) -> bool:
+    try:
+        return ipaddress.ip_address(address).is_loopback
+    except ValueError:
+        return address == "localhost"
+
+
+class AuxiliarySync:
+    """
+    Time sync for an auxiliary reference. The primary is found from its
+    /status/discovery announcements (pass them to on_discovery()) and
+    added to chrony as a server, polled quickly so chrony converges as
+    fast as it can.
+
+    tick() reads chrony's tracking every poll_period_s. Once chrony is
+    synchronised to the primary, each new clock update's offset goes
+    into a ConvergenceDetector, and the node is ready (on_ready is
+    called) as soon as the offsets have settled within max_offset_s,
+    rather than after a fixed wait. Losing sync afterwards is logged and
+    convergence starts again.
+
+    chronyc can be replaced with a stand-in, it's called with the
+    command (e.g. "tracking") and returns the CSV output, None on failure
+    """
+
+    def __init__(
+        self,
+        chronyc: Callable[[str], Optional[str]] = run_chronyc,
+        on_ready: Optional[Callable[[], None]] = None,
+        max_offset_s: float = 1e-4,
+        window: int = 8,
+        min_samples: int = 4,
+        poll_period_s: float = 1,
+        server_options: str = "iburst minpoll 0 maxpoll 4 prefer",
+        clock: Callable[[], float] = monotonic,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.chronyc = chronyc
+        self.on_ready = on_ready
+        self.max_offset_s = max_offset_s
+        self.poll_period_s = poll_period_s
+        self.server_options = server_options
+        self.clock = clock
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.convergence = ConvergenceDetector(
+            max_offset_s, window=window, min_samples=min_samples
+        )
+
+        self.primary_ip: Optional[str] = None
+        self.primary_mac: Optional[str] = None
+        self.tracking: Optional[ChronyTracking] = None
+        self.synced: bool = False
+        self.ready: bool = False
+        # When the current attempt to converge started
+        self.sync_start: Optional[float] = None
+        self.next_poll: float = 0
+
+    def on_discovery(self, message_dict: dict) -> None:
+        if message_dict.get("role") != "primary":
+            return
+        if message_dict.get("status") != "connected":
+            if message_dict.get("mac_address") == self.primary_mac:
+                self.logger.warning("Primary reference disconnected")
+            return
+        ip_address = message_dict.get("ip_address")
+        if ip_address is None or ip_address == self.primary_ip:
+            return
+        if _is_loopback(ip_address):
+            # Chrony would be syncing this node to itself
+            self.logger.warning(
+                f"Primary reference {message_dict.get('node_name')} "
+                f"announced loopback address {ip_address}, ignoring it"
+            )
+            return
+
+        if self.primary_ip is not None:
+            self.chronyc(f"delete {self.primary_ip}")
+        command = f"add server {ip_address} {self.server_options}"
+        if self.chronyc(command) is None:
+            self.logger.error(f"Failed to add {ip_address} to chrony")
+            return
+        self.logger.info(
+            f"Found primary reference {message_dict.get('node_name')} "
+            f"at {ip_address}"
+        )
+        self.primary_ip = ip_address
+        self.primary_mac = message_dict.get("mac_address")
+        self._restart()
+
+    def tick(self) -> bool:
+        """
+        Returns True once time is synchronised to the primary
+        """
+        now = self.clock()
+        if self.primary_ip is None or now < self.next_poll:
+            return self.ready
+        self.next_poll = now + self.poll_period_s
+
+        output = self.chronyc("tracking")
+        tracking = parse_chrony_tracking(output) if output else None
+        if tracking is None:
+            return self.ready
+        previous = self.tracking
+        self.tracking = tracking
+
+        synced = (
+            tracking.reference_name == self.primary_ip
+            and tracking.leap_status != "Not synchronised"
+        )
+        if not synced:
+            if self.synced:
+                self.logger.warning("Lost time sync with primary reference")
+                self._restart()
+            return self.ready
+        self.synced = True
+
+        if previous is not None and (
+            tracking.reference_time == previous.reference_time
+        ):
+            # No new measurement since the last poll
+            return self.ready
+        self.convergence.push(now, tracking.last_offset_s)
+
+        if (
+            not self.ready
+            and self.convergence.converged
+            and abs(tracking.system_offset_s) <= self.max_offset_s
+        ):
+            self.ready = True
+            self.logger.info(
+                f"Time synchronised to primary reference after "
+                f"{now - self.sync_start:.1f} s, RMS offset "
+                f"{self.convergence.offsets.rms() * 1e6:.1f} us"
+            )
+            if self.on_ready is not None:
+                self.on_ready()
+        return self.ready
+
+    def _restart(self) -> None:
+        self.synced = False
+        self.ready = False
+        self.tracking = None
+        self.convergence.clear()
+        self.sync_start = self.clock()
+        self.next_poll = 0
@@ -0,0 +1,238 @@
+# Standard imports
+from dataclasses import dataclass
+from time import monotonic
+from typing import Callable, Optional
+import logging
+
+# Third-party imports
+
+
+# Local imports
+from timing.sources import (
+    ChronySource,
+    ChronyTracking,
+    GPSDClient,
+    parse_chrony_sources,
+    parse_chrony_tracking,
+    parse_gpsd_report,
+    run_chronyc,
+)
+from timing.statistics import AllanDeviation, RingBuffer
+
+
+@dataclass
+class GPSStatus:
+    # gpsd fix mode: 0 unknown, 1 no fix, 2 2D, 3 3D
+    mode: int = 0
+    satellites_used: int = 0
+    satellites_visible: int = 0
+    hdop: Optional[float] = None
+    pdop: Optional[float] = None
+
+
+class TimingQualityMonitor:
+    """
+    Keeps track of how good the primary reference's time is. GPS fix
+    mode, satellite count and DOP come from gpsd reports. Clock offsets
+    come from chrony, read every chrony_period_s (which should match how
+    often chrony updates from the PPS, only new updates are used).
+
+    Offsets go into fixed size windows giving rolling mean / RMS offset
+    and the Allan deviation. Holdover is estimated as how long the clock
+    would stay within holdover_max_error_s if the references went away,
+    from chrony's frequency error and skew.
+
+    Going outside any of the limits is logged as a warning (an error for
+    losing the fix) and coming back as info, only on changes. Values are
+    published with publish_telemetry("gps", values).
+
+    gpsd / chronyc can be replaced for replaying recorded output: gpsd
+    needs a poll() returning report lines, chronyc is called with
+    "tracking" or "sources" and returns the CSV output
+    """
+
+    def __init__(
+        self,
+        gpsd: Optional[GPSDClient] = None,
+        chronyc: Optional[Callable[[str], Optional[str]]] = run_chronyc,
+        publish_telemetry: Optional[Callable[[str, dict], None]] = None,
+        window: int = 1024,
+        chrony_period_s: float = 8,
+        min_satellites: int = 4,
+        max_hdop: float = 5,
+        max_rms_offset_s: float = 1e-6,
+        pps_source: str = "PPS",
+        holdover_max_error_s: float = 1e-6,
+        clock: Callable[[], float] = monotonic,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.gpsd = gpsd
+        self.chronyc = chronyc
+        self.publish_telemetry = publish_telemetry
+        self.chrony_period_s = chrony_period_s
+        self.min_satellites = min_satellites
+        self.max_hdop = max_hdop
+        self.max_rms_offset_s = max_rms_offset_s
+        self.pps_source = pps_source
+        self.holdover_max_error_s = holdover_max_error_s
+        self.clock = clock
+        self.logger = logger if logger else logging.getLogger(__name__)
+
+        self.gps = GPSStatus()
+        self.tracking: Optional[ChronyTracking] = None
+        self.pps: Optional[ChronySource] = None
+        self.offsets = RingBuffer(window)
+        self.satellites = RingBuffer(window)
+        self.hdops = RingBuffer(window)
+        self.allan = AllanDeviation(chrony_period_s, window)
+        # Name of each limit -> whether it's currently exceeded
+        self.faults: dict[str, bool] = {}
+        self.next_chrony_poll: float = 0
+
+    @property
+    def has_fix(self) -> bool:
+        return self.gps.mode >= 2
+
+    @property
+    def holdover_s(self) -> Optional[float]:
+        if self.tracking is None:
+            return None
+        frequency_error = 1e-6 * (
+            abs(self.tracking.residual_frequency_ppm) + self.tracking.skew_ppm
+        )
+        if frequency_error <= 0:
+            return None
+        return self.holdover_max_error_s / frequency_error
+
+    def tick(self) -> None:
+        if self.gpsd is not None:
+            for line in self.gpsd.poll():
+                self.ingest_gpsd(line)
+        now = self.clock()
+        if self.chronyc is not None and now >= self.next_chrony_poll:
+            self.next_chrony_poll = now + self.chrony_period_s
+            tracking = self.chronyc("tracking")
+            sources = self.chronyc("sources")
+            if sources is not None:
+                self.ingest_chrony_sources(sources)
+            if tracking is not None:
+                self.ingest_chrony_tracking(tracking)
+
+    def ingest_gpsd(self, line: str) -> None:
+        report = parse_gpsd_report(line)
+        if report is None:
+            return
+        if report["class"] == "TPV":
+            self.gps.mode = report.get("mode", 0)
+            self._set_fault(
+                "fix",
+                not self.has_fix,
+                logging.ERROR,
+                "GPS fix lost",
+                f"GPS fix acquired ({self.gps.mode}D)",
+            )
+        elif report["class"] == "SKY":
+            satellites = report.get("satellites", [])
+            self.gps.satellites_visible = report.get("nSat", len(satellites))
+            self.gps.satellites_used = report.get(
+                "uSat", sum(1 for x in satellites if x.get("used"))
+            )
+            self.gps.hdop = report.get("hdop")
+            self.gps.pdop = report.get("pdop")
+            self.satellites.push(self.gps.satellites_used)
+            self._set_fault(
+                "satellites",
+                self.gps.satellites_used < self.min_satellites,
+                logging.WARNING,
+                f"Only {self.gps.satellites_used} GPS satellites in use",
+                f"{self.gps.satellites_used} GPS satellites in use",
+            )
+            if self.gps.hdop is not None:
+                self.hdops.push(self.gps.hdop)
+                self._set_fault(
+                    "hdop",
+                    self.gps.hdop > self.max_hdop,
+                    logging.WARNING,
+                    f"GPS HDOP high: {self.gps.hdop:.1f}",
+                    f"GPS HDOP back to normal: {self.gps.hdop:.1f}",
+                )
+
+    def ingest_chrony_sources(self, text: str) -> None:
+        self.pps = parse_chrony_sources(text).get(self.pps_source)
+        self._set_fault(
+            "pps",
+            self.pps is None or not self.pps.selected,
+            logging.WARNING,
+            "Chrony isn't synchronised to the PPS",
+            "Chrony synchronised to the PPS",
+        )
+
+    def ingest_chrony_tracking(self, text: str) -> None:
+        tracking = parse_chrony_tracking(text)
+        if tracking is None:
+            return
+        previous = self.tracking
+        self.tracking = tracking
+        if previous is not None and (
+            tracking.reference_time == previous.reference_time
+        ):
+            # No new measurement since the last poll
+            return
+
+        self.offsets.push(tracking.last_offset_s)
+        self.allan.push(tracking.last_offset_s)
+        rms = self.offsets.rms()
+        self._set_fault(
+            "offset",
+            rms > self.max_rms_offset_s,
+            logging.WARNING,
+            f"RMS time offset high: {rms * 1e9:.0f} ns",
+            f"RMS time offset back to normal: {rms * 1e9:.0f} ns",
+        )
+        if self.publish_telemetry is not None:
+            self.publish_telemetry("gps", self.summary())
+
+    def summary(self) -> dict:
+        def ns(x: Optional[float]) -> Optional[float]:
+            return None if x is None else round(x * 1e9, 1)
+
+        return {
+            "fix_mode": self.gps.mode,
+            "satellites_used": self.gps.satellites_used,
+            "satellites_visible": self.gps.satellites_visible,
+            "mean_satellites_used": self.satellites.mean(),
+            "hdop": self.gps.hdop,
+            "pdop": self.gps.pdop,
+            "pps_selected": self.pps is not None and self.pps.selected,
+            "pps_offset_ns": ns(self.pps.offset_s if self.pps else None),
+            "offset_ns": ns(
+                self.tracking.last_offset_s if self.tracking else None
+            ),
+            "mean_offset_ns": ns(self.offsets.mean()),
+            "rms_offset_ns": ns(self.offsets.rms()),
+            "allan_deviation": {
+                f"{tau:g}": x for tau, x in self.allan.deviations().items()
+            },
+            "holdover_s": (
+                None if self.holdover_s is None else round(self.holdover_s)
+            ),
+        }
+
+    def _set_fault(
+        self,
+        name: str,
+        active: bool,
+        level: int,
+        message: str,
+        cleared_message: str,
+    ) -> None:
+        # Only log changes so a marginal sky doesn't flood the logs. The
+        # first report is only logged if it's a fault
+        previous = self.faults.get(name)
+        self.faults[name] = active
+        if active == previous or (previous is None and not active):
+            return
+        if active:
+            self.logger.log(level, message)
+        else:
+            self.logger.info(cleared_message)
@@ -0,0 +1,186 @@
+# Standard imports
+from dataclasses import dataclass
+from typing import Optional
+import json
+import socket
+import subprocess
+
+# Third-party imports
+
+
+# Local imports
+
+
+@dataclass
+class ChronyTracking:
+    """
+    The fields of `chronyc -c tracking` used for timing quality. Offsets
+    in seconds (positive is the system clock fast), frequencies in ppm
+    """
+
+    reference_id: str
+    reference_name: str
+    stratum: int
+    # Time of the last clock update, seconds since the epoch
+    reference_time: float
+    system_offset_s: float
+    last_offset_s: float
+    rms_offset_s: float
+    frequency_ppm: float
+    residual_frequency_ppm: float
+    skew_ppm: float
+    root_delay_s: float
+    root_dispersion_s: float
+    leap_status: str
+
+
+def parse_chrony_tracking(text: str) -> Optional[ChronyTracking]:
+    """
+    Parses the CSV output of `chronyc -c tracking`
+    """
+    fields = text.strip().split(",")
+    if len(fields) < 14:
+        return None
+    try:
+        return ChronyTracking(
+            reference_id=fields[0],
+            reference_name=fields[1],
+            stratum=int(fields[2]),
+            reference_time=float(fields[3]),
+            system_offset_s=float(fields[4]),
+            last_offset_s=float(fields[5]),
+            rms_offset_s=float(fields[6]),
+            frequency_ppm=float(fields[7]),
+            residual_frequency_ppm=float(fields[8]),
+            skew_ppm=float(fields[9]),
+            root_delay_s=float(fields[10]),
+            root_dispersion_s=float(fields[11]),
+            leap_status=fields[13],
+        )
+    except ValueError:
+        return None
+
+
+@dataclass
+class ChronySource:
+    name: str
+    # "*" selected, "+" combined, "-" not combined, "?" unusable etc.
+    state: str
+    reach: int
+    offset_s: float
+    error_s: float
+
+    @property
+    def selected(self) -> bool:
+        return self.state == "*"
+
+
+def parse_chrony_sources(text: str) -> dict[str, ChronySource]:
+    """
+    Parses the CSV output of `chronyc -c sources`, keyed by source name
+    """
+    sources = {}
+    for line in text.splitlines():
+        fields = line.strip().split(",")
+        if len(fields) < 10:
+            continue
+        try:
+            sources[fields[2]] = ChronySource(
+                name=fields[2],
+                state=fields[1],
+                reach=int(fields[5], 8),
+                offset_s=float(fields[8]),
+                error_s=float(fields[9]),
+            )
+        except ValueError:
+            continue
+    return sources
+
+
+def run_chronyc(command: str, timeout_s: float = 1) -> Optional[str]:
+    """
+    Output of `chronyc -c <command>`, None if chronyc isn't available or
+    fails
+    """
+    try:
+        result = subprocess.run(
+            ["chronyc", "-c", *command.split()],
+            capture_output=True,
+            text=True,
+            timeout=timeout_s,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+
+class GPSDClient:
+    """
+    Non-blocking connection to gpsd's JSON stream. poll() returns the
+    report lines received since the last call, reconnecting if gpsd has
+    gone away
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 2947, max_lines: int = 100
+    ):
+        self.host = host
+        self.port = port
+        self.max_lines = max_lines
+        self.socket: Optional[socket.socket] = None
+        self._buffer = bytearray()
+
+    def close(self) -> None:
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        self._buffer.clear()
+
+    def _connect(self) -> None:
+        sock = socket.create_connection((self.host, self.port), timeout=1)
+        sock.sendall(b'?WATCH={"enable":true,"json":true};\n')
+        sock.setblocking(False)
+        self.socket = sock
+
+    def poll(self) -> list[str]:
+        if self.socket is None:
+            try:
+                self._connect()
+            except OSError:
+                return []
+        try:
+            while True:
+                data = self.socket.recv(4096)
+                if not data:
+                    # gpsd closed the connection
+                    self.close()
+                    break
+                self._buffer += data
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.close()
+
+        lines = []
+        while len(lines) < self.max_lines:
+            end = self._buffer.find(b"\n")
+            if end < 0:
+                break
+            lines.append(self._buffer[:end].decode("utf-8", "replace"))
+            del self._buffer[: end + 1]
+        return lines
+
+
+def parse_gpsd_report(line: str) -> Optional[dict]:
+    """
+    Decodes a gpsd JSON report, None if it isn't one
+    """
+    try:
+        report = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(report, dict) or "class" not in report:
+        return None
+    return report
@@ -0,0 +1,222 @@
+# Standard imports
+from array import array
+from math import sqrt
+from typing import Iterable, Iterator, Optional
+
+# Third-party imports
+
+
+# Local imports
+
+
+class RingBuffer:
+    """
+    Fixed size window of the last capacity samples, stored in a flat
+    array of doubles. The sum and sum of squares are kept as samples are
+    added and dropped so mean / RMS are O(1). They are recomputed from
+    scratch once per capacity samples so rounding errors don't build up.
+    """
+
+    def __init__(self, capacity: int):
+        assert capacity > 0
+        self.capacity = capacity
+        self._data = array("d", bytes(8 * capacity))
+        self._start: int = 0
+        self._length: int = 0
+        self._sum: float = 0
+        self._sum_squares: float = 0
+        self._pushes_since_resync: int = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[float]:
+        for i in range(self._length):
+            yield self._data[(self._start + i) % self.capacity]
+
+    def __getitem__(self, i: int) -> float:
+        # Negative indices count back from the newest sample
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("RingBuffer index out of range")
+        return self._data[(self._start + i) % self.capacity]
+
+    @property
+    def full(self) -> bool:
+        return self._length == self.capacity
+
+    def clear(self) -> None:
+        self._start = 0
+        self._length = 0
+        self._sum = 0
+        self._sum_squares = 0
+
+    def push(self, x: float) -> Optional[float]:
+        """
+        Adds x, returning the sample it displaced if the buffer was full
+        """
+        dropped = None
+        if self.full:
+            dropped = self._data[self._start]
+            self._data[self._start] = x
+            self._start = (self._start + 1) % self.capacity
+            self._sum -= dropped
+            self._sum_squares -= dropped * dropped
+        else:
+            self._data[(self._start + self._length) % self.capacity] = x
+            self._length += 1
+        self._sum += x
+        self._sum_squares += x * x
+
+        self._pushes_since_resync += 1
+        if self._pushes_since_resync >= self.capacity:
+            self._resync()
+        return dropped
+
+    def extend(self, values: Iterable[float]) -> None:
+        for x in values:
+            self.push(x)
+
+    def mean(self) -> Optional[float]:
+        if not self._length:
+            return None
+        return self._sum / self._length
+
+    def rms(self) -> Optional[float]:
+        if not self._length:
+            return None
+        return sqrt(max(0, self._sum_squares / self._length))
+
+    def std(self) -> Optional[float]:
+        if self._length < 2:
+            return None
+        mean = self._sum / self._length
+        variance = (self._sum_squares - self._length * mean * mean) / (
+            self._length - 1
+        )
+        return sqrt(max(0, variance))
+
+    def _resync(self) -> None:
+        self._pushes_since_resync = 0
+        self._sum = sum(self)
+        self._sum_squares = sum(x * x for x in self)
+
+
+class AllanDeviation:
+    """
+    Overlapping Allan deviation of phase (time offset) samples taken
+    every tau0_s, over the last window samples, for averaging times of
+    m * tau0_s for each m in averaging_factors.
+
+    Each new sample adds one second difference per averaging time to a
+    RingBuffer, so the deviation is always available without going back
+    over the history.
+    """
+
+    def __init__(
+        self,
+        tau0_s: float,
+        window: int,
+        averaging_factors: Iterable[int] = (1, 2, 4, 8, 16),
+    ):
+        self.tau0_s = tau0_s
+        self.averaging_factors = sorted(set(averaging_factors))
+        self._phase = RingBuffer(2 * self.averaging_factors[-1] + 1)
+        self._second_differences = {
+            m: RingBuffer(window) for m in self.averaging_factors
+        }
+
+    def clear(self) -> None:
+        self._phase.clear()
+        for x in self._second_differences.values():
+            x.clear()
+
+    def push(self, phase_s: float) -> None:
+        self._phase.push(phase_s)
+        n = len(self._phase)
+        for m, squares in self._second_differences.items():
+            if n <= 2 * m:
+                continue
+            d = (
+                self._phase[-1]
+                - 2 * self._phase[-1 - m]
+                + self._phase[-1 - 2 * m]
+            )
+            squares.push(d * d)
+
+    def deviation(self, m: int = 1) -> Optional[float]:
+        """
+        Allan deviation at tau = m * tau0_s, None until enough samples
+        """
+        squares = self._second_differences[m]
+        mean = squares.mean()
+        if mean is None:
+            return None
+        tau = m * self.tau0_s
+        return sqrt(mean / (2 * tau * tau))
+
+    def deviations(self) -> dict[float, Optional[float]]:
+        """
+        Allan deviation keyed by tau in seconds
+        """
+        return {
+            m * self.tau0_s: self.deviation(m) for m in self.averaging_factors
+        }
+
+
+class ConvergenceDetector:
+    """
+    Decides when a clock has settled, from the last window offset samples
+    and the (monotonic) times they were taken. Converged once there are
+    at least min_samples, their RMS is within max_offset_s, and they are
+    no longer trending: the fitted drift over the window must be within
+    max_offset_s too, otherwise the offsets are still decaying towards
+    zero and a quiet spell could just be the clock passing through it.
+    """
+
+    def __init__(
+        self, max_offset_s: float, window: int = 8, min_samples: int = 4
+    ):
+        self.max_offset_s = max_offset_s
+        self.min_samples = min(min_samples, window)
+        self.offsets = RingBuffer(window)
+        self.times = RingBuffer(window)
+
+    def clear(self) -> None:
+        self.offsets.clear()
+        self.times.clear()
+
+    def push(self, time_s: float, offset_s: float) -> None:
+        self.times.push(time_s)
+        self.offsets.push(offset_s)
+
+    def slope(self) -> Optional[float]:
+        """
+        Least squares drift of the offsets, seconds per second
+        """
+        n = len(self.offsets)
+        if n < 2:
+            return None
+        mean_t = self.times.mean()
+        mean_x = self.offsets.mean()
+        covariance = sum(
+            (t - mean_t) * (x - mean_x)
+            for t, x in zip(self.times, self.offsets)
+        )
+        variance = sum((t - mean_t) ** 2 for t in self.times)
+        if variance == 0:
+            return None
+        return covariance / variance
+
+    @property
+    def converged(self) -> bool:
+        if len(self.offsets) < self.min_samples:
+            return False
+        if self.offsets.rms() > self.max_offset_s:
+            return False
+        slope = self.slope()
+        if slope is None:
+            return False
+        span = self.times[-1] - self.times[0]
+        return abs(slope) * span <= self.max_offset_s
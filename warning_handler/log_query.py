@@ -0,0 +1,331 @@
+# Standard imports
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+import argparse
+import gzip
+import json
+import sqlite3
+import sys
+
+# Third-party imports
+
+
+# Local imports
+from warning_handler.log_rotation import list_segments, select_log_folder
+
+
+# Fields of the Notification JSON that get a postings list in the index
+INDEXED_FIELDS = ("node_name", "mac_address", "category", "level")
+
+
+@dataclass
+class NotificationQuery:
+    """
+    Filter for notifications. Any field left as None matches everything.
+    since / until are inclusive
+    """
+
+    node_name: Optional[str] = None
+    mac_address: Optional[str] = None
+    category: Optional[str] = None
+    level: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+    def postings(self) -> dict[str, str]:
+        return {
+            x: getattr(self, x)
+            for x in INDEXED_FIELDS
+            if getattr(self, x) is not None
+        }
+
+    def matches(self, notification: dict[str, str]) -> bool:
+        for field, value in self.postings().items():
+            if notification.get(field) != value:
+                return False
+        time = notification.get("time", "")
+        if self.since is not None and time < _timestamp(self.since):
+            return False
+        if self.until is not None and time > _timestamp(self.until):
+            return False
+        return True
+
+
+def _timestamp(x: datetime) -> str:
+    # Notification times are all UTC ISO 8601 strings so can be compared
+    # as strings as long as the query bounds are formatted the same way
+    if x.tzinfo is None:
+        x = x.replace(tzinfo=timezone.utc)
+    return x.astimezone(timezone.utc).isoformat(timespec="milliseconds")
+
+
+def _open_segment(path: Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+class LogIndex:
+    """
+    SQLite sidecar index over a JSONL notification log and its rolled
+    segments. For each segment it records the time range covered and which
+    node names, MAC addresses, categories and levels appear in it, so a
+    query only has to read the segments that could contain a match.
+
+    The index is brought up to date incrementally by update(): rolled
+    segments are indexed once and only the newly appended tail of the live
+    log is read each time. The live log's device and inode are recorded
+    so that once it's been rotated, it's indexed again from the start
+    however much has been written to the new file.
+    """
+
+    def __init__(self, log_file: Path, index_file: Optional[Path] = None):
+        self.log_file = log_file
+        if index_file is None:
+            index_file = log_file.with_name(f"{log_file.stem}.index.sqlite")
+        self.db = sqlite3.connect(index_file)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS segments (
+                name TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                start_time TEXT,
+                end_time TEXT,
+                complete INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                segment TEXT NOT NULL,
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (segment, field, value)
+            );
+            CREATE TABLE IF NOT EXISTS live_files (
+                name TEXT PRIMARY KEY,
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL
+            );
+            """
+        )
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def update(self) -> None:
+        """
+        Indexes anything written since the last update
+        """
+        segments = {
+            x.name.removesuffix(".gz"): x for x in list_segments(self.log_file)
+        }
+        indexed = {
+            name: (path, complete)
+            for name, path, complete in self.db.execute(
+                "SELECT name, path, complete FROM segments"
+            )
+        }
+
+        # Forget segments removed by the retention limit
+        for name in indexed.keys() - segments.keys() - {self.log_file.name}:
+            self._forget(name)
+
+        for name, path in segments.items():
+            if name not in indexed or not indexed[name][1]:
+                self._forget(name)
+                self._index(name, path, 0, complete=True)
+            elif indexed[name][0] != str(path):
+                # Segment has been compressed since it was indexed
+                self.db.execute(
+                    "UPDATE segments SET path = ? WHERE name = ?",
+                    (str(path), name),
+                )
+
+        # The live log is indexed from where we got to last time unless
+        # it's been rotated, i.e. it's a different file or has got shorter
+        name = self.log_file.name
+        row = self.db.execute(
+            "SELECT offset FROM segments WHERE name = ?", (name,)
+        ).fetchone()
+        offset = row[0] if row else 0
+        try:
+            stat = self.log_file.stat()
+            size = stat.st_size
+            identity = (stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            size = 0
+            identity = None
+        indexed_identity = self.db.execute(
+            "SELECT device, inode FROM live_files WHERE name = ?", (name,)
+        ).fetchone()
+        if size < offset or indexed_identity != identity:
+            self._forget(name)
+            offset = 0
+            self.db.execute("DELETE FROM live_files WHERE name = ?", (name,))
+            if identity is not None:
+                self.db.execute(
+                    "INSERT INTO live_files VALUES (?, ?, ?)",
+                    (name, *identity),
+                )
+        if size > offset:
+            self._index(name, self.log_file, offset, complete=False)
+        self.db.commit()
+
+    def candidate_segments(self, query: NotificationQuery) -> list[Path]:
+        """
+        Segments that could hold notifications matching query, oldest first
+        """
+        sql = "SELECT path FROM segments WHERE 1"
+        params = []
+        if query.since is not None:
+            sql += " AND end_time >= ?"
+            params.append(_timestamp(query.since))
+        if query.until is not None:
+            sql += " AND start_time <= ?"
+            params.append(_timestamp(query.until))
+        for field, value in query.postings().items():
+            sql += (
+                " AND EXISTS (SELECT 1 FROM postings WHERE segment = name"
+                " AND field = ? AND value = ?)"
+            )
+            params += [field, value]
+        sql += " ORDER BY start_time"
+        return [Path(x) for x, in self.db.execute(sql, params)]
+
+    def query(self, query: NotificationQuery) -> Iterator[dict[str, str]]:
+        """
+        Yields notifications matching query, oldest segment first
+        """
+        self.update()
+        for path in self.candidate_segments(query):
+            try:
+                with _open_segment(path) as file:
+                    for line in file:
+                        notification = self._parse(line)
+                        if notification and query.matches(notification):
+                            yield notification
+            except FileNotFoundError:
+                # Rotated or expired since the index was read
+                continue
+
+    def _forget(self, name: str) -> None:
+        self.db.execute("DELETE FROM segments WHERE name = ?", (name,))
+        self.db.execute("DELETE FROM postings WHERE segment = ?", (name,))
+
+    @staticmethod
+    def _parse(line: bytes) -> Optional[dict[str, str]]:
+        try:
+            return json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            # Partially written last line, or corruption
+            return None
+
+    def _index(
+        self, name: str, path: Path, offset: int, complete: bool
+    ) -> None:
+        row = self.db.execute(
+            "SELECT start_time, end_time FROM segments WHERE name = ?",
+            (name,),
+        ).fetchone()
+        start_time, end_time = row if row else (None, None)
+        postings = set()
+
+        with _open_segment(path) as file:
+            file.seek(offset)
+            while True:
+                line = file.readline()
+                if not line.endswith(b"\n"):
+                    # Don't index a line that's still being written
+                    break
+                offset += len(line)
+                notification = self._parse(line)
+                if notification is None:
+                    continue
+                time = notification.get("time")
+                if time:
+                    start_time = min(start_time or time, time)
+                    end_time = max(end_time or time, time)
+                for field in INDEXED_FIELDS:
+                    if field in notification:
+                        postings.add((field, str(notification[field])))
+
+        self.db.execute(
+            "INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?)",
+            (name, str(path), offset, start_time, end_time, int(complete)),
+        )
+        self.db.executemany(
+            "INSERT OR IGNORE INTO postings VALUES (?, ?, ?)",
+            [(name, field, value) for field, value in postings],
+        )
+
+
+def query_logs(
+    log_folder: Path,
+    query: NotificationQuery,
+    full_log_name: str,
+    warning_log_name: str,
+) -> Iterator[dict[str, str]]:
+    """
+    Warnings and errors are also in the (much smaller) warning log so use
+    that when the query allows
+    """
+    if query.level in ("warning", "error"):
+        log_file = log_folder / warning_log_name
+    else:
+        log_file = log_folder / full_log_name
+    with LogIndex(log_file) as index:
+        yield from index.query(query)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Search the notification logs. Prints matching "
+        "notifications as JSON lines"
+    )
+    parser.add_argument("--folder", type=Path, help="Log folder")
+    parser.add_argument("--node", help="Node name")
+    parser.add_argument("--mac", help="MAC address")
+    parser.add_argument("--category", help="Category")
+    parser.add_argument("--level", choices=["info", "warning", "error"])
+    parser.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        help="ISO 8601 time, UTC if no timezone is given",
+    )
+    parser.add_argument(
+        "--until",
+        type=datetime.fromisoformat,
+        help="ISO 8601 time, UTC if no timezone is given",
+    )
+    parser.add_argument("--limit", type=int, help="Max results")
+    args = parser.parse_args(argv)
+
+    # Deferred so the query API can be used without the hardware config
+    from config import LOG_FOLDER_NAME, LOG_FULL_NAME, LOG_WARNING_NAME
+
+    log_folder = args.folder or select_log_folder(LOG_FOLDER_NAME)
+    query = NotificationQuery(
+        node_name=args.node,
+        mac_address=args.mac,
+        category=args.category,
+        level=args.level,
+        since=args.since,
+        until=args.until,
+    )
+    for i, notification in enumerate(
+        query_logs(log_folder, query, LOG_FULL_NAME, LOG_WARNING_NAME)
+    ):
+        if args.limit is not None and i >= args.limit:
+            break
+        print(json.dumps(notification), file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
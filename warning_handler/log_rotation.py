@@ -0,0 +1,179 @@
+# Standard imports
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Optional
+import gzip
+import re
+import shutil
+import sys
+
+# Third-party imports
+
+
+# Local imports
+
+
+SEGMENT_TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def select_log_folder(folder_name: str) -> Path:
+    """
+    Try to save logs on SSD to save wear on eMMC but it might not be there
+    """
+    ssd_path = Path("/") / "mnt" / "media" / "nvme"
+    if ssd_path.exists():
+        return ssd_path / folder_name
+    else:
+        return Path(folder_name)
+
+
+def segment_name(log_file: Path, rotation_time: datetime) -> str:
+    """
+    Name of the segment a log file is rolled to e.g.
+    full_log.jsonl -> full_log.20241017T161000123Z.jsonl
+    """
+    timestamp = rotation_time.strftime(SEGMENT_TIME_FORMAT)
+    milliseconds = rotation_time.microsecond // 1000
+    return f"{log_file.stem}.{timestamp}{milliseconds:03d}Z{log_file.suffix}"
+
+
+def segment_time(log_file: Path, segment: Path) -> Optional[datetime]:
+    """
+    Returns the rotation time encoded in a segment's name or None if segment
+    isn't a rolled segment of log_file
+    """
+    match = re.fullmatch(
+        rf"{re.escape(log_file.stem)}\.(\d{{8}}T\d{{6}})(\d{{3}})Z"
+        rf"{re.escape(log_file.suffix)}(\.gz)?",
+        segment.name,
+    )
+    if match is None:
+        return None
+    return datetime.strptime(match.group(1), SEGMENT_TIME_FORMAT).replace(
+        microsecond=int(match.group(2)) * 1000, tzinfo=timezone.utc
+    )
+
+
+def list_segments(log_file: Path) -> list[Path]:
+    """
+    All rolled segments of log_file, oldest first
+    """
+    segments = [
+        (time, x)
+        for x in log_file.parent.glob(f"{log_file.stem}.*")
+        if (time := segment_time(log_file, x)) is not None
+    ]
+    return [x for _, x in sorted(segments)]
+
+
+class LogRotator:
+    """
+    Rolls a log file over to a timestamped segment once it exceeds
+    max_bytes or has been written to for more than max_age_s. Rolled
+    segments are gzipped in a background thread and only the newest
+    retention_segments are kept. A max of 0 disables that limit.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 0,
+        max_age_s: float = 0,
+        retention_segments: int = 0,
+        compress: bool = True,
+    ):
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.retention_segments = retention_segments
+        self.compress = compress
+        self._lock = Lock()
+        self._threads: list[Thread] = []
+
+    def segment_start(self, log_file: Path) -> datetime:
+        """
+        The current segment began when the previous one was rolled. If it's
+        never been rolled, treat it as starting now
+        """
+        segments = list_segments(log_file)
+        if segments:
+            return segment_time(log_file, segments[-1])
+        return datetime.now(tz=timezone.utc)
+
+    def should_rotate(
+        self, log_file: Path, size: int, start_time: datetime
+    ) -> bool:
+        if size == 0:
+            return False
+        if self.max_bytes and size >= self.max_bytes:
+            return True
+        if self.max_age_s:
+            age = datetime.now(tz=timezone.utc) - start_time
+            if age.total_seconds() >= self.max_age_s:
+                return True
+        return False
+
+    def rotate(self, log_file: Path) -> Optional[Path]:
+        """
+        Renames log_file to a new segment and starts compressing it.
+        log_file must not be open for writing when this is called
+        """
+        if not log_file.exists():
+            return None
+        segment = log_file.with_name(
+            segment_name(log_file, datetime.now(tz=timezone.utc))
+        )
+        log_file.rename(segment)
+        self._start_housekeeping(log_file)
+        return segment
+
+    def housekeeping(self, log_file: Path) -> None:
+        """
+        Compresses any segments left uncompressed (e.g. by a power cut
+        mid-compression) and applies the retention limit
+        """
+        self._start_housekeeping(log_file)
+
+    def wait(self) -> None:
+        """
+        Blocks until any background compression has finished
+        """
+        for thread in self._threads:
+            thread.join()
+        self._threads = [x for x in self._threads if x.is_alive()]
+
+    def _start_housekeeping(self, log_file: Path) -> None:
+        self._threads = [x for x in self._threads if x.is_alive()]
+        thread = Thread(
+            target=self._housekeeping,
+            args=(log_file,),
+            name="LogRotatorCompress",
+            daemon=True,
+        )
+        self._threads.append(thread)
+        thread.start()
+
+    def _housekeeping(self, log_file: Path) -> None:
+        # Only one housekeeping pass at a time so two passes can't both
+        # try to compress the same segment
+        with self._lock:
+            try:
+                if self.compress:
+                    for segment in list_segments(log_file):
+                        if segment.suffix != ".gz":
+                            self._compress(segment)
+                if self.retention_segments:
+                    segments = list_segments(log_file)
+                    for segment in segments[: -self.retention_segments]:
+                        segment.unlink(missing_ok=True)
+            except OSError as e:
+                print(f"Failed to rotate {log_file}: {e}", file=sys.stderr)
+
+    def _compress(self, segment: Path) -> None:
+        compressed = segment.with_name(segment.name + ".gz")
+        partial = segment.with_name(segment.name + ".gz.partial")
+        with open(segment, "rb") as file_in:
+            with gzip.open(partial, "wb") as file_out:
+                shutil.copyfileobj(file_in, file_out)
+        # Only replace the original once the compressed copy is complete
+        partial.rename(compressed)
+        segment.unlink()
@@ -0,0 +1,205 @@
+# Standard imports
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Optional, TextIO
+import sys
+
+# Third-party imports
+
+
+# Local imports
+from metrics.metrics import REGISTRY, MetricsRegistry
+from warning_handler.log_rotation import LogRotator
+
+
+class LogSink:
+    """
+    Buffers notification log lines in memory and writes them to the JSONL
+    log files from a background thread, so the logging emit() path never
+    waits on disk I/O. Files are kept open between flushes and a batch is
+    written when either flush_max_records lines are pending, flush_interval_s
+    has passed since the last flush or a caller asks for an urgent flush
+    (e.g. for an error).
+
+    Lines written before open() is called are held in memory and written
+    as soon as the log files are known.
+
+    If a rotator is given, it is checked after every batch is written and
+    the file is closed and rolled over when it asks for it.
+    """
+
+    def __init__(
+        self,
+        flush_interval_s: float = 1,
+        flush_max_records: int = 100,
+        max_pending_records: int = 10000,
+        rotator: Optional[LogRotator] = None,
+        metrics: MetricsRegistry = REGISTRY,
+    ):
+        self.flush_interval_s = flush_interval_s
+        self.flush_max_records = flush_max_records
+        self.max_pending_records = max_pending_records
+        self.rotator = rotator
+        self.full_log: Optional[Path] = None
+        self.warning_log: Optional[Path] = None
+        self.dropped_records: int = 0
+        # Each pending entry is (line, also write to warning log)
+        self._pending: deque[tuple[str, bool]] = deque(
+            maxlen=max_pending_records
+        )
+        self._files: dict[Path, TextIO] = {}
+        self._segment_starts: dict[Path, datetime] = {}
+        self._condition = Condition()
+        self._io_lock = Lock()
+        self._flush_requested: bool = False
+        self._running: bool = False
+        self._thread: Optional[Thread] = None
+        self.write_time = metrics.histogram(
+            "log_write_seconds", "Time taken to write a batch of log lines"
+        )
+        metrics.gauge(
+            "log_pending_records",
+            "Log lines waiting to be written",
+            func=lambda: len(self._pending),
+        )
+        metrics.counter(
+            "log_dropped_records_total",
+            "Log lines dropped as the writer fell behind",
+            func=lambda: self.dropped_records,
+        )
+
+    def open(self, full_log: Path, warning_log: Path) -> None:
+        """
+        Sets the files to log to and starts the background writer
+        """
+        self.full_log = full_log
+        self.warning_log = warning_log
+        if self.rotator is not None:
+            self.rotator.housekeeping(full_log)
+            self.rotator.housekeeping(warning_log)
+        self._running = True
+        self._thread = Thread(
+            target=self._run, name="LogSinkWriter", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, line: str, warning: bool = False, urgent: bool = False):
+        """
+        Queues a line for the full log (and the warning log if warning is
+        True). Never blocks on disk I/O
+        """
+        with self._condition:
+            if len(self._pending) >= self.max_pending_records:
+                # Writer has stalled (or was never started), so the append
+                # drops the oldest rather than growing without bound
+                self.dropped_records += 1
+            self._pending.append((line, warning))
+            if urgent or len(self._pending) >= self.flush_max_records:
+                self._flush_requested = True
+                self._condition.notify()
+
+    def flush(self) -> None:
+        """
+        Synchronously writes everything pending to disk
+        """
+        with self._condition:
+            batch = self._take_pending()
+        self._write_batch(batch)
+
+    def close(self) -> None:
+        """
+        Stops the writer thread, flushes anything pending and closes files
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._io_lock:
+            for file in self._files.values():
+                file.close()
+            self._files = {}
+        if self.rotator is not None:
+            self.rotator.wait()
+
+    def _take_pending(self) -> deque[tuple[str, bool]]:
+        # Must be called with self._condition held
+        batch = self._pending
+        self._pending = deque(maxlen=self.max_pending_records)
+        self._flush_requested = False
+        return batch
+
+    def _run(self) -> None:
+        last_flush = monotonic()
+        while True:
+            with self._condition:
+                timeout = self.flush_interval_s - (monotonic() - last_flush)
+                if (
+                    self._running
+                    and not self._flush_requested
+                    and timeout > 0
+                ):
+                    self._condition.wait(timeout)
+                if not self._running:
+                    return
+                if not self._flush_requested and (
+                    monotonic() - last_flush < self.flush_interval_s
+                ):
+                    # Spurious wakeup
+                    continue
+                batch = self._take_pending()
+            self._write_batch(batch)
+            last_flush = monotonic()
+
+    def _write_batch(self, batch: deque[tuple[str, bool]]) -> None:
+        if not batch or self.full_log is None:
+            if batch:
+                # Nowhere to write yet, put them back ahead of any written
+                # since, still keeping only the newest
+                with self._condition:
+                    pending = len(batch) + len(self._pending)
+                    batch.extend(self._pending)
+                    self._pending = batch
+                    self.dropped_records += max(
+                        0, pending - self.max_pending_records
+                    )
+            return
+
+        full_lines = "".join(line + "\n" for line, _ in batch)
+        warning_lines = "".join(
+            line + "\n" for line, warning in batch if warning
+        )
+        with self._io_lock, self.write_time.time():
+            try:
+                if warning_lines:
+                    self._write(self.warning_log, warning_lines)
+                self._write(self.full_log, full_lines)
+            except OSError as e:
+                # Can't use logging from here as it would end up straight
+                # back in this sink
+                print(
+                    f"Failed to write notification log: {e}", file=sys.stderr
+                )
+
+    def _write(self, path: Path, text: str) -> None:
+        file = self._files.get(path)
+        if file is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            file = open(path, "a")
+            self._files[path] = file
+            if self.rotator is not None:
+                self._segment_starts[path] = self.rotator.segment_start(path)
+        file.write(text)
+        file.flush()
+
+        if self.rotator is not None and self.rotator.should_rotate(
+            path, file.tell(), self._segment_starts[path]
+        ):
+            file.close()
+            del self._files[path]
+            self.rotator.rotate(path)
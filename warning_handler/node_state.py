@@ -0,0 +1,135 @@
+# Standard imports
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Optional
+
+# Third-party imports
+
+
+# Local imports
+if TYPE_CHECKING:
+    from warning_handler.warning_handler import Notification
+
+
+class NodeState:
+    """
+    Warnings and errors currently held for a single node. Only the newest
+    max_notifications of each are kept but the totals count every one
+    received since the node was last acknowledged
+    """
+
+    def __init__(
+        self, node_name: str, mac_address: str, max_notifications: int
+    ):
+        self.node_name = node_name
+        self.mac_address = mac_address
+        self.warnings: deque["Notification"] = deque(maxlen=max_notifications)
+        self.errors: deque["Notification"] = deque(maxlen=max_notifications)
+        self.total_warnings: int = 0
+        self.total_errors: int = 0
+
+    def clear_warnings(self) -> None:
+        self.warnings.clear()
+        self.total_warnings = 0
+
+    def clear_errors(self) -> None:
+        self.errors.clear()
+        self.total_errors = 0
+
+
+class NodeNotificationStore:
+    """
+    As the primary timing reference is also the MQTT broker, it stores
+    warnings / errors generated by all nodes, not just itself. These are
+    kept per node (keyed by node name, with a MAC address lookup) in ring
+    buffers of max_per_node entries so checking whether a node has
+    warnings or errors is constant time and memory use is capped.
+
+    If max_age_s is non-zero, expire() drops notifications older than that
+    """
+
+    def __init__(self, max_per_node: int = 100, max_age_s: float = 0):
+        self.max_per_node = max_per_node
+        self.max_age_s = max_age_s
+        self.nodes: dict[str, NodeState] = {}
+        self.nodes_by_mac: dict[str, NodeState] = {}
+
+    def _node(self, notification: "Notification") -> NodeState:
+        state = self.nodes.get(notification.node_name)
+        if state is None:
+            state = NodeState(
+                notification.node_name,
+                notification.mac_address,
+                self.max_per_node,
+            )
+            self.nodes[notification.node_name] = state
+        # Keep MAC lookup current in case a node has been renamed or moved
+        state.mac_address = notification.mac_address
+        self.nodes_by_mac[notification.mac_address] = state
+        return state
+
+    def add_warning(self, notification: "Notification") -> None:
+        state = self._node(notification)
+        state.warnings.append(notification)
+        state.total_warnings += notification.count
+
+    def add_error(self, notification: "Notification") -> None:
+        state = self._node(notification)
+        state.errors.append(notification)
+        state.total_errors += notification.count
+
+    def get(
+        self,
+        node_name: Optional[str] = None,
+        mac_address: Optional[str] = None,
+    ) -> Optional[NodeState]:
+        if node_name is not None:
+            return self.nodes.get(node_name)
+        return self.nodes_by_mac.get(mac_address)
+
+    def has_warnings(self, node_name: str) -> bool:
+        state = self.nodes.get(node_name)
+        return state is not None and len(state.warnings) > 0
+
+    def has_errors(self, node_name: str) -> bool:
+        state = self.nodes.get(node_name)
+        return state is not None and len(state.errors) > 0
+
+    def acknowledge(
+        self,
+        node_name: Optional[str] = None,
+        mac_address: Optional[str] = None,
+    ) -> None:
+        """
+        Clears warnings and errors for a node
+        """
+        state = self.get(node_name, mac_address)
+        if state is not None:
+            state.clear_warnings()
+            state.clear_errors()
+
+    def clear_warnings(self) -> None:
+        for state in self.nodes.values():
+            state.clear_warnings()
+
+    def clear_errors(self) -> None:
+        for state in self.nodes.values():
+            state.clear_errors()
+
+    def expire(self, now: Optional[datetime] = None) -> None:
+        """
+        Drops notifications older than max_age_s. Notifications are added
+        in time order so only the oldest end of each buffer is checked
+        """
+        if not self.max_age_s:
+            return
+        if now is None:
+            now = datetime.now(tz=timezone.utc)
+        cutoff = now - timedelta(seconds=self.max_age_s)
+        for state in self.nodes.values():
+            for notifications in (state.warnings, state.errors):
+                while (
+                    notifications
+                    and notifications[0].creation_time < cutoff
+                ):
+                    notifications.popleft()
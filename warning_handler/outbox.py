@@ -0,0 +1,159 @@
+# Standard imports
+from collections import deque
+from pathlib import Path
+from threading import RLock
+from time import monotonic
+from typing import Callable, Optional, TextIO
+import json
+import sys
+
+# Third-party imports
+
+
+# Local imports
+
+
+class Outbox:
+    """
+    Persistent store-and-forward queue for MQTT broadcasts made while the
+    broker is unreachable.
+
+    Messages are appended to a JSONL file alongside the logs with the byte
+    offset of the first unsent message kept in a separate cursor file, so
+    anything not sent before a restart is sent after it. replay() sends
+    queued messages in batches of at most batch_size, limited to
+    max_rate_per_s on average so reconnecting doesn't flood the broker.
+    Once everything has been sent the file is emptied.
+
+    Before open() is called messages are only held in memory.
+
+    append() can be called from any thread that logs (e.g. paho's), so
+    everything that touches the queue or the files holds a lock.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 20,
+        max_rate_per_s: float = 50,
+        max_records: int = 10000,
+    ):
+        self.batch_size = batch_size
+        self.max_rate_per_s = max_rate_per_s
+        self.max_records = max_records
+        self.path: Optional[Path] = None
+        self.dropped_records: int = 0
+        # (topic, payload, length of line in file)
+        self._pending: deque[tuple[str, str, int]] = deque()
+        self._file: Optional[TextIO] = None
+        self._cursor: int = 0
+        self._tokens: float = batch_size
+        self._last_replay: float = monotonic()
+        self._lock = RLock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def cursor_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".cursor")
+
+    def open(self, path: Path) -> None:
+        """
+        Loads anything left unsent from a previous run and starts
+        persisting messages to path
+        """
+        with self._lock:
+            self.path = path
+            held_in_memory = list(self._pending)
+            self._pending.clear()
+            try:
+                self._cursor = int(self.cursor_path.read_text())
+            except (OSError, ValueError):
+                self._cursor = 0
+
+            if path.exists():
+                with open(path, "rb") as file:
+                    file.seek(self._cursor)
+                    for line in file:
+                        if not line.endswith(b"\n"):
+                            # Partly written when we last stopped
+                            break
+                        try:
+                            message = json.loads(line)
+                            self._queue(
+                                message["topic"], message["payload"], len(line)
+                            )
+                        except (json.JSONDecodeError, KeyError):
+                            self._cursor += len(line)
+            self._file = open(path, "a")
+            for topic, payload, _ in held_in_memory:
+                self.append(topic, payload)
+
+    def append(self, topic: str, payload: str) -> None:
+        line = json.dumps({"topic": topic, "payload": payload}) + "\n"
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.write(line)
+                    self._file.flush()
+                except OSError as e:
+                    print(f"Failed to write outbox: {e}", file=sys.stderr)
+            self._queue(topic, payload, len(line.encode("utf-8")))
+
+    def replay(self, publish: Callable[[str, str], bool]) -> int:
+        """
+        Sends the next batch of queued messages with publish, subject to
+        the rate limit. publish returns False if the message wasn't sent,
+        which leaves it queued and stops the batch. Returns the number
+        sent
+        """
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self.batch_size,
+                self._tokens
+                + (now - self._last_replay) * self.max_rate_per_s,
+            )
+            self._last_replay = now
+
+            sent = 0
+            while self._pending and self._tokens >= 1:
+                topic, payload, length = self._pending[0]
+                if not publish(topic, payload):
+                    break
+                self._pending.popleft()
+                self._cursor += length
+                self._tokens -= 1
+                sent += 1
+            if sent:
+                self._save_cursor()
+            return sent
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _queue(self, topic: str, payload: str, length: int) -> None:
+        # Must hold self._lock
+        if len(self._pending) >= self.max_records:
+            # Been disconnected for a long time, lose the oldest
+            _, _, dropped_length = self._pending.popleft()
+            self._cursor += dropped_length
+            self.dropped_records += 1
+        self._pending.append((topic, payload, length))
+
+    def _save_cursor(self) -> None:
+        # Must hold self._lock
+        if self.path is None:
+            return
+        try:
+            if not self._pending and self._file is not None:
+                # Everything sent so start again with an empty file
+                self._file.truncate(0)
+                self._file.seek(0)
+                self._cursor = 0
+            self.cursor_path.write_text(str(self._cursor))
+        except OSError as e:
+            print(f"Failed to update outbox: {e}", file=sys.stderr)
@@ -0,0 +1,147 @@
+# Standard imports
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from threading import Lock
+from time import monotonic
+from typing import Callable, Optional
+
+# Third-party imports
+
+
+# Local imports
+
+
+@dataclass
+class Repeats:
+    """
+    Copies of a notification suppressed during one window
+    """
+
+    level: str
+    mac_address: str
+    node_name: str
+    category: str
+    message: str
+    # Whether the summary should be broadcast i.e. it came from this node
+    broadcast: bool
+    window_end: float
+    count: int = 0
+    first_time: Optional[datetime] = None
+    last_time: Optional[datetime] = None
+
+
+class StormFilter:
+    """
+    Stops a flapping fault flooding the logs, memory and broker with
+    copies of the same warning / error.
+
+    The first notification for each (level, node, category, message)
+    is let through and starts a window of window_s. Repeats during the
+    window are only counted, and once it ends expired() returns them so
+    they can be stored and sent as a single summary with the count and
+    times of the first and last repeat. The next copy after that is let
+    through and starts a new window, so a continuous storm produces at
+    most two records per window_s.
+
+    At most max_keys windows are open at once, beyond that the oldest is
+    closed early. A window_s of 0 lets everything through.
+
+    admit() is called from whichever thread logged the notification, so
+    everything is done holding a lock
+    """
+
+    def __init__(
+        self,
+        window_s: float = 10,
+        max_keys: int = 1000,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.window_s = window_s
+        self.max_keys = max_keys
+        self.clock = clock
+        self.suppressed: int = 0
+        # Insertion order is window order as every window is as long
+        self._windows: dict[tuple[str, str, str, str], Repeats] = {}
+        # Closed windows with repeats waiting to be summarised
+        self._closed: list[Repeats] = []
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def admit(
+        self,
+        level: str,
+        mac_address: str,
+        node_name: str,
+        category: str,
+        message: str,
+        broadcast: bool,
+    ) -> bool:
+        """
+        Returns True if the notification should be handled as normal or
+        False if it's a repeat that's been counted instead
+        """
+        if not self.window_s:
+            return True
+        now = self.clock()
+        key = (level, mac_address, category, message)
+        with self._lock:
+            repeats = self._windows.get(key)
+            if repeats is not None and repeats.window_end <= now:
+                # Window ended but expired() hasn't been called since
+                self._close(key)
+                repeats = None
+            if repeats is None:
+                if len(self._windows) >= self.max_keys:
+                    self._close(next(iter(self._windows)))
+                self._windows[key] = Repeats(
+                    level,
+                    mac_address,
+                    node_name,
+                    category,
+                    message,
+                    broadcast,
+                    window_end=now + self.window_s,
+                )
+                return True
+
+            time = datetime.now(tz=timezone.utc)
+            if repeats.first_time is None:
+                repeats.first_time = time
+            repeats.last_time = time
+            repeats.count += 1
+            self.suppressed += 1
+            return False
+
+    def _close(self, key: tuple[str, str, str, str]) -> None:
+        # Must hold self._lock
+        repeats = self._windows.pop(key, None)
+        if repeats is not None and repeats.count:
+            self._closed.append(repeats)
+
+    def expired(self) -> list[Repeats]:
+        """
+        Closes windows that have ended and returns those that had any
+        repeats. Meant to be called regularly from the main loop
+        """
+        now = self.clock()
+        with self._lock:
+            while self._windows:
+                key, repeats = next(iter(self._windows.items()))
+                if repeats.window_end > now:
+                    break
+                self._close(key)
+            closed, self._closed = self._closed, []
+        return closed
+
+    def drain(self) -> list[Repeats]:
+        """
+        Closes every window, e.g. on shutdown, and returns those that
+        had any repeats
+        """
+        with self._lock:
+            while self._windows:
+                self._close(next(iter(self._windows)))
+            closed, self._closed = self._closed, []
+        return closed
@@ -6,8 +6,7 @@ import json
 from logging import Handler, LogRecord, ERROR, WARNING
 from queue import Queue
 import logging
-from time import sleep
-from pathlib import Path
+from time import monotonic
 
 # Third-party imports
 
@@ -15,87 +14,225 @@ from pathlib import Path
 # Local imports
 from m0wut_drivers.gpio import GPIO
 from m0wut_drivers.linux_cpu import get_mac_address
+from metrics.metrics import REGISTRY
+import config
 from config import (
-    GPIO_STATUS_GREEN,
-    GPIO_STATUS_RED,
     MQTT_BROKER_IP_ADDRESS,
     MQTT_BROKER_PORT,
+    MQTT_ADVERTISE_IP_ADDRESS,
+    MQTT_TICK_MAX_MESSAGES,
+    MQTT_TICK_TIME_BUDGET_S,
     NODE_NAME,
     LOG_FOLDER_NAME,
     LOG_FULL_NAME,
     LOG_WARNING_NAME,
+    LOG_FLUSH_INTERVAL_S,
+    LOG_FLUSH_MAX_RECORDS,
+    LOG_ECHO_RELAYED,
+    LOG_ROTATE_MAX_BYTES,
+    LOG_ROTATE_MAX_AGE_S,
+    LOG_RETENTION_SEGMENTS,
+    NOTIFICATION_RETENTION_PER_NODE,
+    NOTIFICATION_MAX_AGE_S,
+    NOTIFICATION_STORM_WINDOW_S,
+    NOTIFICATION_STORM_MAX_KEYS,
+    MQTT_RETRY_INTERVAL_S,
+    OUTBOX_NAME,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_MAX_RATE_PER_S,
+    OUTBOX_MAX_RECORDS,
 )
+from warning_handler.log_sink import LogSink
+from warning_handler.log_rotation import LogRotator, select_log_folder
+from warning_handler.node_state import NodeNotificationStore
+from warning_handler.outbox import Outbox
+from warning_handler.storm_filter import Repeats, StormFilter
 from mqtt.mqtt_handler import MqttHandler, BrokerConnectionError
 from paho.mqtt.client import MQTTMessage
 
 
+# LogRecord attribute (set with extra=) marking the stdout echo of a
+# notification relayed from another node. It's already been stored so
+# emit() ignores it
+RELAYED_NOTIFICATION = "relayed_notification"
+RELAYED_FIELDS = ("mac_address", "node_name", "category", "message")
+# Only in summaries of repeated notifications, see StormFilter
+SUMMARY_FIELDS = ("count", "first_time", "last_time")
+# LogRecord attribute (set with extra=) for notifications that are only
+# stored, not broadcast. Telling the broker it can't be reached, once it
+# can, is just noise
+LOCAL_ONLY = "local_only"
+
+
 class Notification:
+    """
+    Slots keep every warning / error held in memory small, and the JSON
+    is built once however many times it's written or sent.
+
+    A summary of repeats stands for count copies, sent between first_time
+    and last_time
+    """
+
+    __slots__ = (
+        "mac_address",
+        "node_name",
+        "category",
+        "message",
+        "creation_time",
+        "count",
+        "first_time",
+        "last_time",
+        "_json",
+    )
+    level: str = "info"
+
     def __init__(
         self,
         mac_address: str,
         node_name: str,
         category: str,
         message: str,
-        full_log_file: Path,
-        warning_log_file: Path,
+        count: int = 1,
+        first_time: Optional[str] = None,
+        last_time: Optional[str] = None,
     ):
         self.mac_address = mac_address
         self.node_name = node_name
         self.category = category
         self.message = message
         self.creation_time: datetime = datetime.now(tz=timezone.utc)
-        self.datetime_strf_string: str = "%Y-%m-%dT%H:%M:%S%z"
-        if isinstance(self, (Warning, Error)):
-            with open(warning_log_file, "a+") as file:
-                file.write(str(self) + "\n")
-
-        with open(full_log_file, "a+") as file:
-            file.write(str(self) + "\n")
-
-    def __str__(self) -> str:
-        return json.dumps(
-            {
+        self.count = count
+        self.first_time = first_time
+        self.last_time = last_time
+        self._json: Optional[str] = None
+
+    def to_json(self) -> str:
+        if self._json is None:
+            x = {
                 "mac_address": self.mac_address,
                 "node_name": self.node_name,
                 "category": self.category,
                 "message": self.message,
                 "time": self.creation_time.isoformat(timespec="milliseconds"),
+                "level": self.level,
             }
-        )
+            if self.first_time is not None:
+                x["count"] = self.count
+                x["first_time"] = self.first_time
+                x["last_time"] = self.last_time
+            self._json = json.dumps(x)
+        return self._json
+
+    def __str__(self) -> str:
+        return self.to_json()
 
 
 class Info(Notification):
-    pass
+    __slots__ = ()
+    level = "info"
 
 
 class Warning(Notification):
-    pass
+    __slots__ = ()
+    level = "warning"
 
 
 class Error(Notification):
-    pass
+    __slots__ = ()
+    level = "error"
 
 
 class WarningHandler(Handler):
     def __init__(
         self,
-        green_led: GPIO = GPIO_STATUS_GREEN,
-        red_led: GPIO = GPIO_STATUS_RED,
+        green_led: Optional[GPIO] = None,
+        red_led: Optional[GPIO] = None,
         blink_period_s: float = 1,
+        broker_ip_address: str = MQTT_BROKER_IP_ADDRESS,
+        broker_port: int = MQTT_BROKER_PORT,
+        log_folder_name: str = LOG_FOLDER_NAME,
     ):
+        """
+        The LEDs default to the status LEDs in config, which aren't
+        created until initialise() so setting up logging doesn't touch
+        hardware. The broker and log folder can be given (e.g. in the
+        logging config) to run against something other than config
+        """
         super().__init__()
+        self.broker_ip_address = broker_ip_address
+        self.broker_port = broker_port
+        self.log_folder_name = log_folder_name
         self.node_name = NODE_NAME
         self.mac_address = get_mac_address()
-        self.warnings: list[Warning] = []
-        self.errors: list[Error] = []
+        self.notifications = NodeNotificationStore(
+            max_per_node=NOTIFICATION_RETENTION_PER_NODE,
+            max_age_s=NOTIFICATION_MAX_AGE_S,
+        )
         self.green_led = green_led
         self.red_led = red_led
-        self.last_blink_time: datetime = datetime.now()
+        self.last_blink_time: float = monotonic()
         self.blink_period_s = blink_period_s
         self.led_state: bool = False
         self.mqtt: Optional[MqttHandler] = None
+        self.next_mqtt_attempt: float = 0
+        self.mqtt_ever_connected: bool = False
+        # Called from the MQTT thread whenever a message is received e.g.
+        # to wake up whatever calls tick_mqtt()
+        self.on_mqtt_message: Optional[Callable[[], None]] = None
+        # Added to this node's /status/discovery messages e.g. its role
+        self.discovery_info: dict = {}
+        # Print notifications from other nodes through logging (e.g. to
+        # stdout) as well as storing them
+        self.echo_relayed: bool = LOG_ECHO_RELAYED
+        # Called with every /status/discovery message received
+        self.discovery_listeners: list[Callable[[dict], None]] = []
         self.logger: Optional[logging.Logger] = None
         self.initialised: bool = False
+        # Log files aren't known until initialise() but the sink will hold
+        # anything logged before then
+        self.log_sink = LogSink(
+            flush_interval_s=LOG_FLUSH_INTERVAL_S,
+            flush_max_records=LOG_FLUSH_MAX_RECORDS,
+            rotator=LogRotator(
+                max_bytes=LOG_ROTATE_MAX_BYTES,
+                max_age_s=LOG_ROTATE_MAX_AGE_S,
+                retention_segments=LOG_RETENTION_SEGMENTS,
+            ),
+        )
+        # Broadcasts made while the broker is unreachable
+        self.outbox = Outbox(
+            batch_size=OUTBOX_BATCH_SIZE,
+            max_rate_per_s=OUTBOX_MAX_RATE_PER_S,
+            max_records=OUTBOX_MAX_RECORDS,
+        )
+        REGISTRY.gauge(
+            "outbox_depth",
+            "Broadcasts waiting for the broker",
+            func=lambda: len(self.outbox),
+        )
+        # (level, relayed from another node) -> counter
+        self.notification_metrics = {
+            (level, relayed): REGISTRY.counter(
+                "notifications_total",
+                "Notifications handled",
+                {"level": level, "origin": "relayed" if relayed else "local"},
+            )
+            for level in ("info", "warning", "error")
+            for relayed in (False, True)
+        }
+        # Repeated warnings / errors are counted then sent as one summary
+        self.storms = StormFilter(
+            window_s=NOTIFICATION_STORM_WINDOW_S,
+            max_keys=NOTIFICATION_STORM_MAX_KEYS,
+        )
+        self.suppressed_metrics = {
+            level: REGISTRY.counter(
+                "notifications_suppressed_total",
+                "Repeated notifications folded into a summary",
+                {"level": level},
+            )
+            for level in ("warning", "error")
+        }
 
     def initialise(self):
         """
@@ -107,64 +244,70 @@ class WarningHandler(Handler):
         # Setup logger
         self.logger = logging.getLogger(__name__)
 
-        # Try to save logs on SSD to save wear on eMMC but it might not be there
-        ssd_path = Path("/") / "mnt" / "media" / "nvme"
-        if ssd_path.exists():
-            log_folder = ssd_path / LOG_FOLDER_NAME
-        else:
-            log_folder = Path(LOG_FOLDER_NAME)
+        if self.green_led is None:
+            self.green_led = config.GPIO_STATUS_GREEN
+        if self.red_led is None:
+            self.red_led = config.GPIO_STATUS_RED
 
         # Make files / folders
-        log_folder.parent.mkdir(parents=True, exist_ok=True)
+        log_folder = select_log_folder(self.log_folder_name)
+        log_folder.mkdir(parents=True, exist_ok=True)
         self.warning_log = log_folder / LOG_WARNING_NAME
         self.full_log = log_folder / LOG_FULL_NAME
+        self.log_sink.open(self.full_log, self.warning_log)
+        self.outbox.open(log_folder / OUTBOX_NAME)
 
-        while self.mqtt is None:
-            try:
-                self.mqtt = MqttHandler(
-                    MQTT_BROKER_IP_ADDRESS, MQTT_BROKER_PORT, NODE_NAME
-                )
-                self.logger.debug("Waiting to connect to MQTT broker")
-                while not self.mqtt.mqtt_connected:
-                    sleep(0.1)
-            except BrokerConnectionError:
-                self.red_led.write(1)
-                self.logger.error(
-                    f"Failed to connect to broker at {MQTT_BROKER_IP_ADDRESS}:{MQTT_BROKER_PORT}",
-                )
-                sleep(5)
-        self._clear_errors()
-        self.red_led.write(0)
-
-        # Setup callback functions
-        self.mqtt.register_callback("/status/warnings", self.rx_warnings)
-        self.mqtt.register_callback("/status/errors", self.rx_errors)
+        # Doesn't wait for the broker, if it's not there tick() will keep
+        # trying and anything broadcast in the meantime goes in the outbox
+        self._connect_mqtt()
 
         self.initialised = True
 
+    def _connect_mqtt(self):
+        try:
+            self.mqtt = MqttHandler(
+                self.broker_ip_address,
+                self.broker_port,
+                NODE_NAME,
+                tick_max_messages=MQTT_TICK_MAX_MESSAGES,
+                tick_time_budget_s=MQTT_TICK_TIME_BUDGET_S,
+                on_message_queued=self.on_mqtt_message,
+                discovery_info=self.discovery_info,
+                advertise_ip_address=MQTT_ADVERTISE_IP_ADDRESS,
+            )
+        except BrokerConnectionError:
+            self.red_led.write(1)
+            self.logger.error(
+                "Failed to connect to broker at "
+                f"{self.broker_ip_address}:{self.broker_port}",
+                extra={LOCAL_ONLY: True},
+            )
+            self.next_mqtt_attempt = monotonic() + MQTT_RETRY_INTERVAL_S
+            return
+
+        # Setup callback functions. These are subscribed once connected
+        self.mqtt.register_callback("/status/warnings", self.rx_warnings)
+        self.mqtt.register_callback("/status/errors", self.rx_errors)
+        self.mqtt.register_callback(
+            "/status/acknowledge", self.rx_acknowledge
+        )
+        self.mqtt.register_callback("/status/discovery", self.rx_discovery)
+
     def emit(self, record: LogRecord):
         """
         This must be called "emit". This is the handler called automatically
         by the logging config any time any module uses the root logger
         """
 
-        # Message will be JSON format if received from another node
-        # If not, assume it's a string from this node
-        msg = record.getMessage()
-        try:
-            message_dict = json.loads(msg)
-
-            mac_address = message_dict["mac_address"]
-            node_name = message_dict["node_name"]
-            category = message_dict["category"]
-            message = message_dict["message"]
-            broadcast = False
-        except json.JSONDecodeError:
-            mac_address = self.mac_address
-            node_name = self.node_name
-            category = record.name
-            message = msg
-            broadcast = True
+        if getattr(record, RELAYED_NOTIFICATION, None) is not None:
+            # Echo of a notification from another node, see _relay()
+            return
+
+        mac_address = self.mac_address
+        node_name = self.node_name
+        category = record.name
+        message = record.getMessage()
+        broadcast = not getattr(record, LOCAL_ONLY, False)
 
         # Save to right place
 
@@ -200,18 +343,37 @@ class WarningHandler(Handler):
         category: str,
         message: str,
         broadcast: bool = True,
-    ):
+        count: int = 1,
+        first_time: Optional[str] = None,
+        last_time: Optional[str] = None,
+    ) -> bool:
+        """
+        Returns False if held back as a repeat by self.storms. Summaries
+        (which have a first_time) are always handled
+        """
+        if first_time is None and not self.storms.admit(
+            "error", mac_address, node_name, category, message, broadcast
+        ):
+            self.suppressed_metrics["error"].inc()
+            return False
+        self.notification_metrics[
+            "error", mac_address != self.mac_address
+        ].inc()
         x = Error(
             mac_address,
             node_name,
             category,
             message,
-            self.full_log,
-            self.warning_log,
+            count,
+            first_time,
+            last_time,
         )
-        self.errors.append(x)
-        if broadcast and self.mqtt is not None:
-            self.mqtt.publish("/status/errors", str(x))
+        line = x.to_json()
+        self.log_sink.write(line, warning=True, urgent=True)
+        self.notifications.add_error(x)
+        if broadcast:
+            self.publish("/status/errors", line)
+        return True
 
     def add_warning(
         self,
@@ -220,18 +382,36 @@ class WarningHandler(Handler):
         category: str,
         message: str,
         broadcast: bool = True,
-    ):
+        count: int = 1,
+        first_time: Optional[str] = None,
+        last_time: Optional[str] = None,
+    ) -> bool:
+        """
+        See add_error()
+        """
+        if first_time is None and not self.storms.admit(
+            "warning", mac_address, node_name, category, message, broadcast
+        ):
+            self.suppressed_metrics["warning"].inc()
+            return False
+        self.notification_metrics[
+            "warning", mac_address != self.mac_address
+        ].inc()
         x = Warning(
             mac_address,
             node_name,
             category,
             message,
-            self.full_log,
-            self.warning_log,
+            count,
+            first_time,
+            last_time,
         )
-        self.warnings.append(x)
-        if broadcast and self.mqtt is not None:
-            self.mqtt.publish("/status/warnings", str(x))
+        line = x.to_json()
+        self.log_sink.write(line, warning=True)
+        self.notifications.add_warning(x)
+        if broadcast:
+            self.publish("/status/warnings", line)
+        return True
 
     def add_info(
         self,
@@ -241,69 +421,242 @@ class WarningHandler(Handler):
         message: str,
         broadcast: bool = True,
     ):
-        if broadcast and self.mqtt is not None:
+        self.notification_metrics[
+            "info", mac_address != self.mac_address
+        ].inc()
+        if broadcast:
             # Don't bother storing info in running code - just useful for debug / logging
-            x = Info(
-                mac_address,
-                node_name,
-                category,
-                message,
-                self.full_log,
-                self.warning_log,
+            x = Info(mac_address, node_name, category, message)
+            line = x.to_json()
+            self.log_sink.write(line)
+            self.publish("/status/info", line)
+
+    def publish_telemetry(self, name: str, values: dict) -> None:
+        """
+        Publishes telemetry on /telemetry/<MAC address>/<name>. Unlike
+        notifications, telemetry is only useful live so is dropped rather
+        than stored while disconnected
+        """
+        if self.mqtt is None or not self.mqtt.mqtt_connected:
+            return
+        self.mqtt.publish(
+            f"/telemetry/{self.mac_address}/{name}",
+            json.dumps(
+                {
+                    "mac_address": self.mac_address,
+                    "node_name": self.node_name,
+                    "time": datetime.now(tz=timezone.utc).isoformat(
+                        timespec="milliseconds"
+                    ),
+                    **values,
+                }
+            ),
+        )
+
+    def publish(self, topic: str, payload: str) -> None:
+        """
+        Publishes over MQTT if connected, otherwise stores it in the
+        outbox to be sent once we are. Once anything is in the outbox,
+        everything goes through it so messages stay in order
+        """
+        if (
+            self.mqtt is None
+            or len(self.outbox)
+            or not self.mqtt.publish(topic, payload)
+        ):
+            self.outbox.append(topic, payload)
+
+    def flush(self):
+        self.log_sink.flush()
+
+    def summarise_repeats(self, repeats: list[Repeats]) -> None:
+        """
+        Stores (and broadcasts if they're from this node) a summary for
+        each window of repeated notifications
+        """
+        for x in repeats:
+            add = self.add_error if x.level == "error" else self.add_warning
+            add(
+                x.mac_address,
+                x.node_name,
+                x.category,
+                x.message,
+                broadcast=x.broadcast,
+                count=x.count,
+                first_time=x.first_time.isoformat(timespec="milliseconds"),
+                last_time=x.last_time.isoformat(timespec="milliseconds"),
             )
-            self.mqtt.publish("/status/info", str(x))
+
+    def close(self):
+        """
+        Called by logging.shutdown(), makes sure nothing is left unwritten
+        """
+        with self.lock:
+            self.summarise_repeats(self.storms.drain())
+        self.log_sink.close()
+        self.outbox.close()
+        super().close()
+
+    def acknowledge(
+        self,
+        node_name: Optional[str] = None,
+        mac_address: Optional[str] = None,
+    ) -> None:
+        """
+        Clears stored warnings and errors for a single node
+        """
+        self.notifications.acknowledge(node_name, mac_address)
 
     def _clear_warnings(self):
-        self.warnings = []
+        self.notifications.clear_warnings()
 
     def _clear_errors(self):
-        self.errors = []
+        self.notifications.clear_errors()
 
     def _has_warnings(self) -> bool:
         """
         As the primary timing reference is also the MQTT broker, it shall store warnings / errors
         generated by all nodes, not just itself.
-        Returns True if this node has errors
+        Returns True if this node has warnings
         """
-        current_node_warnings = [
-            x for x in self.warnings if x.node_name == self.node_name
-        ]
-        return bool(len(current_node_warnings) > 0)
+        return self.notifications.has_warnings(self.node_name)
 
     def _has_errors(self) -> bool:
         """
         Returns True if this node has errors
         """
-        current_node_errors = [
-            x for x in self.errors if x.node_name == self.node_name
-        ]
-        return bool(len(current_node_errors) > 0)
+        return self.notifications.has_errors(self.node_name)
+
+    def _relay(self, message_dict: dict[str, str], level: int) -> None:
+        """
+        Stores a notification received from another node straight away,
+        without going back through logging. It's never broadcast again,
+        and our own broadcasts coming back from the broker are ignored
+        as they were stored when logged.
+
+        Runs on the main thread so takes the handler's lock, which emit()
+        holds when called from other threads
+        """
+        # A KeyError for an incomplete message is reported by MqttHandler
+        notification = {x: message_dict[x] for x in RELAYED_FIELDS}
+        notification.update(
+            (x, message_dict[x]) for x in SUMMARY_FIELDS if x in message_dict
+        )
+        if notification["mac_address"] == self.mac_address:
+            return
+        with self.lock:
+            if level >= ERROR:
+                handled = self.add_error(**notification, broadcast=False)
+            else:
+                handled = self.add_warning(**notification, broadcast=False)
+        if self.echo_relayed and handled:
+            self.logger.log(
+                level,
+                "[%s] %s",
+                notification["node_name"],
+                notification["message"],
+                extra={RELAYED_NOTIFICATION: notification},
+            )
 
     def rx_warnings(self, message_dict: dict[str, str]) -> None:
         """
-        Handles the logging of warnings received from other nodes
+        Handles warnings received from other nodes
         """
-        self.logger.warning(json.dumps(message_dict))
+        self._relay(message_dict, WARNING)
 
     def rx_errors(self, message_dict: dict[str, str]) -> None:
         """
-        Handles the logging of errors received from other nodes
+        Handles errors received from other nodes
         """
-        self.logger.error(json.dumps(message_dict))
+        self._relay(message_dict, ERROR)
+
+    def rx_acknowledge(self, message_dict: dict[str, str]) -> None:
+        """
+        Handles a request to clear a node's warnings / errors. Message
+        should contain at least one of node_name or mac_address
+        """
+        self.acknowledge(
+            node_name=message_dict.get("node_name"),
+            mac_address=message_dict.get("mac_address"),
+        )
+        self.logger.info(f"Notifications acknowledged: {message_dict}")
+
+    def set_discovery_info(self, **fields) -> None:
+        """
+        Adds fields to this node's /status/discovery messages, announcing
+        again if already connected
+        """
+        self.discovery_info.update(fields)
+        if self.mqtt is not None and self.mqtt.mqtt_connected:
+            self.mqtt.announce()
+
+    def add_discovery_listener(self, func: Callable[[dict], None]) -> None:
+        self.discovery_listeners.append(func)
+
+    def rx_discovery(self, message_dict: dict) -> None:
+        """
+        Discovery messages aren't retained, so the primary announces
+        itself again whenever another node connects, so that node can
+        find it
+        """
+        if (
+            self.discovery_info.get("role") == "primary"
+            and message_dict.get("status") == "connected"
+            and message_dict.get("mac_address") != self.mac_address
+            and self.mqtt is not None
+        ):
+            self.mqtt.announce()
+        for func in self.discovery_listeners:
+            func(message_dict)
 
     def tick(self):
+        self.tick_mqtt()
+        self.tick_leds()
+
+    def tick_mqtt(self):
+        """
+        Connects to the broker if we aren't, sends anything in the outbox
+        and handles received messages. Anything emit() also touches is
+        done holding the handler's lock as emit() can run on other threads
+        """
         if not self.initialised:
             self.initialise()
-        x = datetime.now()
-        self.mqtt.tick()
-        if (
-            x - self.last_blink_time
-        ).total_seconds() > 0.5 * self.blink_period_s:
+        with self.lock:
+            self.summarise_repeats(self.storms.expired())
+        if self.mqtt is None:
+            if monotonic() >= self.next_mqtt_attempt:
+                self._connect_mqtt()
+        else:
+            if self.mqtt.mqtt_connected:
+                with self.lock:
+                    if not self.mqtt_ever_connected:
+                        # Forget errors from failing to connect at startup
+                        self.mqtt_ever_connected = True
+                        self._clear_errors()
+                    if len(self.outbox):
+                        self.outbox.replay(self.mqtt.publish)
+            self.mqtt.tick()
+
+    def tick_leds(self):
+        """
+        Updates the status LED. Should be called every half
+        blink_period_s, e.g. by the scheduler. Calls can be up to a fifth
+        of that early, from scheduling jitter, and still toggle the LED
+        """
+        if not self.initialised:
+            self.initialise()
+        x = monotonic()
+        if x - self.last_blink_time >= 0.4 * self.blink_period_s:
             # Toggle virtual LED
             self.led_state = not self.led_state
             self.last_blink_time = x
+            self.notifications.expire()
             # LED configuration is a combined Red / Green (i.e. can be combined to make orange)
-            if self._has_errors() or not self.mqtt.mqtt_connected:
+            if (
+                self._has_errors()
+                or self.mqtt is None
+                or not self.mqtt.mqtt_connected
+            ):
                 # Blink red
                 self.green_led.write(0)
                 self.red_led.write(self.led_state)